@@ -1,2 +1,8 @@
 
+from zoneinfo import ZoneInfo
+
+
 PAPER_INFO_SPLIT_LINE = r"%% PAPER INFO SPLIT LINE %%"
+
+# arXiv announces the papers, and dates their updates, in US/Eastern.
+ANNOUNCEMENT_TIMEZONE = ZoneInfo("America/New_York")
@@ -1,6 +1,7 @@
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
+from typing import Iterator
 
 
 @dataclass
@@ -20,6 +21,11 @@ class GlobalPluginData:
 
 
 class BasePlugin(ABC):
+    # A streamable plugin handles each result independently, so it can be fed
+    # page by page when an upstream plugin runs in stream mode.
+    streamable: bool = False
+    stream_mode: bool = False
+
     def __init__(self,
                  version: str = "",
                  dependencies: list[str] | None = None,
@@ -34,6 +40,19 @@ class BasePlugin(ABC):
     def __call__(self, results, global_plugin_data: GlobalPluginData):
         return self.process(results, global_plugin_data)
 
+    def stream(self,
+               results,
+               global_plugin_data: GlobalPluginData) -> Iterator[list]:
+        yield self.process(results, global_plugin_data)
+
+    def commit(self):
+        """
+        Called once all the plugins of the run have processed the results,
+        i.e., after they are saved. A plugin keeping the progress of its
+        source, e.g., a watermark, persists it here, so that the results of
+        a failed run are requested again by the next run.
+        """
+
 
 @dataclass
 class BaseKeywordsFilterData(BasePluginData):
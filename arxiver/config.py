@@ -27,6 +27,20 @@ class Configs:
     sleep_seconds: int = field(
         default=DEFAULT.get('sleep_seconds', 3),
         metadata={"help": "Sleep seconds until next request."})
+    polling_mode: str = field(
+        default=DEFAULT.get('polling_mode', ""),
+        metadata={
+            "help": (
+                "How to probe arXiv for the new announcement before running "
+                "the plugins. `query` requests one result of the query, "
+                "`feed` sends conditional requests to the announcement "
+                "feeds. If empty, all the plugins are run again when the "
+                "results are empty."
+            )
+        })
+    polling_max_sleep_seconds: int = field(
+        default=DEFAULT.get('polling_max_sleep_seconds', 3600),
+        metadata={"help": "Maximum sleep seconds between two probes."})
     output_directory: str = field(
         default=DEFAULT.get('output_directory', 'outputs'),
         metadata={"help": "Where to save the outputs."})
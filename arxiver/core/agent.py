@@ -1,22 +1,79 @@
 
 import os
+import copy
 import json
+import math
+import os.path as osp
+import asyncio
+import random
 import hashlib
-from time import sleep, time
-from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, AsyncExitStack
+from time import sleep, monotonic, time
+from email.utils import parsedate_to_datetime
+from dataclasses import dataclass, field
+from concurrent.futures import Future
+from typing import Iterator
 
 from tabulate import tabulate
-from openai import OpenAI
+from openai import (
+    OpenAI, AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError,
+    InternalServerError, RateLimitError
+)
+from openai.types import Batch
 from openai.types.chat.chat_completion import ChatCompletion
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk
 
+from arxiver.core.clients import (
+    ASYNC_CLIENTS, CLIENTS, EVENT_LOOP, MAX_CONCURRENCY
+)
+from arxiver.core.concurrency import (
+    CONCURRENCY_PATH, AdaptiveConcurrency, ConcurrencyStore
+)
+from arxiver.core.response_cache import ResponseCache, cache_key
+from arxiver.core.telemetry import TELEMETRY, CallRecord
 from arxiver.utils.logging import create_logger
-from arxiver.utils.io import load_jsonl, save_jsonl, load_json
+from arxiver.utils.io import load_json, save_json_atomic
+from arxiver.utils.misc import (
+    BATCH_RUNNING_STATUS, batch_task_success, wait_batch_task
+)
 
 
 logger = create_logger(__name__, auto_setup_fmt=True)
 
 
+CONFIG_PATH = __file__.replace("arxiver", "configs").replace(".py", ".json")
+
+
+class ConfigLoader:
+    """
+    Load the configs of the models, read again only once the file is
+    modified, so that the agents created by each plugin, and each retry of
+    the plugins, do not parse the file again.
+    """
+
+    def __init__(self, path: str = CONFIG_PATH):
+        self.path = path
+        self.mtime = 0.0
+        self.configs: dict = {}
+        self.lock = threading.Lock()
+
+    def get(self, model: str) -> dict:
+        """
+        Returns a copy of the config of `model`, empty if not found.
+        """
+        with self.lock:
+            mtime = osp.getmtime(self.path)
+            if mtime != self.mtime:
+                self.configs = load_json(self.path)
+                self.mtime = mtime
+            return copy.deepcopy(self.configs.get(model, {}))
+
+
+MODEL_CONFIGS = ConfigLoader()
+
+
 @dataclass
 class ModelConfig:
     base_url: str = ""
@@ -42,178 +99,1140 @@ class Message:
 
 @dataclass
 class History:
-    messages: list[Message] | None = None
+    """
+    A ring buffer of the latest `max_messages` messages, the oldest ones are
+    dropped beyond it. If `max_messages` is 0, the size is unlimited. It is
+    safe to append from several threads.
+    """
+    messages: deque[Message] | list[Message] | None = None
+    max_messages: int = 64
+    lock: threading.Lock = field(
+        default_factory=threading.Lock, repr=False, compare=False)
 
     def __post_init__(self):
-        if self.messages is None:
-            self.messages = []
+        self.messages = deque(
+            self.messages or [], maxlen=self.max_messages or None)
 
     def append(self, role: str, content: str):
-        if self.messages is None:
-            self.messages = []
-        self.messages.append(Message(role=role, content=content))
+        self.extend([Message(role=role, content=content)])
+
+    def extend(self, messages: list[Message]):
+        # The messages of an exchange are appended together, so that they
+        # are not interleaved with the messages of another thread.
+        with self.lock:
+            self.messages.extend(messages)  # type: ignore
 
     def tolist(self):
-        return [m.todict() for m in self.messages] if self.messages else []
+        with self.lock:
+            return [m.todict() for m in self.messages or []]
+
+    def __len__(self):
+        return len(self.messages or [])
+
+
+class SlidingWindowLimiter:
+    """
+    Limit the requests and the tokens sent in any sliding window of
+    `window` seconds. A limit of 0 means unlimited.
+
+    The tokens of a request are unknown before the response, so an estimate
+    is reserved by `acquire` and replaced by the real usage with `settle`.
+    """
+
+    def __init__(self,
+                 requests_per_minute: int = 0,
+                 tokens_per_minute: int = 0,
+                 window: float = 60):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = window
+        # Each event is a [timestamp, tokens] pair.
+        self.events: deque[list[float]] = deque()
+
+    def prune(self, now: float):
+        while self.events and self.events[0][0] + self.window <= now:
+            self.events.popleft()
+
+    def allows(self, tokens: int) -> bool:
+        if (
+                self.requests_per_minute
+                and len(self.events) >= self.requests_per_minute):
+            return False
+        if self.tokens_per_minute and self.events:
+            used = sum(event[1] for event in self.events)
+            return used + tokens <= self.tokens_per_minute
+        return True
+
+    def available(self, tokens: int = 0) -> bool:
+        self.prune(monotonic())
+        return self.allows(tokens)
+
+    async def acquire(self, tokens: int = 0) -> list[float]:
+        while True:
+            now = monotonic()
+            self.prune(now)
+            if self.allows(tokens):
+                event = [now, tokens]
+                self.events.append(event)
+                return event
+            # Settled events may free the window earlier than the oldest
+            # event expires, so check again at least every second.
+            to_sleep = self.events[0][0] + self.window - now
+            await asyncio.sleep(min(max(to_sleep, 0.01), 1.0))
+
+    def settle(self, event: list[float], tokens: int):
+        event[1] = tokens
+
+
+@dataclass
+class StreamMetrics:
+    time_to_first_token: float = 0
+    duration: float = 0
+    num_tokens: int = 0
+    stopped_early: bool = False
+
+    @property
+    def tokens_per_second(self) -> float:
+        generation = self.duration - self.time_to_first_token
+        return self.num_tokens / generation if generation > 0 else 0
+
+    def __str__(self) -> str:
+        return (
+            f"TTFT {self.time_to_first_token:.2f}s, "
+            f"{self.num_tokens} tokens in {self.duration:.2f}s "
+            f"({self.tokens_per_second:.1f} tokens/s)"
+            + (", stopped early" if self.stopped_early else "")
+        )
+
+
+class StreamAssembler:
+    """
+    Assemble the deltas of a streamed completion, and measure the time to
+    the first token and the tokens per second. Each delta is counted as one
+    token. The stream should be stopped once `feed` returns True, i.e., any
+    of `stop_markers` appears in the content.
+    """
+
+    def __init__(self, stop_markers: list[str] | None = None):
+        self.stop_markers = stop_markers or []
+        self.longest_marker = max(map(len, self.stop_markers), default=0)
+        self.start = monotonic()
+        self.parts: list[str] = []
+        self.tail = ""
+        self.metrics = StreamMetrics()
+
+    @property
+    def content(self) -> str:
+        return "".join(self.parts)
+
+    def feed(self, chunk: ChatCompletionChunk) -> bool:
+        self.metrics.duration = monotonic() - self.start
+        if not chunk.choices:
+            return False
+        delta = chunk.choices[0].delta
+        text = delta.content or ""
+        # Reasoning models stream the reasoning before the content.
+        reasoning = getattr(delta, "reasoning_content", None) or ""
+        if text or reasoning:
+            if self.metrics.num_tokens == 0:
+                self.metrics.time_to_first_token = self.metrics.duration
+            self.metrics.num_tokens += 1
+        if not text:
+            return False
+        self.parts.append(text)
+        # A marker may be split into several deltas.
+        window = self.tail + text
+        if any(marker in window for marker in self.stop_markers):
+            self.metrics.stopped_early = True
+            return True
+        if self.longest_marker:
+            self.tail = window[-self.longest_marker:]
+        return False
+
+
+class Hedger:
+    """
+    Decide when to send a duplicate of a slow request, i.e., a hedge.
+
+    A request is hedged once it is slower than the `percentile` of the
+    latency of the latest `window` successful requests, which is only known
+    after `min_samples` of them. At most `budget` of the requests are
+    hedged, e.g., 0.05 for 5% of extra requests.
+    """
+
+    def __init__(self,
+                 percentile: float,
+                 budget: float = 0.05,
+                 min_samples: int = 20,
+                 window: int = 200):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def observe(self, latency: float):
+        self.latencies.append(latency)
+
+    def delay(self) -> float | None:
+        """
+        Returns the seconds to wait before hedging a new request, or None if
+        it should not be hedged.
+        """
+        self.requests += 1
+        if len(self.latencies) < self.min_samples:
+            return None
+        if self.hedges + 1 > self.budget * self.requests:
+            return None
+        latencies = sorted(self.latencies)
+        index = int(len(latencies) * self.percentile / 100)
+        return latencies[min(index, len(latencies) - 1)]
+
+    def spend(self) -> bool:
+        # The budget may be spent by other requests while waiting.
+        if self.hedges + 1 > self.budget * self.requests:
+            return False
+        self.hedges += 1
+        return True
+
+
+@dataclass
+class CompletionProgress:
+    model: str
+    total: int
+    finished: int = 0
+    failed: int = 0
+    coalesced: int = 0
+    in_flight: int = 0
+    start: float = field(default_factory=monotonic)
+    stream_metrics: list[StreamMetrics] = field(default_factory=list)
+    hedger: Hedger | None = None
+
+    def table(self) -> str:
+        elapsed = monotonic() - self.start
+        header = [
+            "Model", "Finished", "Failed", "Coalesced", "In Flight", "Total",
+            "Elapsed (s)", "Requests per Minute"
+        ]
+        data = [
+            self.model, self.finished, self.failed, self.coalesced,
+            self.in_flight, self.total, f"{elapsed:.1f}",
+            f"{60 * self.finished / max(elapsed, 1e-6):.1f}"
+        ]
+        if self.stream_metrics:
+            metrics = self.stream_metrics
+            N = len(metrics)
+            header += ["Mean TTFT (s)", "Mean Tokens/s", "Stopped Early"]
+            data += [
+                f"{sum(m.time_to_first_token for m in metrics) / N:.2f}",
+                f"{sum(m.tokens_per_second for m in metrics) / N:.1f}",
+                sum(m.stopped_early for m in metrics),
+            ]
+        if self.hedger is not None:
+            header += ["Hedged", "Hedges Won"]
+            data += [self.hedger.hedges, self.hedger.wins]
+        return tabulate([data], headers=header, tablefmt="pretty")
+
+    async def report(self, interval: float = 30):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(f"\n{self.table()}")
+
+
+class SingleFlight:
+    """
+    Share one in-flight request between the concurrent calls of the same
+    request key, in all the threads and event loops of the process.
+    """
+
+    def __init__(self):
+        self.calls: dict[str, Future] = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+
+    def join(self, key: str) -> tuple[Future, bool]:
+        """
+        Returns the future of the call of `key`, and True if the caller
+        leads the call, i.e., should request it and then call `finish`.
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self.calls[key] = future
+            return future, True
+
+    def finish(self, key: str, content: str):
+        with self.lock:
+            future = self.calls.pop(key)
+        future.set_result(content)
+
+
+# The agents of the process share the in-flight requests, e.g., of two
+# pipelines translating the same paper.
+SINGLE_FLIGHT = SingleFlight()
+
+
+def estimate_tokens(text: str) -> int:
+    # A rough estimate, about 4 characters per token for English text.
+    return len(text) // 4 + 1
+
+
+def cached_prompt_tokens(usage) -> int:
+    """
+    Number of the prompt tokens served from the prompt cache of the
+    provider, reported as `prompt_tokens_details.cached_tokens` by OpenAI
+    and as `prompt_cache_hit_tokens` by DeepSeek.
+
+    Args:
+        usage: The usage of a response, or its dict in a batch output.
+    """
+    if not isinstance(usage, dict):
+        usage = usage.model_dump()
+    details = usage.get("prompt_tokens_details") or {}
+    return (
+        details.get("cached_tokens")
+        or usage.get("prompt_cache_hit_tokens")
+        or 0
+    )
 
 
 class Agent:
-    def __init__(self, model: str):
-        path = __file__.replace("arxiver", "configs").replace(".py", ".json")
-        configs = load_json(path)
+    """
+    Complete the messages with a model of `configs/core/agent.json`.
+
+    Args:
+        model: The name of the model in the configs.
+        stateless: If True, the exchanges are never recorded in the history,
+            which is meant for the bulk completion of independent messages.
+        max_history: Number of the latest messages kept in the history. If
+            0, the size is unlimited.
+    """
+
+    def __init__(self,
+                 model: str,
+                 stateless: bool = False,
+                 max_history: int = 64):
         self.model = model
-        self.config = ModelConfig(**configs.get(model, {}))
+        self.stateless = stateless
+        self.max_history = max_history
+        self.config = ModelConfig(**MODEL_CONFIGS.get(model))
         logger.info(f"Creating agent with config:\n{str(self.config)}")
-        self.client = OpenAI(
-            api_key=os.environ.get(self.config.api_key, None),
-            base_url=self.config.base_url,
-        )
+        # Shared by the agents of the provider, see `ClientRegistry`.
+        request_setting = self.config.request_setting or {}
+        self.client = CLIENTS.get(
+            self.config.base_url, self.config.api_key,
+            request_setting.get("max_concurrency", MAX_CONCURRENCY),
+            request_setting.get("keepalive_expiry", 60))
         logger.info(f"Agent created with model {self.config.model}")
-        self.history = History()
+        self.history = History(max_messages=max_history)
+        self.cache = ResponseCache.from_config()
+        # Opened by `async_session` for the concurrent requests.
+        self.async_client: AsyncOpenAI | None = None
+        self.limiter: SlidingWindowLimiter | None = None
+        self.concurrency: AdaptiveConcurrency | None = None
+        # The learned concurrency limits are not persisted if None. The store
+        # is loaded per session, since it is shared by the agents.
+        self.concurrency_path: str | None = CONCURRENCY_PATH
+        self.hedger: Hedger | None = None
+        self.hedge_agent: Agent | None = None
 
     def append(self, role: str, content: str):
         self.history.append(role=role, content=content)
 
     def clear(self):
-        self.history = History()
+        self.history = History(max_messages=self.max_history)
+
+    def remember(self, message: str, content: str):
+        if self.stateless:
+            return
+        self.history.extend([
+            Message(role="user", content=message),
+            Message(role="assistant", content=content),
+        ])
+
+    def request_key(self, messages: list[dict], model_kwargs: dict) -> str:
+        return cache_key(
+            self.config.model, self.config.endpoint, model_kwargs, messages)
+
+    def uses_cache(self, model_kwargs: dict) -> bool:
+        if self.cache is None:
+            return False
+        # The API samples with a temperature of 1 if not given.
+        sampled = model_kwargs.get("temperature", 1) != 0
+        return self.cache.cache_sampled or not sampled
+
+    def cached_response(self, key: str, model_kwargs: dict) -> str | None:
+        if self.cache is None or not self.uses_cache(model_kwargs):
+            return None
+        return self.cache.get(key)
+
+    def cache_response(self, key: str, model_kwargs: dict, content: str):
+        if self.cache is not None and self.uses_cache(model_kwargs):
+            self.cache.put(key, content)
+
+    def log_cache_stats(self):
+        if self.cache is not None:
+            logger.info(f"\n{self.cache.table()}")
+
+    def record_usage(self,
+                     record: CallRecord,
+                     prompt_tokens: int,
+                     completion_tokens: int,
+                     estimated: bool = False,
+                     cached_tokens: int = 0):
+        """
+        Record the usage of the request served by this agent. The prices
+        per million tokens are `prompt_price`, `completion_price` and
+        `cached_prompt_price` of the request setting, the last one for the
+        prompt tokens served from the prompt cache of the provider, which
+        defaults to `prompt_price`.
+        """
+        request_setting = self.config.request_setting or {}
+        prompt_price = request_setting.get("prompt_price", 0)
+        record.provider = self.model
+        record.prompt_tokens = prompt_tokens
+        record.completion_tokens = completion_tokens
+        record.cached_tokens = cached_tokens
+        record.estimated = estimated
+        record.cost = (
+            (prompt_tokens - cached_tokens) * prompt_price
+            + cached_tokens * request_setting.get(
+                "cached_prompt_price", prompt_price)
+            + completion_tokens * request_setting.get("completion_price", 0)
+        ) / 1e6
+
+    def finish_record(self, record: CallRecord, start: float, content: str):
+        record.latency = monotonic() - start
+        if record.outcome not in ("cached", "coalesced"):
+            record.outcome = "success" if content else "failure"
+        TELEMETRY.add(record)
 
     def complete_single(self,
                         message: str,
                         include_history: bool = False,
                         stream: bool = False,
+                        stop_markers: list[str] | None = None,
                         **kwargs) -> str:
-        self.client: OpenAI
+        """
+        Complete a message.
+
+        Args:
+            message: The message to complete.
+            include_history: If True, the history is sent before the message.
+            stream: If True, the response is streamed, and the time to the
+                first token and the tokens per second are logged.
+            stop_markers: Only used when streaming. Stop the stream once any
+                of the markers appears, the content until the marker is
+                returned.
+        """
         messages = self.history.tolist() if include_history else []
         messages.append({"role": "user", "content": message})
-        model_kwarg = self.config.model_kwargs or {}
-        model_kwarg.update(kwargs)
+        model_kwarg = {**(self.config.model_kwargs or {}), **kwargs}
+        key = self.request_key(
+            messages, with_stop_markers(model_kwarg, stream, stop_markers))
+        cached = self.cached_response(key, model_kwarg)
+        record = CallRecord(model=self.model)
+        start = monotonic()
+        if cached is not None:
+            record.outcome = "cached"
+            content = cached
+        else:
+            future, leader = SINGLE_FLIGHT.join(key)
+            if leader:
+                content = ""
+                try:
+                    content = self.retry_completion(
+                        messages, stream, stop_markers, record, **kwargs)
+                    self.cache_response(key, model_kwarg, content)
+                finally:
+                    SINGLE_FLIGHT.finish(key, content)
+            else:
+                record.outcome = "coalesced"
+                content = future.result()
+        self.finish_record(record, start, content)
+        self.remember(message, content)
+        return content
+
+    def retry_completion(self,
+                         messages: list[dict],
+                         stream: bool = False,
+                         stop_markers: list[str] | None = None,
+                         record: CallRecord | None = None,
+                         **kwargs) -> str:
+        """
+        Send the request until it succeeds or `max_retries` of the request
+        setting is reached. Returns an empty string if it fails.
+        """
         request_setting = self.config.request_setting or {}
-        content = ""
         N = request_setting.get("max_retries", 0) + 1
         for i in range(N):
             try:
-                response: ChatCompletion = self.client.chat.completions.create(
-                    messages=messages,  # type: ignore # openai handles this
-                    model=self.config.model,
-                    stream=stream,
-                    **model_kwarg,
-                )
-                content = response.choices[0].message.content
-                if not isinstance(content, str):
-                    raise ValueError(f"Invalid response content: {content}")
-                break
+                return self.request_completion(
+                    messages, stream, stop_markers, record, **kwargs)
             except Exception as e:
-                logger.error(f"Failed to complete message: {message}\n{e}")
-                content = ""
+                logger.error(f"Failed to complete message: "
+                             f"{messages[-1]['content']}\n{e}")
                 if i < N - 1:
-                    logger.info(f"Retry {i + 1}/{N-1}...")
-                    sleep(5)
-        self.history.append(role="user", content=message)
-        self.history.append(role="assistant", content=content)
+                    delay = retry_delay(e, i)
+                    logger.info(f"Retry {i + 1}/{N-1} in {delay:.1f}s...")
+                    sleep(delay)
+        return ""
+
+    def request_completion(self,
+                           messages: list[dict],
+                           stream: bool = False,
+                           stop_markers: list[str] | None = None,
+                           record: CallRecord | None = None,
+                           **kwargs) -> str:
+        """
+        Send one request without retrying, raises if it fails. The usage is
+        recorded in `record` if given.
+        """
+        self.client: OpenAI
+        model_kwarg = {**(self.config.model_kwargs or {}), **kwargs}
+        assembler = StreamAssembler(stop_markers)
+        record = record or CallRecord(model=self.model)
+        record.attempts += 1
+        response = self.client.chat.completions.create(
+            messages=messages,  # type: ignore # openai handles this
+            model=self.config.model,
+            stream=stream,
+            **model_kwarg,
+        )
+        if stream:
+            for chunk in response:
+                if assembler.feed(chunk):  # type: ignore
+                    break
+            response.close()  # type: ignore
+            content = assembler.content
+            logger.info(f"Streamed response: {assembler.metrics}")
+            # The usage is not reported in the streams.
+            self.record_usage(
+                record,
+                sum(estimate_tokens(m["content"]) for m in messages),
+                assembler.metrics.num_tokens,
+                estimated=True,
+            )
+        else:
+            response: ChatCompletion
+            content = response.choices[0].message.content
+            if response.usage is not None:
+                self.record_usage(
+                    record, response.usage.prompt_tokens,
+                    response.usage.completion_tokens,
+                    cached_tokens=cached_prompt_tokens(response.usage))
+        if not isinstance(content, str):
+            raise ValueError(f"Invalid response content: {content}")
         return content
 
     def complete_batches(self, messages: list[str], **kwargs) -> list[str]:
+        return self.complete_batch_groups([(messages, kwargs)])[0]
+
+    def complete_batch_groups(
+            self,
+            groups: list[tuple[list[str], dict]]) -> list[list[str]]:
+        """
+        Complete several logical batches, each with its own messages and
+        model kwargs, through one provider batch cycle. See
+        `BatchMultiplexer`.
+        """
+        requests = [
+            (message, {**(self.config.model_kwargs or {}), **kwargs})
+            for messages, kwargs in groups for message in messages
+        ]
+        keys = [
+            self.request_key([{"role": "user", "content": m}], model_kwarg)
+            for m, model_kwarg in requests
+        ]
+        responses = [
+            self.cached_response(key, model_kwarg)
+            for key, (_, model_kwarg) in zip(keys, requests)
+        ]
+        missing = [i for i, r in enumerate(responses) if r is None]
+        for _ in range(len(requests) - len(missing)):
+            TELEMETRY.add(CallRecord(
+                model=self.model, mode="batch", outcome="cached"))
+        # The identical requests are only submitted once.
+        unique: dict[str, int] = {}
+        for i in missing:
+            unique.setdefault(keys[i], i)
+        for _ in range(len(missing) - len(unique)):
+            TELEMETRY.add(CallRecord(
+                model=self.model, mode="batch", outcome="coalesced"))
+        logger.info(f"{len(requests) - len(missing)} of {len(requests)} "
+                    f"responses are cached, "
+                    f"{len(missing) - len(unique)} are coalesced.")
+        if len(unique):
+            completed = dict(zip(unique, self.request_batches(
+                [requests[i] for i in unique.values()])))
+            for key, content in completed.items():
+                self.cache_response(key, requests[unique[key]][1], content)
+            for i in missing:
+                responses[i] = completed[keys[i]]
+        self.log_cache_stats()
+        results: list[list[str]] = []
+        start = 0
+        for messages, _ in groups:
+            results.append(
+                [r or "" for r in responses[start:start + len(messages)]])
+            start += len(messages)
+        return results
+
+    def request_batches(self,
+                        requests: list[tuple[str, dict]]) -> list[str]:
         os.makedirs("tmp", exist_ok=True)
-        model_kwarg = self.config.model_kwargs or {}
-        model_kwarg.update(kwargs)
         batch_items = create_batch_items(
-            messages, self.config.endpoint, self.config.model, **model_kwarg)
-        serialized = json.dumps(batch_items, sort_keys=True).encode("utf-8")
-        sha = hashlib.sha256(serialized).hexdigest()
-        inp_jsonl_path = f"tmp/.agent.batch.inp.{sha}.jsonl"
-        inp_jsonl_path = save_jsonl(inp_jsonl_path, batch_items)
+            [message for message, _ in requests],
+            self.config.endpoint, self.config.model)
+        for item, (_, model_kwarg) in zip(batch_items, requests):
+            item["body"].update(model_kwarg)
+        request_setting = self.config.request_setting or {}
+        shards = split_batch_items(
+            batch_items,
+            max_requests=request_setting.get("batch_max_requests", 50000),
+            max_bytes=request_setting.get("batch_max_bytes", 100 * 2 ** 20),
+        )
+        if len(shards) > 1:
+            logger.info(f"Split {len(batch_items)} items into {len(shards)} "
+                        f"batches.")
+        # All the shards are submitted before waiting, so that they run on
+        # the provider side at the same time.
+        start = monotonic()
+        jobs = [self.submit_batch(shard) for shard in shards]
+        outputs: dict[str, tuple[str, dict]] = {}
+        for (sha, journal_path), shard in zip(jobs, shards):
+            outputs.update(self.collect_batch(sha, journal_path, len(shard)))
+        responses = []
+        for item in batch_items:
+            content, usage = outputs.get(item["custom_id"], ("", {}))
+            record = CallRecord(model=self.model, mode="batch", attempts=1)
+            self.record_usage(
+                record, usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+                cached_tokens=cached_prompt_tokens(usage))
+            self.finish_record(record, start, content)
+            responses.append(content)
+        return responses
+
+    def submit_batch(self, batch_items: list[bytes]) -> tuple[str, str]:
+        """
+        Submit the batch unless a journaled job of the same input exists.
+        Returns the input sha and the path of the journal.
+        """
+        sha = hashlib.sha256(b"".join(batch_items)).hexdigest()
+        # The ids of the uploaded file and the batch are journaled, so that a
+        # restarted process reattaches to the job instead of paying for it
+        # again.
+        journal_path = f"tmp/.agent.batch.job.{sha}.json"
+        if self.reattach_batch(journal_path) is not None:
+            return sha, journal_path
+        # The input is uploaded from memory, which is bounded by the shard
+        # size, instead of being written to a local file first.
         task_file = self.client.files.create(
-            file=open(inp_jsonl_path, "rb"), purpose="batch",
+            file=(f"agent.batch.{sha}.jsonl", b"".join(batch_items)),
+            purpose="batch",
         )
         logger.info(f"Create task with id {task_file.id}")
+        save_json_atomic(
+            journal_path, {"input_file_id": task_file.id}, indent=4)
+        self.create_batch(journal_path, task_file.id)
+        return sha, journal_path
+
+    def collect_batch(self,
+                      sha: str,
+                      journal_path: str,
+                      num_items: int) -> dict[str, tuple[str, dict]]:
+        job = self.reattach_batch(journal_path)
+        if job is None:
+            logger.warning(f"Batch of {sha} is lost, {num_items} items are "
+                           f"not completed.")
+            return {}
+        request_setting = self.config.request_setting or {}
+        job = wait_batch_task(
+            self.client, job,
+            interval=request_setting.get("batch_poll_interval", 10),
+            max_interval=request_setting.get("batch_max_poll_interval", 300),
+        )
+        if not batch_task_success(job) or not job.output_file_id:
+            if job.status not in BATCH_RUNNING_STATUS:
+                self.try_delete_local_file(journal_path)
+            return {}
+        with self.client.files.with_streaming_response.content(
+                job.output_file_id) as content:
+            responses = dict(parse_batch_output(content.iter_lines()))
+        logger.info(f"Get {len(responses)} of {num_items} responses of batch "
+                    f"{job.id}.")
+        self.try_delete_server_file(job.input_file_id)
+        self.try_delete_server_file(job.output_file_id)
+        self.try_delete_local_file(journal_path)
+        return responses
+
+    def create_batch(self, journal_path: str, input_file_id: str) -> Batch:
         batch_task = self.client.batches.create(
-            input_file_id=task_file.id,
+            input_file_id=input_file_id,
             endpoint=self.config.endpoint,  # type: ignore
             completion_window="24h",
             metadata={"description": f"complete batches by {self.model}"},
         )
+        save_json_atomic(
+            journal_path,
+            {"input_file_id": input_file_id, "batch_id": batch_task.id},
+            indent=4,
+        )
+        return batch_task
 
-        while True:
-            sleep(30)
-            try:
-                job = self.client.batches.retrieve(batch_task.id)
-            except Exception as e:
-                logger.warning(f"Failed to retrieve job {batch_task.id}\n{e}")
-                continue
-            if job.status in ("validating", "in_progress", "finalizing"):
-                logger.info(f"Completion status: {job.status}")
-                continue
-            else:
-                logger.info(f"Batches task existed, status: {job.status}.")
-                break
-        if job.status not in ("completed",) or not job.output_file_id:
-            return []
-
-        content = self.client.files.content(job.output_file_id)
-        out_jsonl_path = f"tmp/.agent.batch.out.{sha}.jsonl"
-        content.write_to_file(out_jsonl_path)
-        finished = load_jsonl(out_jsonl_path)
-        responses = {
-            r["custom_id"]: (r["response"]["body"]["choices"]
-                             [0]["message"]["content"])
-            for r in finished if r["response"]["status_code"] == 200
-        }
-        # keys = sorted(list(responses.keys()))
-        keys = sorted([it["custom_id"] for it in batch_items])
-        responses = [responses.get(k, "") for k in keys]
-
-        self.try_delete_server_file(task_file.id)
-        self.try_delete_server_file(job.output_file_id)
-        self.try_delete_local_file(inp_jsonl_path)
-        self.try_delete_local_file(out_jsonl_path)
-        return responses
+    def reattach_batch(self, journal_path: str) -> Batch | None:
+        if not osp.exists(journal_path):
+            return None
+        journal = load_json(journal_path)
+        try:
+            if not journal.get("batch_id"):
+                logger.info(f"Create batch of uploaded file "
+                            f"{journal['input_file_id']}")
+                return self.create_batch(
+                    journal_path, journal["input_file_id"])
+            job = self.client.batches.retrieve(journal["batch_id"])
+        except Exception as e:
+            logger.warning(f"Failed to reattach to {journal}\n{e}")
+            self.try_delete_local_file(journal_path)
+            return None
+        if job.status in ("failed", "expired", "cancelling", "cancelled"):
+            logger.info(f"Batch {job.id} exited with status {job.status}, "
+                        f"submit it again.")
+            self.try_delete_local_file(journal_path)
+            return None
+        logger.info(f"Reattach to batch {job.id} with status {job.status}.")
+        return job
 
     def complete_concurrent(
             self,
             messages: list[str],
+            max_workers: int = 0,
+            requests_per_minute: int = 0,
+            stream: bool = False,
+            stop_markers: list[str] | None = None,
+            **kwargs) -> list[str]:
+        """
+        Complete the messages concurrently, the responses are in the order
+        of the messages.
+
+        Args:
+            messages: The messages to complete.
+            max_workers: Maximum number of requests in flight. If 0,
+                `max_concurrency` of the request setting is used.
+            requests_per_minute: If 0, `requests_per_minute` of the request
+                setting is used. `tokens_per_minute` of the request setting
+                is enforced as well if set.
+            stream: If True, the responses are streamed, see
+                `complete_single`.
+            stop_markers: Only used when streaming, see `complete_single`.
+        """
+        return EVENT_LOOP.run(self.complete_async(
+            messages, max_workers, requests_per_minute, stream, stop_markers,
+            **kwargs))
+
+    async def complete_async(
+            self,
+            messages: list[str],
+            max_workers: int = 0,
+            requests_per_minute: int = 0,
+            stream: bool = False,
+            stop_markers: list[str] | None = None,
             **kwargs) -> list[str]:
-        def request(messages: list[str]):
-            with ThreadPoolExecutor() as executor:
-                results = list(executor.map(
-                    lambda msg: self.complete_single(msg, **kwargs), messages)
-                )
-            return results
+        progress = CompletionProgress(self.model, len(messages))
+        async with self.async_session(requests_per_minute, max_workers):
+            progress.hedger = self.hedger
+            reporter = asyncio.create_task(progress.report())
+            try:
+                responses = await asyncio.gather(*[
+                    self.complete_single_async(
+                        message, progress, stream, stop_markers, **kwargs)
+                    for message in messages
+                ])
+            finally:
+                reporter.cancel()
+        logger.info(f"\n{progress.table()}")
+        self.log_cache_stats()
+        for message, content in zip(messages, responses):
+            self.remember(message, content)
+        return list(responses)
+
+    @asynccontextmanager
+    async def async_session(self,
+                            requests_per_minute: int = 0,
+                            max_workers: int = 0):
+        """
+        Open the async client, the rate limiter used by
+        `request_completion_async` and the concurrency limit used by
+        `complete_single_async`. The async client is shared by the sessions
+        on `EVENT_LOOP`, which runs `complete_concurrent`, so that its
+        connections are reused by the next calls, see `AsyncClientRegistry`.
 
+        With `adaptive_concurrency` of the request setting, which is on by
+        default, the requests in flight are limited adaptively up to
+        `max_concurrency`, and the limit learned is reused by the next runs,
+        see `AdaptiveConcurrency`. The first run starts from
+        `initial_concurrency`, which defaults to the requests the rate limit
+        allows within `expected_latency` seconds, 10 by default, so that it
+        is not throttled while the limit grows. The client does not retry
+        by itself, so that the controller sees every overloaded response.
+        In either case, `requests_per_minute` of the request setting, or the
+        one given here, is a hard cap on the rate of the requests, which is
+        waited for before taking a slot of the concurrency limit.
+
+        With `hedge_percentile` of the request setting, the slow requests
+        are hedged, see `hedged_completion_async`.
+        """
         request_setting = self.config.request_setting or {}
-        requests_per_minute = request_setting.get("requests_per_minute", 64)
-        # If no max_tasks_per_minute is provided or messages are fewer than
-        # the limit, process normally.
-        if len(messages) <= requests_per_minute:
-            return request(messages)
-
-        # Otherwise, partition messages into batches and ensure each batch
-        # takes at least 60 seconds.
-        all_results = []
-        chunks = [
-            messages[i:i + requests_per_minute]
-            for i in range(0, len(messages), requests_per_minute)
-        ]
-        for i, chunk in enumerate(chunks):
-            header = [
-                "Model", "Current Chunk", "Total Chunks", "Messages in Chunk",
-                "Messages Processed", "Messages in Total"
-            ]
-            data = [
-                self.config.model, i + 1, len(chunks), len(chunk),
-                len(all_results), len(messages)
-            ]
-            table = tabulate([data], headers=header, tablefmt="pretty")
-            logger.info(f"\n{table}")
-            start_time = time()
-            all_results.extend(request(chunk))
-            sleep_time = 60 - (time() - start_time)
-            if sleep_time > 0 and i < len(chunks) - 1:
-                logger.info(
-                    f"Sleeping for {sleep_time} seconds due to "
-                    f"the RPM limitation ({requests_per_minute})..."
-                )
-                sleep(sleep_time)
-        return all_results
+        adaptive = request_setting.get("adaptive_concurrency", True)
+        self.concurrency = self.create_concurrency(
+            max_workers, requests_per_minute)
+        self.hedger = self.create_hedger()
+        self.limiter = SlidingWindowLimiter(
+            requests_per_minute=(
+                requests_per_minute
+                or request_setting.get("requests_per_minute", 64)
+            ),
+            tokens_per_minute=request_setting.get("tokens_per_minute", 0),
+        )
+        async with AsyncExitStack() as stack:
+            # One connection per request in flight at most, the ones of the
+            # initial limit are opened ahead of the requests.
+            self.async_client = await stack.enter_async_context(
+                ASYNC_CLIENTS.session(
+                    self.config.base_url, self.config.api_key,
+                    int(self.concurrency.max_limit),
+                    request_setting.get("keepalive_expiry", 60),
+                    max_retries=0 if adaptive else None,
+                    warm_connections=int(self.concurrency.limit)))
+            hedge_model = request_setting.get("hedge_model", "")
+            if self.hedger is not None and hedge_model:
+                self.hedge_agent = create_agent(hedge_model, stateless=True)
+                self.hedge_agent.cache = None
+                await stack.enter_async_context(self.hedge_agent.async_session(
+                    requests_per_minute, max_workers))
+            try:
+                yield
+            finally:
+                self.async_client = None
+                self.hedger = None
+                self.hedge_agent = None
+                self.save_concurrency()
+
+    def create_hedger(self) -> Hedger | None:
+        request_setting = self.config.request_setting or {}
+        percentile = request_setting.get("hedge_percentile", 0)
+        if not percentile:
+            return None
+        return Hedger(
+            percentile,
+            budget=request_setting.get("hedge_budget", 0.05),
+            min_samples=request_setting.get("hedge_min_samples", 20),
+        )
+
+    def create_concurrency(
+            self,
+            max_workers: int = 0,
+            requests_per_minute: int = 0) -> AdaptiveConcurrency:
+        request_setting = self.config.request_setting or {}
+        if not request_setting.get("adaptive_concurrency", True):
+            limit = max_workers or request_setting.get(
+                "max_concurrency", MAX_CONCURRENCY)
+            return AdaptiveConcurrency(limit, max_limit=limit, adaptive=False)
+        max_limit = max_workers or request_setting.get(
+            "max_concurrency", MAX_CONCURRENCY)
+        learned = (
+            ConcurrencyStore(self.concurrency_path).get(self.model)
+            if self.concurrency_path else None
+        )
+        if learned:
+            return AdaptiveConcurrency(learned, max_limit=max_limit)
+        # Without a learned limit, start from the concurrency which keeps up
+        # with the rate limit at the expected latency, i.e., Little's law,
+        # instead of growing slowly from a few requests.
+        requests_per_minute = (
+            requests_per_minute
+            or request_setting.get("requests_per_minute", 64)
+        )
+        initial = request_setting.get("initial_concurrency") or math.ceil(
+            requests_per_minute / 60
+            * request_setting.get("expected_latency", 10))
+        return AdaptiveConcurrency(initial or 4, max_limit=max_limit)
+
+    def save_concurrency(self):
+        concurrency = self.concurrency
+        if concurrency is None or not concurrency.updated:
+            return
+        logger.info(f"Learned concurrency of {self.model}: "
+                    f"{concurrency.limit:.1f}")
+        if self.concurrency_path:
+            ConcurrencyStore(self.concurrency_path).put(
+                self.model, concurrency.limit)
+
+    async def complete_single_async(self,
+                                    message: str,
+                                    progress: CompletionProgress,
+                                    stream: bool = False,
+                                    stop_markers: list[str] | None = None,
+                                    **kwargs) -> str:
+        model_kwarg = {**(self.config.model_kwargs or {}), **kwargs}
+        key = self.request_key(
+            [{"role": "user", "content": message}],
+            with_stop_markers(model_kwarg, stream, stop_markers))
+        cached = self.cached_response(key, model_kwarg)
+        record = CallRecord(model=self.model, mode="concurrent")
+        start = monotonic()
+        if cached is not None:
+            progress.finished += 1
+            record.outcome = "cached"
+            self.finish_record(record, start, cached)
+            return cached
+        future, leader = SINGLE_FLIGHT.join(key)
+        if not leader:
+            # Another call of the same request is in flight, in this or
+            # another event loop.
+            content = await asyncio.wrap_future(future)
+            progress.finished += 1
+            progress.coalesced += 1
+            record.outcome = "coalesced"
+            self.finish_record(record, start, content)
+            return content
+        content = ""
+        try:
+            content, start = await self.retry_completion_async(
+                message, progress, stream, stop_markers, record, **kwargs)
+            self.cache_response(key, model_kwarg, content)
+        finally:
+            SINGLE_FLIGHT.finish(key, content)
+        progress.finished += 1
+        progress.failed += int(not content)
+        self.finish_record(record, start, content)
+        return content
+
+    async def retry_completion_async(
+            self,
+            message: str,
+            progress: CompletionProgress,
+            stream: bool = False,
+            stop_markers: list[str] | None = None,
+            record: CallRecord | None = None,
+            **kwargs) -> tuple[str, float]:
+        """
+        Send the request until it succeeds or `max_retries` of the request
+        setting is reached, within the concurrency limit. Returns the
+        content, empty if it fails, and the time of the first request.
+        """
+        assert self.concurrency is not None
+        request_setting = self.config.request_setting or {}
+        content = ""
+        start = monotonic()
+        N = request_setting.get("max_retries", 0) + 1
+        for i in range(N):
+            event = await self.reserve(message, **kwargs)
+            await self.concurrency.acquire()
+            if i == 0:
+                # The latency excludes the time waiting for the first slot.
+                start = monotonic()
+            progress.in_flight += 1
+            attempt_start = monotonic()
+            error = None
+            try:
+                content = await self.hedged_completion_async(
+                    message, progress, stream, stop_markers, record, event,
+                    **kwargs)
+            except Exception as e:
+                error = e
+                content = ""
+            progress.in_flight -= 1
+            await self.concurrency.release(
+                monotonic() - attempt_start,
+                success=error is None,
+                overloaded=error is not None and is_failover_error(error),
+                retry_after=retry_after_seconds(error),
+            )
+            if error is None:
+                if self.hedger is not None:
+                    self.hedger.observe(monotonic() - attempt_start)
+                break
+            logger.error(f"Failed to complete message: {message}\n{error}")
+            if i < N - 1:
+                delay = retry_delay(error, i)
+                logger.info(f"Retry {i + 1}/{N-1} in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+        return content, start
+
+    async def hedged_completion_async(
+            self,
+            message: str,
+            progress: CompletionProgress,
+            stream: bool = False,
+            stop_markers: list[str] | None = None,
+            record: CallRecord | None = None,
+            event: list[float] | None = None,
+            **kwargs) -> str:
+        """
+        Send one request, and a duplicate of it to `hedge_model` of the
+        request setting, or to the same model, once it is slower than the
+        delay of the hedger. The hedge takes a slot of the concurrency limit
+        and of the rate limits of its model like any other request. The
+        first successful response wins and the other request is cancelled.
+        Raises if both of them fail. `event` is the reservation of the
+        request, see `reserve`.
+        """
+        args = (message, progress, stream, stop_markers, record)
+        primary = asyncio.ensure_future(
+            self.request_completion_async(*args, event=event, **kwargs))
+        hedger = self.hedger
+        delay = hedger.delay() if hedger is not None else None
+        if hedger is None or delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        target = self.hedge_agent or self
+        # A hedge waiting for a slot only adds to the load which made the
+        # request slow.
+        saturated = (
+            target.concurrency is not None
+            and not target.concurrency.available()
+        )
+        if done or saturated or not hedger.spend():
+            return await primary
+        logger.debug(f"Hedge the request to {target.model} after "
+                     f"{delay:.1f}s.")
+        hedge = asyncio.ensure_future(
+            target.limited_completion_async(*args, **kwargs))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        hedger.wins += int(task is hedge)
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            # Let the losers close their streams and release their slots.
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def limited_completion_async(self,
+                                       message: str,
+                                       *args,
+                                       **kwargs) -> str:
+        """
+        `request_completion_async` within the concurrency limit of the agent,
+        which observes the outcome of the request.
+        """
+        assert self.concurrency is not None
+        event = await self.reserve(message, **kwargs)
+        await self.concurrency.acquire()
+        start = monotonic()
+        error: BaseException | None = None
+        try:
+            return await self.request_completion_async(
+                message, *args, event=event, **kwargs)
+        except BaseException as e:
+            # Including the cancellation, which is not an overload.
+            error = e
+            raise
+        finally:
+            await self.concurrency.release(
+                monotonic() - start,
+                success=error is None,
+                overloaded=(isinstance(error, Exception)
+                            and is_failover_error(error)),
+                retry_after=(retry_after_seconds(error)
+                             if isinstance(error, Exception) else None),
+            )
+
+    async def request_completion_async(
+            self,
+            message: str,
+            progress: CompletionProgress,
+            stream: bool = False,
+            stop_markers: list[str] | None = None,
+            record: CallRecord | None = None,
+            event: list[float] | None = None,
+            **kwargs) -> str:
+        """
+        Send one request without retrying, raises if it fails. Only valid in
+        `async_session`. The usage is recorded in `record` if given. The
+        rate limits are waited for unless `event` is already reserved.
+        """
+        assert self.async_client is not None and self.limiter is not None
+        model_kwarg = {**(self.config.model_kwargs or {}), **kwargs}
+        if event is None:
+            event = await self.reserve(message, **kwargs)
+        assert event is not None
+        record = record or CallRecord(model=self.model, mode="concurrent")
+        record.attempts += 1
+        if stream:
+            assembler = await self.stream_async(
+                message, model_kwarg, stop_markers, progress)
+            num_tokens = assembler.metrics.num_tokens
+            self.limiter.settle(event, estimate_tokens(message) + num_tokens)
+            self.record_usage(
+                record, estimate_tokens(message), num_tokens, estimated=True)
+            return assembler.content
+        response = await self.async_client.chat.completions.create(
+            messages=[{"role": "user", "content": message}],
+            model=self.config.model,
+            **model_kwarg,
+        )
+        content = response.choices[0].message.content
+        if not isinstance(content, str):
+            raise ValueError(f"Invalid response content: {content}")
+        if response.usage is not None:
+            self.limiter.settle(event, response.usage.total_tokens)
+            self.record_usage(
+                record, response.usage.prompt_tokens,
+                response.usage.completion_tokens,
+                cached_tokens=cached_prompt_tokens(response.usage))
+        return content
+
+    async def reserve(self, message: str, **kwargs) -> list[float] | None:
+        """
+        Wait for the rate limits to send `message`, and reserve its tokens.
+        It is waited for before taking a slot of the concurrency limit, so
+        that the wait is not observed as the latency of the request. Returns
+        the event to settle with the usage, None without a rate limiter.
+        """
+        if self.limiter is None:
+            return None
+        model_kwarg = {**(self.config.model_kwargs or {}), **kwargs}
+        tokens = estimate_tokens(message) + model_kwarg.get("max_tokens", 0)
+        return await self.limiter.acquire(tokens)
+
+    async def stream_async(self,
+                           message: str,
+                           model_kwarg: dict,
+                           stop_markers: list[str] | None,
+                           progress: CompletionProgress) -> StreamAssembler:
+        assert self.async_client is not None
+        assembler = StreamAssembler(stop_markers)
+        response = await self.async_client.chat.completions.create(
+            messages=[{"role": "user", "content": message}],
+            model=self.config.model,
+            stream=True,
+            **model_kwarg,
+        )
+        try:
+            async for chunk in response:
+                if assembler.feed(chunk):
+                    break
+        finally:
+            # Also close the stream when the request is cancelled, e.g.,
+            # when it loses to a hedge.
+            await response.close()
+        logger.debug(f"Streamed response: {assembler.metrics}")
+        progress.stream_metrics.append(assembler.metrics)
+        return assembler
 
     def try_delete_server_file(self, file_id: str):
         try:
@@ -232,6 +1251,364 @@ class Agent:
             )
 
 
+@dataclass
+class ProviderStats:
+    weight: float = 1
+    # Exponential moving averages of the latency in seconds and the error
+    # rate of the requests.
+    latency: float = 0
+    error_rate: float = 0
+    requests: int = 0
+    failures: int = 0
+    cooldown_until: float = 0
+
+    def record(self, latency: float, success: bool, alpha: float = 0.2):
+        self.requests += 1
+        self.failures += int(not success)
+        if self.requests == 1:
+            self.latency = latency
+        else:
+            self.latency = (1 - alpha) * self.latency + alpha * latency
+        self.error_rate = (
+            (1 - alpha) * self.error_rate + alpha * (0 if success else 1)
+        )
+
+    @property
+    def score(self) -> float:
+        # Lower is better. An error costs as much as 10 seconds of latency.
+        # Untried providers score 0, so that each of them is tried once.
+        return (self.latency + 10 * self.error_rate) / self.weight
+
+
+class RoutedAgent(Agent):
+    """
+    Route the requests over a pool of equivalent models of different
+    providers, defined in `configs/core/agent.json` as
+
+        "pool-deepseek-v3": {
+            "pool": {
+                "luchentech-deepseek-v3": 2,
+                "siliconflow-deepseek-v3": 1
+            },
+            "cooldown": 30
+        }
+
+    Each request goes to the provider with the best score of the observed
+    latency and error rate, scaled by its weight. Timeouts, connection
+    errors, 429 and 5xx responses fail over to the next provider right away,
+    and the failed provider is skipped for `cooldown` seconds. If all of
+    them fail, the last error is raised. Concurrent requests respect the
+    rate limits and the adaptive concurrency of each provider, and prefer
+    the providers which are not limited at the moment.
+
+    The responses are cached, and batches are submitted, with the primary
+    provider, i.e., the one with the largest weight, as batches can't be
+    routed once submitted.
+    """
+
+    def __init__(self,
+                 model: str,
+                 pool: dict[str, float],
+                 cooldown: float = 30,
+                 stateless: bool = False,
+                 max_history: int = 64):
+        self.model = model
+        self.stateless = stateless
+        self.max_history = max_history
+        # The history is kept by the router, the providers only serve the
+        # requests.
+        self.providers = {
+            key: Agent(key, stateless=True, max_history=0) for key in pool
+        }
+        for provider in self.providers.values():
+            provider.cache = None
+        self.stats = {
+            key: ProviderStats(weight=weight) for key, weight in pool.items()
+        }
+        self.cooldown = cooldown
+        primary = self.providers[max(pool, key=lambda key: pool[key])]
+        self.config = primary.config
+        self.client = primary.client
+        self.history = History(max_messages=max_history)
+        self.cache = ResponseCache.from_config()
+        self.async_client = None
+        self.limiter = None
+        self.concurrency = None
+        self.concurrency_path = CONCURRENCY_PATH
+        self.hedger = None
+        self.hedge_agent = None
+        logger.info(f"Routed agent created with providers {list(pool)}")
+
+    def rank(self, tokens: int = 0) -> list[str]:
+        now = monotonic()
+
+        def priority(key: str):
+            limiter = self.providers[key].limiter
+            concurrency = self.providers[key].concurrency
+            limited = (
+                (limiter is not None and not limiter.available(tokens))
+                or (concurrency is not None and not concurrency.available())
+            )
+            return (
+                self.stats[key].cooldown_until > now,
+                limited,
+                self.stats[key].score,
+            )
+
+        return sorted(self.providers, key=priority)
+
+    def record(self, key: str, start: float, error: Exception | None = None):
+        stats = self.stats[key]
+        stats.record(monotonic() - start, error is None)
+        if error is not None and is_failover_error(error):
+            stats.cooldown_until = monotonic() + self.cooldown
+            logger.warning(f"Fail over from {key}: {error}")
+
+    def request_completion(self,
+                           messages: list[dict],
+                           stream: bool = False,
+                           stop_markers: list[str] | None = None,
+                           record: CallRecord | None = None,
+                           **kwargs) -> str:
+        error = None
+        for key in self.rank():
+            start = monotonic()
+            try:
+                content = self.providers[key].request_completion(
+                    messages, stream, stop_markers, record, **kwargs)
+            except Exception as e:
+                self.record(key, start, e)
+                if not is_failover_error(e):
+                    raise
+                error = e
+                continue
+            self.record(key, start)
+            return content
+        assert error is not None
+        raise error
+
+    @asynccontextmanager
+    async def async_session(self,
+                            requests_per_minute: int = 0,
+                            max_workers: int = 0):
+        # The concurrency is limited over the pool, and by each provider as
+        # well, the rate limits by each provider.
+        self.concurrency = self.create_concurrency(
+            max_workers, requests_per_minute)
+        # The hedges are routed as well, to the best provider at the time.
+        self.hedger = self.create_hedger()
+        async with AsyncExitStack() as stack:
+            for provider in self.providers.values():
+                await stack.enter_async_context(
+                    provider.async_session(requests_per_minute, max_workers))
+            try:
+                yield
+            finally:
+                self.hedger = None
+                self.save_concurrency()
+        logger.info(f"\n{self.table()}")
+
+    async def request_completion_async(
+            self,
+            message: str,
+            progress: CompletionProgress,
+            stream: bool = False,
+            stop_markers: list[str] | None = None,
+            record: CallRecord | None = None,
+            event: list[float] | None = None,
+            **kwargs) -> str:
+        # The rate limits are of the providers, so nothing is reserved by the
+        # router, i.e., `event` is None.
+        error = None
+        for key in self.rank(estimate_tokens(message)):
+            start = monotonic()
+            try:
+                # The concurrency of each provider adapts to its own
+                # overloads, see `async_session`.
+                content = await self.providers[key].limited_completion_async(
+                    message, progress, stream, stop_markers, record, **kwargs)
+            except Exception as e:
+                self.record(key, start, e)
+                if not is_failover_error(e):
+                    raise
+                error = e
+                continue
+            self.record(key, start)
+            return content
+        assert error is not None
+        raise error
+
+    def table(self) -> str:
+        header = [
+            "Provider", "Weight", "Requests", "Failures", "Latency (s)",
+            "Error Rate", "Score"
+        ]
+        data = [
+            [
+                key, stats.weight, stats.requests, stats.failures,
+                f"{stats.latency:.2f}", f"{stats.error_rate:.2f}",
+                f"{stats.score:.2f}"
+            ]
+            for key, stats in self.stats.items()
+        ]
+        return tabulate(data, headers=header, tablefmt="pretty")
+
+
+def is_failover_error(error: Exception) -> bool:
+    return isinstance(error, (
+        APITimeoutError, APIConnectionError, RateLimitError,
+        InternalServerError,
+    ))
+
+
+def retry_after_seconds(error: Exception | None) -> float | None:
+    """
+    Returns the `Retry-After` of the response of `error` in seconds, if any.
+    """
+    if not isinstance(error, APIStatusError):
+        return None
+    headers = error.response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                # It may be an HTTP date as well.
+                date = parsedate_to_datetime(value)
+                return max(date.timestamp() - time(), 0)
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def retry_delay(error: Exception, attempt: int, cap: float = 60) -> float:
+    """
+    Returns the seconds to wait before retrying a request failed with
+    `error`, i.e., the `Retry-After` of the response if any, otherwise an
+    exponential backoff with full jitter.
+    """
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        return min(retry_after, cap)
+    return random.uniform(0, min(cap, 2 ** attempt))
+
+
+def create_agent(model: str, stateless: bool = False) -> Agent:
+    """
+    Returns a `RoutedAgent` if `model` is a pool of models in
+    `configs/core/agent.json`, otherwise an `Agent`. See `Agent` for
+    `stateless`.
+    """
+    config = MODEL_CONFIGS.get(model)
+    if "pool" in config:
+        return RoutedAgent(
+            model, config["pool"], config.get("cooldown", 30), stateless)
+    return Agent(model, stateless)
+
+
+class BatchMultiplexer:
+    """
+    Collect the logical batches of an agent and complete all of them in one
+    provider batch cycle, instead of waiting for a full cycle per batch.
+
+    Examples:
+        >>> with BatchMultiplexer(agent) as multiplexer:
+        ...     titles = multiplexer.submit(title_prompts)
+        ...     summaries = multiplexer.submit(summary_prompts)
+        >>> titles.result(), summaries.result()
+    """
+
+    def __init__(self, agent: Agent):
+        self.agent = agent
+        self.pending: list[tuple[list[str], dict, Future]] = []
+
+    def submit(self, messages: list[str], **kwargs) -> Future:
+        """
+        Register a logical batch. The returned future is resolved with the
+        responses in the order of the messages once `flush` is called.
+        """
+        future = Future()
+        self.pending.append((messages, kwargs, future))
+        return future
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if len(pending) == 0:
+            return
+        logger.info(f"Submitting {len(pending)} logical batches together.")
+        try:
+            responses = self.agent.complete_batch_groups(
+                [(messages, kwargs) for messages, kwargs, _ in pending])
+        except Exception as e:
+            for *_, future in pending:
+                future.set_exception(e)
+            return
+        for (*_, future), response in zip(pending, responses):
+            future.set_result(response)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+
+def with_stop_markers(model_kwarg: dict,
+                      stream: bool,
+                      stop_markers: list[str] | None) -> dict:
+    # Responses stopped at a marker are only valid for the same markers, so
+    # the markers are a part of the cache key.
+    if not stream or not stop_markers:
+        return model_kwarg
+    return {**model_kwarg, "stop_markers": stop_markers}
+
+
+def split_batch_items(batch_items: list[dict],
+                      max_requests: int,
+                      max_bytes: int) -> list[list[bytes]]:
+    """
+    Serialize the batch items into jsonl lines and split them into shards
+    of at most `max_requests` lines and `max_bytes` bytes.
+    """
+    shards: list[list[bytes]] = [[]]
+    num_bytes = 0
+    for item in batch_items:
+        line = (json.dumps(item) + "\n").encode("utf-8")
+        shard = shards[-1]
+        if shard and (
+                len(shard) >= max_requests
+                or num_bytes + len(line) > max_bytes):
+            shard = []
+            shards.append(shard)
+            num_bytes = 0
+        shard.append(line)
+        num_bytes += len(line)
+    return [shard for shard in shards if shard]
+
+
+def parse_batch_output(
+        lines: Iterator[str]) -> Iterator[tuple[str, tuple[str, dict]]]:
+    """
+    Yields the custom id, and the content and the usage of each successful
+    response of a batch output file, line by line.
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        body = response.get("body") or {}
+        if response.get("status_code") != 200 or not body.get("choices"):
+            logger.warning(f"Request {item.get('custom_id')} failed: "
+                           f"{item.get('error') or response}")
+            continue
+        content = body["choices"][0]["message"]["content"]
+        yield item["custom_id"], (content or "", body.get("usage") or {})
+
+
 def create_batch_items(messages: list[str], endpoint: str, model: str,
                        **request_kwargs) -> list[dict]:
     items = []
@@ -0,0 +1,258 @@
+import os
+import hashlib
+import threading
+import os.path as osp
+from time import sleep, monotonic, time
+from datetime import datetime, timezone
+from http import HTTPStatus
+from typing import Iterator
+from urllib.parse import urlencode
+
+import arxiv
+import requests
+
+from arxiver.base.result import Result
+from arxiver.core.atom_decoder import DecodedFeed, decode_feed
+from arxiver.utils.io import load_json, save_json_atomic
+from arxiver.utils.logging import create_logger
+
+
+logger = create_logger(__name__)
+
+
+class RateLimiter:
+    """
+    Allow at most one request every `interval` seconds, shared by all the
+    threads holding the limiter.
+    """
+
+    def __init__(self, interval: float = 3.0):
+        self.interval = interval
+        self.last_request = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            to_sleep = self.last_request + self.interval - monotonic()
+            if to_sleep > 0:
+                sleep(to_sleep)
+            self.last_request = monotonic()
+
+
+# arXiv asks to make no more than one request every three seconds, so all the
+# clients in the process share one limiter by default.
+ARXIV_RATE_LIMITER = RateLimiter(interval=3.0)
+
+
+class PageCache:
+    """
+    On-disk cache of the raw feed pages. A page is keyed by its request url,
+    which contains the query, the start offset and the page size.
+    """
+
+    def __init__(self, directory: str, ttl: float = 21600):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return osp.join(self.directory, f"{key}.xml")
+
+    def get(self, url: str) -> bytes | None:
+        path = self.path(url)
+        if not osp.exists(path):
+            return None
+        if time() - osp.getmtime(path) > self.ttl:
+            logger.debug(f"Cached page of {url} is expired.")
+            self.try_delete(path)
+            return None
+        with open(path, "rb") as fp:
+            return fp.read()
+
+    def put(self, url: str, content: bytes):
+        path = self.path(url)
+        # Write to a temporary file first so that concurrent readers never
+        # see a partially written page.
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(content)
+        os.replace(tmp_path, path)
+
+    def try_delete(self, path: str):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.debug(f"Failed to delete cached page {path}, {e}")
+
+
+class WatermarkStore:
+    """
+    The highest `updated` timestamp seen of each category, and the ids of
+    the entries updated at that timestamp, persisted in a json file. Other
+    entries may be updated at the same timestamp later, so they are only
+    told apart from the seen ones by their ids.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermarks: dict[str, dict] = (
+            load_json(path) if osp.exists(path) else {}
+        )
+
+    def get(self, category: str) -> datetime | None:
+        value = self.watermarks.get(category, {}).get("updated", "")
+        if not value:
+            return None
+        watermark = datetime.fromisoformat(value)
+        if watermark.tzinfo is None:
+            watermark = watermark.replace(tzinfo=timezone.utc)
+        return watermark
+
+    def seen(self, category: str) -> set[str]:
+        """
+        Returns the ids of the entries updated at the watermark.
+        """
+        return set(self.watermarks.get(category, {}).get("ids", []))
+
+    def advance(self,
+                category: str,
+                updated: datetime,
+                ids: set[str] | None = None):
+        """
+        Args:
+            category: The category of the watermark.
+            updated: The highest `updated` timestamp seen.
+            ids: The entry ids of the entries updated at `updated`.
+        """
+        ids = set(ids or [])
+        watermark = self.get(category)
+        if watermark is not None and updated < watermark:
+            return
+        if watermark is not None and updated == watermark:
+            if ids <= self.seen(category):
+                return
+            ids |= self.seen(category)
+        logger.info(f"Advance the watermark of {category!r} to {updated}.")
+        self.watermarks[category] = {
+            "updated": updated.isoformat(), "ids": sorted(ids)
+        }
+        directory = osp.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        save_json_atomic(self.path, self.watermarks, indent=4)
+
+
+# arXiv asks the clients of the API to identify themselves.
+USER_AGENT = "arxiver (https://github.com/yiqunchen1999/dev-arxiver)"
+
+
+class ArxivSession(requests.Session):
+    def __init__(self,
+                 rate_limiter: RateLimiter | None = None,
+                 page_cache: PageCache | None = None):
+        super().__init__()
+        self.rate_limiter = rate_limiter or ARXIV_RATE_LIMITER
+        self.page_cache = page_cache
+        # Overridden by the header of each request of `arxiv.Client`.
+        self.headers["User-Agent"] = USER_AGENT
+
+    def get(self, url, **kwargs):  # type: ignore
+        if self.page_cache is not None:
+            content = self.page_cache.get(url)
+            if content is not None:
+                logger.info(f"Hit cached page: {url}")
+                return cached_response(url, content)
+        self.rate_limiter.wait()
+        response = super().get(url, **kwargs)
+        # Only complete pages are cached, empty pages are usually caused by
+        # the flaky API and should be requested again.
+        if (
+                self.page_cache is not None
+                and response.status_code == requests.codes.ok
+                and b"<entry" in response.content):
+            self.page_cache.put(url, response.content)
+        return response
+
+
+def cached_response(url: str, content: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = HTTPStatus.OK
+    response.url = url
+    response._content = content
+    return response
+
+
+class NativeClient:
+    """
+    A drop-in replacement of `arxiv.Client` which decodes the feed pages
+    into `Result` directly, see `arxiver.core.atom_decoder`.
+    """
+
+    def __init__(self,
+                 page_size: int = 100,
+                 num_retries: int = 3,
+                 rate_limiter: RateLimiter | None = None,
+                 page_cache: PageCache | None = None):
+        self.page_size = page_size
+        self.num_retries = num_retries
+        self._session = ArxivSession(rate_limiter, page_cache)
+
+    def results(self, search: arxiv.Search, offset: int = 0) -> Iterator[Result]:
+        limit = search.max_results
+        start = offset
+        while limit is None or start < limit:
+            page_size = self.page_size
+            if limit is not None:
+                page_size = min(page_size, limit - start)
+            url = self.format_url(search, start, page_size)
+            feed = self.request_page(url, first_page=start == offset)
+            yield from feed.results
+            start += len(feed.results)
+            if not feed.results or start >= feed.total_results:
+                break
+
+    def format_url(self, search: arxiv.Search, start: int, page_size: int):
+        url_args = {
+            "search_query": search.query,
+            "id_list": ",".join(search.id_list),
+            "sortBy": search.sort_by.value,
+            "sortOrder": search.sort_order.value,
+            "start": str(start),
+            "max_results": str(page_size),
+        }
+        return arxiv.Client.query_url_format.format(urlencode(url_args))
+
+    def request_page(self, url: str, first_page: bool) -> DecodedFeed:
+        error: arxiv.ArxivError | None = None
+        for i in range(self.num_retries + 1):
+            logger.info(f"Requesting page (first: {first_page}, try: {i}): "
+                        f"{url}")
+            response = self._session.get(url)
+            if response.status_code != requests.codes.ok:
+                error = arxiv.HTTPError(url, i, response.status_code)
+            else:
+                feed = decode_feed(response.content)
+                if len(feed.results) or first_page:
+                    return feed
+                # The page as parsed by the library, for the diagnostics.
+                error = arxiv.UnexpectedEmptyPageError(
+                    url, i, arxiv._feed.parse(response.content))
+            logger.debug(f"Got error (try {i}): {error}")
+        assert error is not None
+        raise error
+
+
+def create_client(page_size: int = 100,
+                  num_retries: int = 10,
+                  rate_limiter: RateLimiter | None = None,
+                  page_cache: PageCache | None = None,
+                  native_decoder: bool = False):
+    if native_decoder:
+        return NativeClient(page_size, num_retries, rate_limiter, page_cache)
+    # The delay between requests is enforced by the shared rate limiter of
+    # the session instead of each client.
+    client = arxiv.Client(
+        page_size=page_size, delay_seconds=0, num_retries=num_retries)
+    client._session = ArxivSession(rate_limiter, page_cache)
+    return client
@@ -0,0 +1,88 @@
+import io
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from dataclasses import dataclass, field
+
+from arxiver.base.result import Result
+
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+ARXIV = "{http://arxiv.org/schemas/atom}"
+OPENSEARCH = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+
+@dataclass
+class DecodedFeed:
+    total_results: int = 0
+    results: list[Result] = field(default_factory=list)
+
+
+def decode_feed(content: bytes) -> DecodedFeed:
+    """
+    Decode a page of the arXiv Atom feed into `Result` directly.
+
+    The feed is parsed incrementally and each `<entry>` is released once it
+    is converted, so the entries are only allocated once instead of being
+    parsed into `arxiv.Result` and then copied into `Result`.
+    """
+    feed = DecodedFeed()
+    for _, element in ET.iterparse(io.BytesIO(content), events=("end",)):
+        if element.tag == f"{ATOM}entry":
+            result = decode_entry(element)
+            if result is not None:
+                feed.results.append(result)
+            element.clear()
+        elif element.tag == f"{OPENSEARCH}totalResults":
+            feed.total_results = int((element.text or "0").strip())
+    return feed
+
+
+def decode_entry(entry: ET.Element) -> Result | None:
+    entry_id = entry.findtext(f"{ATOM}id")
+    updated = entry.findtext(f"{ATOM}updated")
+    published = entry.findtext(f"{ATOM}published")
+    if not entry_id or not updated or not published:
+        return None
+    authors = [
+        Result.Author(author.findtext(f"{ATOM}name") or "")
+        for author in entry.iterfind(f"{ATOM}author")
+    ]
+    links = [
+        Result.Link(
+            link.get("href", ""),
+            title=link.get("title"),
+            rel=link.get("rel", ""),
+            content_type=link.get("type"),
+        )
+        for link in entry.iterfind(f"{ATOM}link") if link.get("href")
+    ]
+    categories = [
+        category.get("term", "")
+        for category in entry.iterfind(f"{ATOM}category")
+    ]
+    primary_category = entry.find(f"{ARXIV}primary_category")
+    return Result(
+        entry_id=entry_id,
+        updated=decode_datetime(updated),
+        published=decode_datetime(published),
+        title=" ".join((entry.findtext(f"{ATOM}title") or "").split()),
+        authors=authors,
+        summary=entry.findtext(f"{ATOM}summary") or "",
+        comment=entry.findtext(f"{ARXIV}comment"),
+        journal_ref=entry.findtext(f"{ARXIV}journal_ref"),
+        doi=entry.findtext(f"{ARXIV}doi"),
+        primary_category=(
+            primary_category.get("term", "")
+            if primary_category is not None else ""
+        ),
+        categories=categories,
+        links=links,
+    )
+
+
+def decode_datetime(text: str) -> datetime:
+    # The timestamps look like "2016-05-26T17:59:46Z".
+    date = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date
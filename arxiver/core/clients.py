@@ -0,0 +1,217 @@
+import os
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Coroutine
+
+from openai import (
+    OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient,
+    DEFAULT_CONNECTION_LIMITS
+)
+
+from arxiver.utils.logging import create_logger
+
+
+logger = create_logger(__name__)
+
+
+# The default size of the connection pool of a provider, and the default
+# maximum of its requests in flight.
+MAX_CONCURRENCY = 64
+
+
+def connection_limits(max_connections: int, keepalive_expiry: float = 60):
+    """
+    The connection limits of a client serving `max_connections` requests in
+    flight, all of which are kept alive between the requests.
+    """
+    # The limits type of the http transport of the installed openai.
+    return type(DEFAULT_CONNECTION_LIMITS)(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+class ClientRegistry:
+    """
+    The openai clients of the process, shared by the agents of the same
+    provider, so that the connections, and their TLS sessions, are reused
+    across the plugins, the pipeline stages and the retries of a run.
+
+    A client is keyed by the base url, the environment variable of the api
+    key and the size of its connection pool. It is safe to share between
+    threads.
+    """
+
+    def __init__(self):
+        self.clients: dict[tuple[str, str, int], OpenAI] = {}
+        self.lock = threading.Lock()
+
+    def get(self,
+            base_url: str,
+            api_key: str,
+            max_connections: int = MAX_CONCURRENCY,
+            keepalive_expiry: float = 60) -> OpenAI:
+        """
+        Args:
+            base_url: The base url of the provider.
+            api_key: The environment variable of the api key.
+            max_connections: Size of the connection pool, i.e., the
+                concurrency of the provider.
+            keepalive_expiry: Seconds to keep an idle connection alive.
+        """
+        key = (base_url, api_key, max_connections)
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                logger.info(f"Creating client of {base_url} with "
+                            f"{max_connections} connections.")
+                client = OpenAI(
+                    api_key=os.environ.get(api_key, None),
+                    base_url=base_url,
+                    http_client=DefaultHttpxClient(limits=connection_limits(
+                        max_connections, keepalive_expiry)),
+                )
+                self.clients[key] = client
+            return client
+
+    def clear(self):
+        with self.lock:
+            clients, self.clients = self.clients, {}
+        for client in clients.values():
+            client.close()
+
+
+class EventLoopThread:
+    """
+    An event loop running in a daemon thread for the life of the process.
+    The concurrent completions of all the agents run on it, so that their
+    async clients, which are bound to the loop they are used in, and the
+    connections of the clients are reused across the calls.
+    """
+
+    def __init__(self):
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.thread: threading.Thread | None = None
+        self.lock = threading.Lock()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(
+                    target=self.loop.run_forever, name="agent-event-loop",
+                    daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def run(self, coroutine: Coroutine[Any, Any, Any]) -> Any:
+        """
+        Run the coroutine on the loop and wait for its result, like
+        `asyncio.run`. The context of the caller, e.g., the running plugin,
+        is copied into the coroutine.
+        """
+        loop = self.get_loop()
+        if threading.current_thread() is self.thread:
+            coroutine.close()
+            raise RuntimeError("Can't wait for the event loop in itself.")
+        future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+        try:
+            return future.result()
+        except BaseException:
+            # E.g., interrupted by the user.
+            future.cancel()
+            raise
+
+
+class AsyncClientRegistry:
+    """
+    The async clients shared by the agents of the same provider on the loop
+    of `EVENT_LOOP`, keyed like `ClientRegistry` and by the retries of the
+    client. In any other loop, e.g., of `asyncio.run`, the client lives for
+    the session only.
+    """
+
+    def __init__(self, event_loop: EventLoopThread):
+        self.event_loop = event_loop
+        self.clients: dict[tuple[str, str, int, int | None], AsyncOpenAI] = {}
+
+    @asynccontextmanager
+    async def session(self,
+                      base_url: str,
+                      api_key: str,
+                      max_connections: int = MAX_CONCURRENCY,
+                      keepalive_expiry: float = 60,
+                      max_retries: int | None = None,
+                      warm_connections: int = 0) -> AsyncIterator[AsyncOpenAI]:
+        """
+        Args:
+            base_url: The base url of the provider.
+            api_key: The environment variable of the api key.
+            max_connections: Size of the connection pool.
+            keepalive_expiry: Seconds to keep an idle connection alive.
+            max_retries: The retries of the client, the default of openai
+                if None.
+            warm_connections: Number of the connections opened ahead of
+                the requests once the client is created.
+        """
+        kwargs = {} if max_retries is None else {"max_retries": max_retries}
+        if asyncio.get_running_loop() is not self.event_loop.loop:
+            async with create_async_client(
+                    base_url, api_key, max_connections, keepalive_expiry,
+                    **kwargs) as client:
+                yield client
+            return
+        # Only used in the loop, so no lock is needed.
+        key = (base_url, api_key, max_connections, max_retries)
+        client = self.clients.get(key)
+        if client is None:
+            logger.info(f"Creating async client of {base_url} with "
+                        f"{max_connections} connections.")
+            client = create_async_client(
+                base_url, api_key, max_connections, keepalive_expiry,
+                **kwargs)
+            self.clients[key] = client
+            await warm_up(client, min(warm_connections, max_connections))
+        yield client
+
+
+def create_async_client(base_url: str,
+                        api_key: str,
+                        max_connections: int = MAX_CONCURRENCY,
+                        keepalive_expiry: float = 60,
+                        **kwargs) -> AsyncOpenAI:
+    """
+    An async client with a connection pool of `max_connections`, see
+    `AsyncClientRegistry` to share it.
+    """
+    return AsyncOpenAI(
+        api_key=os.environ.get(api_key, None),
+        base_url=base_url,
+        http_client=DefaultAsyncHttpxClient(
+            limits=connection_limits(max_connections, keepalive_expiry)),
+        **kwargs,
+    )
+
+
+async def warm_up(client: AsyncOpenAI, connections: int):
+    """
+    Open `connections` connections of the pool with concurrent requests of
+    the models, so that the first completions do not pay for the TLS
+    handshakes. The responses, e.g., a 404 of a provider without the
+    endpoint, are ignored.
+    """
+    async def touch():
+        try:
+            await client.with_options(max_retries=0, timeout=10).models.list()
+        except Exception as e:
+            logger.debug(f"Warming up {client.base_url}: {e}")
+
+    await asyncio.gather(*[touch() for _ in range(connections)])
+
+
+# The clients of all the agents of the process.
+CLIENTS = ClientRegistry()
+EVENT_LOOP = EventLoopThread()
+ASYNC_CLIENTS = AsyncClientRegistry(EVENT_LOOP)
@@ -0,0 +1,153 @@
+import os
+import asyncio
+import os.path as osp
+from time import monotonic
+
+from arxiver.utils.io import load_json, save_json_atomic
+from arxiver.utils.logging import create_logger
+
+
+logger = create_logger(__name__)
+
+
+class AdaptiveConcurrency:
+    """
+    Limit the requests in flight with additive increase and multiplicative
+    decrease (AIMD).
+
+    The limit grows by about one per round of `limit` healthy responses,
+    i.e., successful while the moving average of the latency is within
+    `latency_tolerance` times its minimum. It is multiplied by `backoff` on
+    overload, i.e., 429, 5xx, timeouts and connection errors, at most once
+    per observed latency, so that a burst of errors only cuts it once. New
+    requests are held until the `Retry-After` of an overloaded response.
+
+    It must be used in a single event loop. If `adaptive` is False, the
+    limit is fixed and only the `Retry-After` is honored.
+
+    Args:
+        limit: The initial limit.
+        min_limit: The minimum limit.
+        max_limit: The maximum limit.
+        backoff: The limit is multiplied by it on overload.
+        latency_tolerance: The limit is not raised while the average
+            latency is beyond this times its minimum.
+        adaptive: If False, the limit is fixed.
+    """
+
+    def __init__(self,
+                 limit: float = 4,
+                 min_limit: float = 1,
+                 max_limit: float = 64,
+                 backoff: float = 0.5,
+                 latency_tolerance: float = 2.0,
+                 adaptive: bool = True):
+        self.limit = min(max(limit, min_limit), max_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.adaptive = adaptive
+        self.in_flight = 0
+        # The fastest observed latency, and an exponential moving average
+        # of the latency.
+        self.min_latency = float("inf")
+        self.latency = 0.0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.updated = False
+        self.condition = asyncio.Condition()
+
+    def available(self) -> bool:
+        return (
+            monotonic() >= self.paused_until
+            and self.in_flight < int(self.limit)
+        )
+
+    async def acquire(self):
+        async with self.condition:
+            while True:
+                to_sleep = self.paused_until - monotonic()
+                if to_sleep <= 0 and self.in_flight < int(self.limit):
+                    break
+                try:
+                    await asyncio.wait_for(
+                        self.condition.wait(),
+                        timeout=to_sleep if to_sleep > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+            self.in_flight += 1
+
+    async def release(self,
+                      latency: float,
+                      success: bool,
+                      overloaded: bool = False,
+                      retry_after: float | None = None):
+        """
+        Args:
+            latency: Seconds of the request.
+            success: If the request succeeded.
+            overloaded: If the request failed because of the load of the
+                provider.
+            retry_after: The `Retry-After` seconds of the response, if any.
+        """
+        async with self.condition:
+            self.in_flight -= 1
+            now = monotonic()
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            if overloaded:
+                self.decrease(now)
+            elif success:
+                self.observe(latency)
+            self.condition.notify_all()
+
+    def observe(self, latency: float, alpha: float = 0.1):
+        self.latency = (
+            latency if self.latency == 0
+            else (1 - alpha) * self.latency + alpha * latency
+        )
+        # The baseline is the smoothed latency, so that a single fast
+        # response does not make all the others look slow.
+        self.min_latency = min(self.min_latency, self.latency)
+        healthy = self.latency <= self.latency_tolerance * self.min_latency
+        # Only raise the limit when it is reached, otherwise the limit
+        # grows without being tested.
+        reached = self.in_flight + 1 >= int(self.limit)
+        if self.adaptive and healthy and reached:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.updated = True
+
+    def decrease(self, now: float):
+        if not self.adaptive or now - self.last_decrease < self.latency:
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self.updated = True
+        logger.info(f"Provider is overloaded, decrease the concurrency to "
+                    f"{self.limit:.1f}.")
+
+
+CONCURRENCY_PATH = "cache/agent_concurrency.json"
+
+
+class ConcurrencyStore:
+    """
+    The learned concurrency limit of each model, persisted in a json file.
+    """
+
+    def __init__(self, path: str = CONCURRENCY_PATH):
+        self.path = path
+        self.limits: dict[str, float] = (
+            load_json(path) if osp.exists(path) else {}
+        )
+
+    def get(self, model: str) -> float | None:
+        return self.limits.get(model)
+
+    def put(self, model: str, limit: float):
+        self.limits[model] = round(limit, 2)
+        directory = osp.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        save_json_atomic(self.path, self.limits, indent=4)
@@ -0,0 +1,181 @@
+import re
+from time import sleep
+from datetime import datetime, timedelta, timezone
+
+import arxiv
+import requests
+
+from arxiver.config import Configs
+from arxiver.base.constants import ANNOUNCEMENT_TIMEZONE
+from arxiver.core.arxiv_client import create_client
+from arxiver.plugins.arxiv_feed_parser import announced_since, parse_feed
+from arxiver.utils.logging import create_logger
+
+
+logger = create_logger(__name__)
+
+
+# arXiv announces the new papers at 20:00 US/Eastern from Sunday to Thursday.
+ANNOUNCEMENT_HOUR = 20
+ANNOUNCEMENT_WEEKDAYS = (6, 0, 1, 2, 3)
+
+
+def next_announcement(now: datetime) -> datetime:
+    """
+    Returns the first scheduled announcement after `now`. Holidays are not
+    known, a missed announcement is handled by the backoff of the poller.
+    """
+    local = now.astimezone(ANNOUNCEMENT_TIMEZONE)
+    for days in range(8):
+        day = local.date() + timedelta(days=days)
+        announcement = datetime(
+            day.year, day.month, day.day, ANNOUNCEMENT_HOUR,
+            tzinfo=ANNOUNCEMENT_TIMEZONE)
+        if announcement > local and day.weekday() in ANNOUNCEMENT_WEEKDAYS:
+            return announcement.astimezone(timezone.utc)
+    raise RuntimeError(f"No announcement found after {now}.")
+
+
+class QueryProbe:
+    """
+    Request one result of the query, which is available once the papers of
+    the query are announced.
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.client = create_client(page_size=1, num_retries=3)
+
+    def __call__(self) -> bool:
+        search = arxiv.Search(query=self.query, max_results=1)
+        try:
+            return any(True for _ in self.client.results(search))
+        except (arxiv.HTTPError, arxiv.UnexpectedEmptyPageError) as e:
+            logger.warning(f"Failed to probe the query: {e}")
+            return False
+
+
+class FeedProbe:
+    """
+    Send a conditional request to the announcement feed of each category.
+    Unchanged feeds cost a `304 Not Modified` only. A feed is available once
+    it holds papers announced after `since`, i.e., the papers of the feed
+    are dated at the midnight following their announcement, so the previous
+    announcement is dated at `since` itself.
+    """
+
+    def __init__(self,
+                 categories: str,
+                 since: datetime,
+                 feed_url: str = "https://rss.arxiv.org/atom/{category}"):
+        self.categories = re.findall(r"cat:([\w.\-]+)", categories)
+        self.since = since
+        self.feed_url = feed_url
+        self.validators: dict[str, dict[str, str]] = {}
+        self.session = requests.Session()
+
+    def __call__(self) -> bool:
+        for category in self.categories:
+            url = self.feed_url.format(category=category)
+            try:
+                response = self.session.get(
+                    url, headers=self.validators.get(category, {}))
+            except requests.exceptions.ConnectionError as e:
+                logger.warning(f"Failed to probe {url}: {e}")
+                continue
+            if response.status_code != requests.codes.ok:
+                continue
+            self.validators[category] = {
+                key: response.headers[header]
+                for key, header in (("If-None-Match", "ETag"),
+                                    ("If-Modified-Since", "Last-Modified"))
+                if header in response.headers
+            }
+            if any(
+                    result.published > self.since
+                    for result, _ in parse_feed(response.content)):
+                return True
+        return False
+
+
+class AnnouncementPoller:
+    """
+    Probe arXiv until the new papers are available.
+
+    Right after a scheduled announcement the probe runs every `base_seconds`
+    and then backs off exponentially up to `max_seconds`, as announcements
+    are sometimes late. The poller never sleeps past the next scheduled
+    announcement, and the backoff is reset once it is passed.
+
+    Args:
+        probe: Returns True once the papers are available.
+        base_seconds: The first delay between two probes.
+        max_seconds: The maximum delay between two probes.
+        max_retries: Give up after this number of probes following the
+            first one.
+        grace_seconds: Seconds to wait after a scheduled announcement before
+            probing, the announcement takes a while to be served.
+    """
+
+    def __init__(self,
+                 probe,
+                 base_seconds: float,
+                 max_seconds: float,
+                 max_retries: int,
+                 grace_seconds: float = 120):
+        self.probe = probe
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.max_retries = max_retries
+        self.grace_seconds = grace_seconds
+
+    def delay(self, now: datetime, attempt: int) -> float:
+        backoff = min(self.base_seconds * 2 ** attempt, self.max_seconds)
+        announcement = next_announcement(now)
+        until_announcement = (
+            (announcement - now).total_seconds() + self.grace_seconds
+        )
+        return min(backoff, until_announcement)
+
+    def wait(self) -> bool:
+        attempt = 0
+        for idx in range(self.max_retries + 1):
+            if self.probe():
+                logger.info(f"New papers are available after {idx + 1} "
+                            f"probes.")
+                return True
+            if idx == self.max_retries:
+                break
+            now = datetime.now(timezone.utc)
+            delay = self.delay(now, attempt)
+            announcement = next_announcement(now)
+            # Poll at the base rate again once the next announcement passed.
+            if now + timedelta(seconds=delay) > announcement:
+                attempt = 0
+            else:
+                attempt += 1
+            logger.info(
+                f"Retry {idx + 1}/{self.max_retries}: no new papers, sleeping "
+                f"for {delay:.0f} seconds. Next scheduled announcement: "
+                f"{announcement.astimezone(ANNOUNCEMENT_TIMEZONE)}."
+            )
+            sleep(delay)
+        return False
+
+
+def create_poller(cfgs: Configs) -> AnnouncementPoller:
+    if cfgs.polling_mode == "query":
+        probe = QueryProbe(cfgs.query)
+    elif cfgs.polling_mode == "feed":
+        since = announced_since(cfgs.datetime)
+        if since is None:
+            raise ValueError(f"No end date in {cfgs.datetime}.")
+        probe = FeedProbe(cfgs.categories, since)
+    else:
+        raise ValueError(f"Unknown polling mode: {cfgs.polling_mode}")
+    return AnnouncementPoller(
+        probe,
+        base_seconds=cfgs.sleep_seconds,
+        max_seconds=cfgs.polling_max_sleep_seconds,
+        max_retries=cfgs.max_retries_num,
+    )
@@ -0,0 +1,169 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import os.path as osp
+from time import time
+
+from tabulate import tabulate
+
+from arxiver.utils.io import load_json
+from arxiver.utils.logging import create_logger
+
+
+logger = create_logger(__name__)
+
+
+class ResponseCache:
+    """
+    Persistent cache of the model responses in a SQLite database, keyed by
+    the hash of the request, see `cache_key`. It is safe to share between
+    threads and processes.
+
+    Args:
+        path: Path to the database.
+        max_entries: Evict the least recently used responses beyond this
+            number. If 0, the size is unlimited.
+        max_age_days: Responses older than this are treated as missing and
+            evicted. If 0, the responses never expire.
+        read_only: If True, the cache is only consulted and never written.
+        evict_every: Check the size limit every this number of writes.
+        cache_sampled: If True, the responses sampled with a positive
+            temperature are cached as well. Otherwise only the deterministic
+            ones are, since a cached sample would be returned by every run
+            instead of a new one.
+    """
+
+    def __init__(self,
+                 path: str = "cache/agent_responses.sqlite3",
+                 max_entries: int = 100000,
+                 max_age_days: float = 30,
+                 read_only: bool = False,
+                 evict_every: int = 100,
+                 cache_sampled: bool = False):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.read_only = read_only
+        self.evict_every = evict_every
+        self.cache_sampled = cache_sampled
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.lock = threading.Lock()
+        self.connection: sqlite3.Connection | None = None
+        if read_only:
+            if not osp.exists(path):
+                logger.warning(f"Response cache {path} does not exist.")
+                return
+            self.connection = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            return
+        directory = osp.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed "
+            "ON responses (accessed)"
+        )
+        self.connection.commit()
+
+    @classmethod
+    def from_config(cls) -> "ResponseCache | None":
+        path = __file__.replace("arxiver", "configs").replace(".py", ".json")
+        configs = load_json(path) if osp.exists(path) else {}
+        if not configs.pop("enabled", False):
+            return None
+        return cls(**configs)
+
+    def get(self, key: str) -> str | None:
+        if self.connection is None:
+            self.misses += 1
+            return None
+        now = time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT content, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            expired = (
+                row is not None and self.max_age
+                and now - row[1] > self.max_age
+            )
+            if expired:
+                if not self.read_only:
+                    self.connection.execute(
+                        "DELETE FROM responses WHERE key = ?", (key,))
+                    self.connection.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.read_only:
+                self.connection.execute(
+                    "UPDATE responses SET accessed = ? WHERE key = ?",
+                    (now, key))
+                self.connection.commit()
+        return row[0]
+
+    def put(self, key: str, content: str):
+        # Failed requests are returned as empty responses, which should be
+        # requested again instead of being cached.
+        if self.connection is None or self.read_only or not content:
+            return
+        now = time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, content, now, now))
+            self.writes += 1
+            if self.writes % self.evict_every == 0:
+                self.evict(now)
+            self.connection.commit()
+
+    def evict(self, now: float):
+        assert self.connection is not None
+        if self.max_age:
+            self.connection.execute(
+                "DELETE FROM responses WHERE created < ?",
+                (now - self.max_age,))
+        if self.max_entries:
+            self.connection.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+
+    def table(self) -> str:
+        total = self.hits + self.misses
+        header = ["Cache", "Hits", "Misses", "Writes", "Hit Rate"]
+        data = [
+            self.path, self.hits, self.misses, self.writes,
+            f"{self.hits / total:.1%}" if total else "-"
+        ]
+        return tabulate([data], headers=header, tablefmt="pretty")
+
+
+def cache_key(model: str,
+              endpoint: str,
+              model_kwargs: dict,
+              messages: list[dict]) -> str:
+    serialized = json.dumps(
+        {
+            "model": model,
+            "endpoint": endpoint,
+            "model_kwargs": model_kwargs,
+            "messages": messages,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return hashlib.sha256(serialized).hexdigest()
@@ -10,6 +10,8 @@ from arxiver.utils.io import load_json
 from arxiver.utils.logging import create_logger
 from arxiver.base.result import Result
 from arxiver.base.plugin import BasePlugin, GlobalPluginData
+from arxiver.core.polling import create_poller
+from arxiver.core.telemetry import plugin_scope
 from arxiver.plugins import get_plugin_cls
 
 
@@ -19,6 +21,13 @@ logger = create_logger(__name__)
 def forward_plugins(cfgs: Configs,
                     plugin_names: list[str],
                     plugins_configs: dict[str, dict] | None = None):
+    if cfgs.polling_mode:
+        # Run the plugins once the papers are announced, instead of running
+        # all of them again on empty results.
+        if not create_poller(cfgs).wait():
+            logger.warning("No new papers are announced, skip the plugins.")
+            return []
+        return forward_plugins_once(cfgs, plugin_names, plugins_configs)
     results = forward_plugins_once(cfgs, plugin_names, plugins_configs)
     for idx in range(cfgs.max_retries_num):
         if len(results):
@@ -38,21 +47,71 @@ def forward_plugins_once(
 
     global_plugin_data = GlobalPluginData()
     plugins = [get_plugin_cls(name) for name in plugin_names]
-    for cls, name in zip(plugins, plugin_names):
-        # first, inspect the arguments of the plugin
-        # find the argument from cfgs
-        args = prepare_plugins_args_from_configs(cfgs, plugin_names, cls)
-        if plugins_configs and name in plugins_configs:
-            args.update(plugins_configs[name])
-        str_args = "\n".join([f">>>> {k}: {v}" for k, v in args.items()])
-        logger.info(
-            f"Running plugin {cls.__name__} with following args:\n{str_args}"
-        )
-        plugin: BasePlugin = cls(**args)
-        results: list[Result] = plugin(results, global_plugin_data)
+    created: list[BasePlugin] = []
+    idx = 0
+    while idx < len(plugins):
+        plugin = create_plugin(
+            cfgs, plugin_names, plugins[idx], plugin_names[idx],
+            plugins_configs)
+        created.append(plugin)
+        idx += 1
+        if not plugin.stream_mode:
+            with plugin_scope(plugin.__class__.__name__):
+                results: list[Result] = plugin(results, global_plugin_data)
+            continue
+        # Feed the streamed pages through all the following streamable
+        # plugins, the rest of the plugins run on the collected results.
+        stage: list[BasePlugin] = [plugin]
+        while idx < len(plugins) and plugins[idx].streamable:
+            stage.append(create_plugin(
+                cfgs, plugin_names, plugins[idx], plugin_names[idx],
+                plugins_configs))
+            idx += 1
+        created.extend(stage[1:])
+        results = forward_stream(stage, results, global_plugin_data)
+    # All the plugins, including the savers, are finished, the progress of
+    # the sources can be persisted.
+    for plugin in created:
+        plugin.commit()
     return results
 
 
+def forward_stream(plugins: list[BasePlugin],
+                   results: list[Result],
+                   global_plugin_data: GlobalPluginData) -> list[Result]:
+    head, *tail = plugins
+    streamed: list[Result] = []
+    with plugin_scope(head.__class__.__name__):
+        for page in head.stream(results, global_plugin_data):
+            for plugin in tail:
+                with plugin_scope(plugin.__class__.__name__):
+                    page = plugin(page, global_plugin_data)
+            streamed.extend(page)
+    logger.info(
+        f"Streamed {len(streamed)} results through "
+        f"{', '.join(p.__class__.__name__ for p in plugins)}."
+    )
+    return streamed
+
+
+def create_plugin(cfgs: Configs,
+                  plugin_names: list[str],
+                  cls,
+                  name: str,
+                  plugins_configs: dict[str, dict] | None = None):
+    # first, inspect the arguments of the plugin
+    # find the argument from cfgs
+    args = prepare_plugins_args_from_configs(cfgs, plugin_names, cls)
+    if plugins_configs and name in plugins_configs:
+        args.update(plugins_configs[name])
+    str_args = "\n".join([f">>>> {k}: {v}" for k, v in args.items()])
+    logger.info(
+        f"Running plugin {cls.__name__} with following args:\n{str_args}"
+    )
+    plugin: BasePlugin = cls(**args)
+    return plugin
+
+
 def prepare_plugins_args_from_configs(
         cfgs: Configs, plugin_names: list[str], cls):
     signature = inspect.signature(cls)
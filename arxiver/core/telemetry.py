@@ -0,0 +1,147 @@
+import os
+import json
+import threading
+import os.path as osp
+from time import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+
+from tabulate import tabulate
+
+from arxiver.utils.logging import create_logger
+
+
+logger = create_logger(__name__)
+
+
+# The plugin running at the moment, set by `plugin_scope`. The context is
+# copied into the event loop of `asyncio.run`, so the concurrent requests are
+# attributed to the plugin as well.
+CURRENT_PLUGIN: ContextVar[str] = ContextVar("CURRENT_PLUGIN", default="")
+
+
+@dataclass
+class CallRecord:
+    """
+    One completion requested through an agent.
+
+    Args:
+        model: The model of the agent, e.g., the name of a pool.
+        provider: The model which served the request.
+        plugin: The plugin running when the request was made.
+        mode: One of "single", "concurrent" and "batch".
+        outcome: One of "success", "failure", "cached" and "coalesced",
+            i.e., shared the response of an identical request in flight.
+        prompt_tokens: Reported by the provider, or estimated if `estimated`.
+        completion_tokens: Reported by the provider, or estimated if
+            `estimated`.
+        cached_tokens: The prompt tokens served from the prompt cache of
+            the provider, if reported.
+        latency: Seconds until the response, including the retries. The
+            items of a batch share the latency of the batch.
+        attempts: Number of the requests sent, including the retries and
+            the failovers to other providers.
+        cost: Computed with the prices of the request setting of the model.
+        estimated: True if the provider did not report the usage, e.g., for
+            the streamed responses.
+    """
+    model: str
+    provider: str = ""
+    plugin: str = field(default_factory=CURRENT_PLUGIN.get)
+    mode: str = "single"
+    outcome: str = "success"
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    latency: float = 0
+    attempts: int = 0
+    cost: float = 0
+    estimated: bool = False
+    timestamp: float = field(default_factory=time)
+
+
+class Telemetry:
+    """
+    Collect the records of the agent calls of a run. It is safe to share
+    between threads.
+    """
+
+    def __init__(self):
+        self.records: list[CallRecord] = []
+        self.lock = threading.Lock()
+        self.run_id = str(int(time()))
+
+    def add(self, record: CallRecord):
+        with self.lock:
+            self.records.append(record)
+
+    def table(self) -> str:
+        groups: dict[tuple[str, str], list[CallRecord]] = {}
+        with self.lock:
+            for record in self.records:
+                groups.setdefault(
+                    (record.plugin, record.model), []).append(record)
+        header = [
+            "Plugin", "Model", "Calls", "Cached", "Coalesced", "Failed",
+            "Retries",
+            "Prompt Tokens", "Cached Prompt (%)", "Completion Tokens",
+            "Mean Latency (s)", "Max Latency (s)", "Cost"
+        ]
+        data = []
+        for (plugin, model), records in groups.items():
+            requested = [
+                r for r in records if r.outcome not in ("cached", "coalesced")
+            ]
+            latencies = [r.latency for r in requested] or [0]
+            prompt_tokens = sum(r.prompt_tokens for r in records)
+            cached_tokens = sum(r.cached_tokens for r in records)
+            data.append([
+                plugin or "-", model, len(records),
+                sum(r.outcome == "cached" for r in records),
+                sum(r.outcome == "coalesced" for r in records),
+                sum(r.outcome == "failure" for r in records),
+                sum(max(r.attempts - 1, 0) for r in records),
+                prompt_tokens,
+                f"{100 * cached_tokens / max(prompt_tokens, 1):.1f}",
+                sum(r.completion_tokens for r in records),
+                f"{sum(latencies) / len(latencies):.2f}",
+                f"{max(latencies):.2f}",
+                f"{sum(r.cost for r in records):.4f}",
+            ])
+        return tabulate(data, headers=header, tablefmt="pretty")
+
+    def save(self, path: str):
+        """
+        Append the records to a JSONL file, each line is a record with the
+        id of the run.
+        """
+        directory = osp.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.lock, open(path, "a", encoding="utf-8") as fp:
+            for record in self.records:
+                item = {"run_id": self.run_id, **asdict(record)}
+                fp.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+    def report(self, output_directory: str,
+               file_name: str = "agent_telemetry.jsonl"):
+        if not self.records:
+            return
+        path = osp.join(output_directory, file_name)
+        self.save(path)
+        logger.info(f"Agent telemetry is saved to {path}:\n{self.table()}")
+
+
+# All the agents of the process record into one telemetry, reported at the
+# end of the run.
+TELEMETRY = Telemetry()
+
+
+@contextmanager
+def plugin_scope(name: str):
+    token = CURRENT_PLUGIN.set(name)
+    try:
+        yield
+    finally:
+        CURRENT_PLUGIN.reset(token)
@@ -2,6 +2,7 @@
 from arxiver.config import parse_cfgs
 from arxiver.utils.logging import create_logger
 from arxiver.core.run import forward_plugins, get_class_config_file_path
+from arxiver.core.telemetry import TELEMETRY
 from arxiver.pipelines import get_pipeline_cls
 
 logger = create_logger(__name__)
@@ -21,6 +22,7 @@ def main():
     else:
         plugin_names = cfgs.plugins
         forward_plugins(cfgs, plugin_names)
+    TELEMETRY.report(cfgs.output_directory)
 
 
 if __name__ == '__main__':
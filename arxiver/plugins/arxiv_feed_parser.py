@@ -0,0 +1,218 @@
+import re
+import os
+import os.path as osp
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from dataclasses import dataclass
+
+import requests
+
+from arxiver.base.result import Result
+from arxiver.base.constants import ANNOUNCEMENT_TIMEZONE
+from arxiver.utils.io import load_json, save_json_atomic
+from arxiver.utils.logging import create_logger
+from arxiver.base.plugin import BasePlugin, BasePluginData, GlobalPluginData
+from arxiver.plugins.arxiv_parser import search_by_id_list
+
+
+logger = create_logger(__name__)
+
+
+FEED_NAMESPACES = {
+    "atom": "http://www.w3.org/2005/Atom",
+    "arxiv": "http://arxiv.org/schemas/atom",
+    "dc": "http://purl.org/dc/elements/1.1/",
+}
+
+
+def plugin_name():
+    return "ArxivFeedParser"
+
+
+@dataclass
+class ArxivFeedParserData(BasePluginData):
+    plugin_name: str = plugin_name()
+
+
+class ArxivFeedParser(BasePlugin):
+    """
+    Request the latest announced papers from the daily announcement feed of
+    each category. It takes one conditional request per category, so
+    polling the feed during the announcement delays is cheap. The fields
+    missing in the feed, e.g., comments and journal references, are then
+    requested from the search API in batched `id_list` calls.
+
+    The feed only holds the latest announcement. It is only kept once it
+    holds the papers of the date range of the configs, see
+    `announced_since`, so that a late announcement yields no results, and
+    the run is retried, instead of the papers of the previous one.
+
+    Args:
+        categories: Categories to request, e.g., "(cat:cs.CV OR cat:cs.AI)".
+        datetime: The date range of the configs, e.g.,
+            "lastUpdatedDate:[202410140000 TO 202410150000]". If empty, the
+            latest announcement is kept whatever its date.
+        feed_url: Url of the feed, `{category}` is replaced by the category.
+        announce_types: Only keep the papers of these announce types, e.g.,
+            "new", "cross", "replace" and "replace-cross".
+        state_file: The json file keeping the ETag and Last-Modified headers
+            of the feeds for the conditional requests, and the feeds
+            themselves, which are parsed again when they are not modified,
+            e.g., when a run is repeated or fails after the request.
+        complete_from_api: If True, request the fields missing in the feed
+            from the search API.
+        id_list_size: Number of papers requested by each `id_list` call.
+    """
+
+    def __init__(self,
+                 categories: str,
+                 datetime: str = "",
+                 feed_url: str = "https://rss.arxiv.org/atom/{category}",
+                 announce_types: list[str] | None = None,
+                 state_file: str = "outputs/arxiv_feed_state.json",
+                 complete_from_api: bool = True,
+                 id_list_size: int = 100):
+        self.categories = re.findall(r"cat:([\w.\-]+)", categories)
+        self.since = announced_since(datetime)
+        self.feed_url = feed_url
+        self.announce_types = announce_types or ["new", "cross"]
+        self.state_file = state_file
+        self.state: dict[str, dict] = (
+            load_json(state_file) if osp.exists(state_file) else {}
+        )
+        self.complete_from_api = complete_from_api
+        self.id_list_size = id_list_size
+        self.session = requests.Session()
+
+    def process(self,
+                results: list[Result],
+                global_plugin_data: GlobalPluginData) -> list[Result]:
+        feed_results: dict[str, Result] = {}
+        for category in self.categories:
+            for result in self.request_feed(category):
+                feed_results.setdefault(short_id(result.entry_id), result)
+        logger.info(f"Get {len(feed_results)} items from the feeds.")
+        if self.complete_from_api and len(feed_results):
+            api_results = {
+                short_id(r.entry_id): r for r in search_by_id_list(
+                    list(feed_results.keys()), self.id_list_size)
+            }
+            for key in feed_results.keys():
+                if key in api_results:
+                    feed_results[key] = api_results[key]
+                else:
+                    logger.warning(f"Failed to complete {key} from the API.")
+        return list(feed_results.values())
+
+    def request_feed(self, category: str) -> list[Result]:
+        url = self.feed_url.format(category=category)
+        state = self.state.get(category, {})
+        headers = {}
+        # Without the kept feed, a `304 Not Modified` could not be served.
+        if state.get("feed"):
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+        response = self.session.get(url, headers=headers)
+        if response.status_code == requests.codes.not_modified:
+            logger.info(f"Feed of {category} is not modified since last "
+                        f"run, parse the kept feed.")
+            content = state["feed"].encode("utf-8")
+        else:
+            response.raise_for_status()
+            content = response.content
+            self.save_state(category, {
+                "etag": response.headers.get("ETag", ""),
+                "last_modified": response.headers.get("Last-Modified", ""),
+                "feed": content.decode("utf-8"),
+            })
+        results = [
+            result for result, announce_type in parse_feed(content)
+            if announce_type in self.announce_types
+        ]
+        if self.since is not None:
+            since = self.since
+            announced = [r for r in results if r.published > since]
+            if len(announced) < len(results):
+                logger.info(f"Skip {len(results) - len(announced)} items of "
+                            f"the feed of {category} announced before "
+                            f"{since.date()}.")
+            results = announced
+        logger.info(f"Get {len(results)} items from the feed of {category}.")
+        return results
+
+    def save_state(self, category: str, state: dict):
+        self.state[category] = state
+        directory = osp.dirname(self.state_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        save_json_atomic(self.state_file, self.state, indent=4)
+
+
+def announced_since(date_range: str | None) -> datetime | None:
+    """
+    Returns the date of the papers of the announcement before the one of
+    `date_range`, None if the range has no end. The papers updated until the
+    end of the range are announced in the evening of that day, dated at the
+    next midnight, so the previous announcement is dated at the end itself.
+    """
+    match = re.search(r"TO (\d{8})", date_range or "")
+    if match is None:
+        return None
+    return datetime.strptime(match.group(1), "%Y%m%d").replace(
+        tzinfo=ANNOUNCEMENT_TIMEZONE)
+
+
+def short_id(entry_id: str) -> str:
+    return entry_id.split("/abs/")[-1]
+
+
+def parse_feed(content: bytes) -> list[tuple[Result, str]]:
+    """
+    Returns the papers of the announcement feed and their announce types.
+    """
+    root = ET.fromstring(content)
+    items = []
+    for entry in root.iterfind("atom:entry", FEED_NAMESPACES):
+        def text(path: str) -> str:
+            return (entry.findtext(path, "", FEED_NAMESPACES) or "").strip()
+
+        # The ids look like "oai:arXiv.org:2410.12345v1".
+        arxiv_id = text("atom:id").split(":")[-1]
+        entry_id = f"http://arxiv.org/abs/{arxiv_id}"
+        # The summaries look like
+        # "arXiv:2410.12345v1 Announce Type: new \nAbstract: ...".
+        summary = re.sub(
+            r"^arXiv:\S+\s+Announce Type:\s*\S+\s*Abstract:\s*", "",
+            text("atom:summary"))
+        categories = [
+            c.get("term", "")
+            for c in entry.iterfind("atom:category", FEED_NAMESPACES)
+        ]
+        authors = [
+            Result.Author(name.strip())
+            for name in text("dc:creator").split(",") if name.strip()
+        ]
+        published = datetime.fromisoformat(text("atom:published"))
+        links = [
+            Result.Link(entry_id, rel="alternate", content_type="text/html"),
+            Result.Link(entry_id.replace("abs", "pdf"), title="pdf",
+                        rel="related", content_type="application/pdf"),
+        ]
+        result = Result(
+            entry_id=entry_id,
+            updated=published,
+            published=published,
+            title=" ".join(text("atom:title").split()),
+            authors=authors,
+            summary=summary,
+            comment=None,
+            journal_ref=None,
+            doi=None,
+            primary_category=categories[0] if categories else "",
+            categories=categories,
+            links=links,
+        )
+        items.append((result, text("arxiv:announce_type")))
+    return items
@@ -1,9 +1,16 @@
 
+import re
 import os.path as osp
+from datetime import datetime, timedelta, timezone
 from dataclasses import dataclass
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import arxiv
 from arxiver.base.result import Result
+from arxiver.core.arxiv_client import (
+    PageCache, WatermarkStore, create_client
+)
 from arxiver.utils.io import load_json
 from arxiver.utils.logging import create_logger
 from arxiver.base.plugin import BasePluginData, GlobalPluginData, BasePlugin
@@ -24,37 +31,182 @@ class ArxivParserFromJsonFileData(BasePluginData):
 
 
 class ArxivParser(BasePlugin):
-    def __init__(self, query: str):
+    """
+    Request papers from arXiv.
+
+    Args:
+        query: The query string directly used in arxiv search.
+        stream_mode: If True, the results are yielded page by page so that
+            the following streamable plugins can start on the first page
+            while the later pages are still being downloaded.
+        page_size: Number of results requested per page.
+        shard_window: Split the date range of the query into sub-queries of
+            one "day" or one "hour". Leave it empty to not split.
+        shard_categories: If True, split the categories of the query into
+            one sub-query per category.
+        max_workers: Number of sub-queries running concurrently. All of them
+            share the same arXiv rate limit.
+        page_cache_directory: Where to cache the raw feed pages, so that a
+            retry resumes from the first missing page. Leave it empty to
+            disable the cache.
+        page_cache_ttl: Seconds before a cached page expires.
+        native_decoder: If True, the feed pages are decoded into `Result`
+            directly instead of through the `arxiv` library.
+        incremental_mode: If True, only request the entries updated after
+            the watermark of each category, i.e., the highest `updated`
+            timestamp seen by the previous runs. The date range of the query
+            is only used for the categories without a watermark. The
+            watermarks are only advanced once the run is finished, see
+            `commit`.
+        watermark_file: The json file keeping the watermarks.
+    """
+
+    def __init__(self,
+                 query: str,
+                 stream_mode: bool = False,
+                 page_size: int = 100,
+                 shard_window: str = "",
+                 shard_categories: bool = False,
+                 max_workers: int = 4,
+                 page_cache_directory: str = "",
+                 page_cache_ttl: float = 21600,
+                 native_decoder: bool = False,
+                 incremental_mode: bool = False,
+                 watermark_file: str = "outputs/arxiv_watermarks.json"):
         self.query = query
+        self.stream_mode = stream_mode
+        self.page_size = page_size
+        self.shard_window = shard_window
+        self.shard_categories = shard_categories
+        self.max_workers = max_workers
+        self.page_cache = (
+            PageCache(page_cache_directory, page_cache_ttl)
+            if page_cache_directory else None
+        )
+        self.native_decoder = native_decoder
+        self.incremental_mode = incremental_mode
+        self.watermarks = WatermarkStore(watermark_file)
+        # The latest `updated` timestamp of each category and the ids of its
+        # entries, advanced by `commit`.
+        self.pending_watermarks: dict[str, tuple[datetime, set[str]]] = {}
 
     def process(self,
                 results: list[Result],
                 global_plugin_data: GlobalPluginData) -> list[Result]:
-        return search(self.query)
+        if self.incremental_mode:
+            return [r for page in self.search_incrementally() for r in page]
+        queries = plan_queries(
+            self.query, self.shard_window, self.shard_categories)
+        if len(queries) == 1:
+            return search(self.query, self.page_cache, self.native_decoder)
+        results = [
+            r for page in search_concurrently(
+                queries, self.page_size, self.max_workers, self.page_cache,
+                self.native_decoder)
+            for r in page
+        ]
+        return sorted(results, key=lambda r: r.updated, reverse=True)
+
+    def stream(self,
+               results: list[Result],
+               global_plugin_data: GlobalPluginData) -> Iterator[list[Result]]:
+        if self.incremental_mode:
+            return self.search_incrementally()
+        queries = plan_queries(
+            self.query, self.shard_window, self.shard_categories)
+        if len(queries) == 1:
+            return iter_search(self.query, self.page_size, self.page_cache,
+                               self.native_decoder)
+        return search_concurrently(
+            queries, self.page_size, self.max_workers, self.page_cache,
+            self.native_decoder)
+
+    def commit(self):
+        for category, (latest, ids) in self.pending_watermarks.items():
+            self.watermarks.advance(category, latest, ids)
+        self.pending_watermarks = {}
+
+    def search_incrementally(self) -> Iterator[list[Result]]:
+        now = datetime.now(timezone.utc)
+        seen: set[str] = set()
+        for category, query in split_categories_of_query(self.query).items():
+            watermark = self.watermarks.get(category)
+            # The entries updated at the watermark are requested again, the
+            # ones seen by the previous runs are told apart by their ids.
+            seen_at_watermark = self.watermarks.seen(category)
+            if watermark is not None:
+                query = replace_date_range(query, watermark, now)
+            logger.info(f"Requesting {category!r} since {watermark}: {query}")
+            latest, latest_ids = watermark, set(seen_at_watermark)
+            # No new entry since the watermark is expected, e.g., on the
+            # weekends, so an empty result is not requested again.
+            for page in iter_search(query, self.page_size, self.page_cache,
+                                    self.native_decoder, num_empty_retries=0):
+                new_results = []
+                for result in page:
+                    if latest is None or result.updated > latest:
+                        latest, latest_ids = result.updated, set()
+                    if result.updated == latest:
+                        latest_ids.add(result.entry_id)
+                    if watermark is not None and (
+                            result.updated < watermark
+                            or (result.updated == watermark
+                                and result.entry_id in seen_at_watermark)):
+                        continue
+                    # Papers cross-listed in several categories are only
+                    # yielded once.
+                    if result.get_short_id() in seen:
+                        continue
+                    seen.add(result.get_short_id())
+                    new_results.append(result)
+                if len(new_results):
+                    yield new_results
+            # Only advance the watermark once all the entries of the
+            # category are requested, and the run is finished.
+            if latest is not None:
+                self.pending_watermarks[category] = (latest, latest_ids)
 
 
 class ArxivParserFromJsonFile(BasePlugin):
-    def __init__(self, json_file: str, *args, **kwargs) -> None:
+    """
+    Request the papers listed in a json file from arXiv.
+
+    Args:
+        json_file: The json file listing the papers, see `download.json`.
+        id_list_size: Number of papers requested by each `id_list` call.
+        max_workers: Number of `id_list` calls running concurrently. All of
+            them share the same arXiv rate limit.
+    """
+
+    def __init__(self,
+                 json_file: str,
+                 id_list_size: int = 100,
+                 max_workers: int = 4,
+                 *args,
+                 **kwargs) -> None:
         super().__init__(*args, **kwargs)
         json_file = osp.abspath(json_file)
         if not osp.exists(json_file):
             raise FileNotFoundError(f"{json_file} does not exist.")
         self.json_file = json_file
+        self.id_list_size = id_list_size
+        self.max_workers = max_workers
 
     def process(self,
                 results: list[Result],
                 global_plugin_data: GlobalPluginData) -> list[Result]:
         metainfo: list[dict] = load_json(self.json_file)  # type: ignore
         self.check_metas(metainfo)
-        queries = [f"id:{item['id']}" for item in metainfo]
-        results = search(" OR ".join(queries))
-        results = [Result.create_from_arxiv_result(r) for r in results]
+        # Items with a specified version are matched by both the id and the
+        # version, the others are matched by the id only.
+        items = {item["id"] + item["version"]: item for item in metainfo}
+        results = search_by_id_list(
+            list(items.keys()), self.id_list_size, self.max_workers)
         for result in results:
-            item_of_result = None
-            for item in metainfo:
-                if item["id"] in result.entry_id:
-                    item_of_result = item
-                    break
+            arxiv_id, version = parse_arxiv_id(result.entry_id)
+            item_of_result = (
+                items.get(arxiv_id + version) or items.get(arxiv_id)
+            )
             if item_of_result is None:
                 logger.warning(f"Item not found for {result.entry_id}")
                 continue
@@ -71,23 +223,265 @@ class ArxivParserFromJsonFile(BasePlugin):
                 raise ValueError(f"Tags not found in {item}.")
             if "category" not in item:
                 raise ValueError(f"Category not found in {item}.")
-            link: str = item["link"]
-            item["id"] = link.split("/")[-1].split("v")[0]
-            item["version"] = "v" + link.split("/")[-1].split("v")[-1] or "1"
+            item["id"], item["version"] = parse_arxiv_id(item["link"])
             logger.debug(f"Check item: {item}")
 
 
-def search(query: str) -> list[Result]:
+def search(query: str,
+           page_cache: PageCache | None = None,
+           native_decoder: bool = False) -> list[Result]:
     results = []
-    client = arxiv.Client(num_retries=10, delay_seconds=3)
+    client = create_client(
+        num_retries=10, page_cache=page_cache, native_decoder=native_decoder)
     for i in range(10):
         search = arxiv.Search(query=query,
                               sort_by=arxiv.SortCriterion.LastUpdatedDate,
                               max_results=10000)
-        results = list(client.results(search))
+        try:
+            results = list(client.results(search))
+        except (arxiv.HTTPError, arxiv.UnexpectedEmptyPageError) as e:
+            # The pages downloaded so far are cached, so the next try
+            # resumes from the first missing page.
+            logger.warning(f"Failed to get all the items, retrying.\n{e}")
+            results = []
+            continue
         logger.info(f"Get {len(results)} items.")
         if len(results):
             logger.info(f"Range: {results[-1].updated} {results[0].updated}")
             break
-    results = [Result.create_from_arxiv_result(r) for r in results]
+    results = [to_result(r) for r in results]
+    return results
+
+
+def iter_search(query: str,
+                page_size: int = 100,
+                page_cache: PageCache | None = None,
+                native_decoder: bool = False,
+                num_empty_retries: int = 10) -> Iterator[list[Result]]:
+    """
+    Yield the results of the query page by page. Like `search`, the query is
+    requested again while it returns nothing, up to `num_empty_retries`
+    times, since arXiv sometimes returns an empty feed for a valid query.
+    Once a page is yielded, the errors are raised instead, and the page
+    cache lets the next run resume from the first missing page.
+    """
+    client = create_client(
+        page_size=page_size, num_retries=10, page_cache=page_cache,
+        native_decoder=native_decoder)
+    num_results = 0
+    for i in range(num_empty_retries + 1):
+        search = arxiv.Search(query=query,
+                              sort_by=arxiv.SortCriterion.LastUpdatedDate,
+                              max_results=10000)
+        page: list[Result] = []
+        try:
+            for r in client.results(search):
+                page.append(to_result(r))
+                if len(page) == page_size:
+                    num_results += len(page)
+                    logger.info(f"Get {num_results} items so far.")
+                    yield page
+                    page = []
+        except (arxiv.HTTPError, arxiv.UnexpectedEmptyPageError) as e:
+            if num_results:
+                raise
+            logger.warning(f"Failed to get the items, retrying.\n{e}")
+            continue
+        if len(page):
+            num_results += len(page)
+            yield page
+        if num_results or i == num_empty_retries:
+            break
+        logger.info(f"Get no items, retry {i + 1}/{num_empty_retries}.")
+    logger.info(f"Get {num_results} items.")
+
+
+def search_concurrently(
+        queries: list[str],
+        page_size: int = 100,
+        max_workers: int = 4,
+        page_cache: PageCache | None = None,
+        native_decoder: bool = False) -> Iterator[list[Result]]:
+    """
+    Run the sub-queries concurrently and yield the results of each sub-query
+    once it is finished. Results are deduplicated by arXiv id and version.
+    """
+    seen: set[str] = set()
+    num_results = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(search_shard, query, page_size, page_cache,
+                            native_decoder): query
+            for query in queries
+        }
+        for idx, future in enumerate(as_completed(futures)):
+            query = futures[future]
+            page = []
+            for result in future.result():
+                short_id = result.get_short_id()
+                if short_id in seen:
+                    continue
+                seen.add(short_id)
+                page.append(result)
+            num_results += len(page)
+            logger.info(
+                f"Finished {idx + 1}/{len(queries)} sub-queries, get "
+                f"{len(page)} new items from {query}. "
+                f"{num_results} items in total."
+            )
+            if len(page):
+                yield page
+
+
+def search_shard(query: str,
+                 page_size: int = 100,
+                 page_cache: PageCache | None = None,
+                 native_decoder: bool = False,
+                 max_results: int = 10000) -> list[Result]:
+    client = create_client(
+        page_size=page_size, num_retries=10, page_cache=page_cache,
+        native_decoder=native_decoder)
+    search = arxiv.Search(query=query,
+                          sort_by=arxiv.SortCriterion.LastUpdatedDate,
+                          max_results=max_results)
+    results = [to_result(r) for r in client.results(search)]
+    if len(results) >= max_results:
+        logger.warning(
+            f"Sub-query {query} reaches the limit of {max_results} results, "
+            f"the results may be truncated. Please use a smaller window."
+        )
+    return results
+
+
+def search_by_id_list(ids: list[str],
+                      id_list_size: int = 100,
+                      max_workers: int = 4,
+                      page_cache: PageCache | None = None,
+                      native_decoder: bool = False) -> list[Result]:
+    """
+    Request the papers by their ids. The ids are requested by chunks of
+    `id_list_size` and the chunks are requested concurrently.
+    """
+    chunks = [
+        ids[i:i + id_list_size] for i in range(0, len(ids), id_list_size)
+    ]
+
+    def request(id_list: list[str]) -> list[Result]:
+        client = create_client(
+            page_size=len(id_list), num_retries=10, page_cache=page_cache,
+            native_decoder=native_decoder)
+        search = arxiv.Search(id_list=id_list, max_results=len(id_list))
+        return [to_result(r) for r in client.results(search)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pages = list(executor.map(request, chunks))
+    results = [r for page in pages for r in page]
+    logger.info(f"Get {len(results)} items of {len(ids)} ids.")
     return results
+
+
+ARXIV_ID_PATTERN = re.compile(
+    r"(\d{4}\.\d{4,5}|[a-z\-]+(?:\.[A-Z]{2})?/\d{7})(v\d+)?")
+
+
+def parse_arxiv_id(text: str) -> tuple[str, str]:
+    """
+    Returns the arXiv id and the version, e.g.,
+    "https://arxiv.org/abs/2410.08209v1" -> ("2410.08209", "v1"). The version
+    is empty if not specified.
+    """
+    match = ARXIV_ID_PATTERN.search(text)
+    if match is None:
+        raise ValueError(f"Invalid arXiv id: {text}")
+    return match.group(1), match.group(2) or ""
+
+
+def to_result(result: arxiv.Result) -> Result:
+    # The native decoder already produces `Result`, avoid copying it again.
+    if isinstance(result, Result):
+        return result
+    return Result.create_from_arxiv_result(result)
+
+
+DATE_RANGE_PATTERN = re.compile(
+    r"(lastUpdatedDate|submittedDate):\[(\d{8,12}) TO (\d{8,12})\]")
+CATEGORIES_PATTERN = re.compile(
+    r"\(\s*cat:[\w.\-]+(?:\s+OR\s+cat:[\w.\-]+)*\s*\)")
+
+
+def plan_queries(query: str,
+                 window: str = "",
+                 split_categories: bool = False) -> list[str]:
+    """
+    Split the query into sub-queries by time windows and categories.
+
+    Examples:
+        >>> for sub_query in plan_queries(
+        ...         "(cat:cs.CV OR cat:cs.LG) AND "
+        ...         "lastUpdatedDate:[202101010000 TO 202101030000]",
+        ...         window="day", split_categories=True):
+        ...     print(sub_query)
+        cat:cs.CV AND lastUpdatedDate:[202101010000 TO 202101020000]
+        cat:cs.CV AND lastUpdatedDate:[202101020000 TO 202101030000]
+        cat:cs.LG AND lastUpdatedDate:[202101010000 TO 202101020000]
+        cat:cs.LG AND lastUpdatedDate:[202101020000 TO 202101030000]
+    """
+    queries = [query]
+    if split_categories:
+        queries = list(split_categories_of_query(query).values())
+    if window:
+        queries = [
+            sub_query
+            for query in queries
+            for sub_query in split_date_range(query, window)
+        ]
+    logger.info(f"Split the query into {len(queries)} sub-queries.")
+    return queries
+
+
+def split_categories_of_query(query: str) -> dict[str, str]:
+    """
+    Returns a dict mapping each category of the query to the sub-query only
+    requesting that category.
+    """
+    match = CATEGORIES_PATTERN.search(query)
+    if match is None:
+        categories = re.findall(r"cat:[\w.\-]+", query)
+        if len(categories) == 1:
+            return {categories[0]: query}
+        return {"": query}
+    categories = re.findall(r"cat:[\w.\-]+", match.group(0))
+    return {
+        category: query[:match.start()] + category + query[match.end():]
+        for category in categories
+    }
+
+
+def replace_date_range(query: str, start: datetime, end: datetime) -> str:
+    match = DATE_RANGE_PATTERN.search(query)
+    field_name = match.group(1) if match else "lastUpdatedDate"
+    date_range = (
+        f"{field_name}:[{start.strftime('%Y%m%d%H%M')} "
+        f"TO {end.strftime('%Y%m%d%H%M')}]"
+    )
+    if match is None:
+        return f"{query} AND {date_range}"
+    return query[:match.start()] + date_range + query[match.end():]
+
+
+def split_date_range(query: str, window: str) -> list[str]:
+    steps = {"day": timedelta(days=1), "hour": timedelta(hours=1)}
+    if window not in steps:
+        raise ValueError(f"Unknown window {window}, expect one of {steps}.")
+    match = DATE_RANGE_PATTERN.search(query)
+    if match is None:
+        return [query]
+    _, start, end = match.groups()
+    start = datetime.strptime(start.ljust(12, "0"), "%Y%m%d%H%M")
+    end = datetime.strptime(end.ljust(12, "0"), "%Y%m%d%H%M")
+    queries = []
+    while start < end:
+        stop = min(start + steps[window], end)
+        queries.append(replace_date_range(query, start, stop))
+        start = stop
+    return queries
@@ -0,0 +1,213 @@
+import re
+import json
+import os.path as osp
+from collections import deque
+from datetime import datetime
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from multiprocessing import Pool
+from typing import Iterator
+
+from arxiver.base.result import Result
+from arxiver.base.constants import ANNOUNCEMENT_TIMEZONE
+from arxiver.utils.logging import create_logger
+from arxiver.base.plugin import BasePlugin, BasePluginData, GlobalPluginData
+from arxiver.plugins.arxiv_parser import DATE_RANGE_PATTERN
+
+
+logger = create_logger(__name__)
+
+
+def plugin_name():
+    return "ArxivSnapshotLoader"
+
+
+@dataclass
+class ArxivSnapshotLoaderData(BasePluginData):
+    plugin_name: str = plugin_name()
+
+
+class ArxivSnapshotLoader(BasePlugin):
+    """
+    Load papers from the arXiv metadata snapshot, a json-lines dump of all
+    the arXiv papers, without any network request.
+
+    The dump is read chunk by chunk and the chunks are decoded and filtered
+    by worker processes, so the memory is bounded by the chunk size and the
+    number of workers instead of the size of the dump.
+
+    Args:
+        snapshot_path: Path to the snapshot, e.g.,
+            `arxiv-metadata-oai-snapshot.json`.
+        categories: Only keep the papers of these categories, e.g.,
+            "(cat:cs.CV OR cat:cs.AI)". Leave it empty to keep all the papers.
+        date_from: Only keep the papers updated since this date
+            (YYYY-MM-DD). If empty, the start of the date range of `query`
+            is used.
+        date_until: Only keep the papers updated until this date
+            (YYYY-MM-DD). If empty, the end of the date range of `query` is
+            used.
+        query: The arxiv query, only used to get the default date range.
+        num_workers: Number of worker processes decoding the dump. If 0, the
+            dump is decoded in the current process.
+        chunk_size: Number of lines of each chunk sent to the workers.
+        stream_mode: If True, the papers are yielded chunk by chunk.
+    """
+
+    def __init__(self,
+                 snapshot_path: str,
+                 categories: str = "",
+                 date_from: str = "",
+                 date_until: str = "",
+                 query: str = "",
+                 num_workers: int = 4,
+                 chunk_size: int = 10000,
+                 stream_mode: bool = False):
+        if not osp.exists(snapshot_path):
+            raise FileNotFoundError(f"{snapshot_path} does not exist.")
+        self.snapshot_path = snapshot_path
+        self.categories = re.findall(r"cat:([\w.\-]+)", categories)
+        match = DATE_RANGE_PATTERN.search(query)
+        if match is not None:
+            _, start, end = match.groups()
+            date_from = date_from or format_date(start)
+            date_until = date_until or format_date(end)
+        self.date_from = date_from
+        self.date_until = date_until
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.stream_mode = stream_mode
+
+    def process(self,
+                results: list[Result],
+                global_plugin_data: GlobalPluginData) -> list[Result]:
+        return [r for page in self.load() for r in page]
+
+    def stream(self,
+               results: list[Result],
+               global_plugin_data: GlobalPluginData) -> Iterator[list[Result]]:
+        return self.load()
+
+    def load(self) -> Iterator[list[Result]]:
+        logger.info(
+            f"Loading papers of {self.categories or 'all categories'} "
+            f"updated from {self.date_from or '-'} to "
+            f"{self.date_until or '-'} from {self.snapshot_path}"
+        )
+        args = (self.categories, self.date_from, self.date_until)
+        num_results = 0
+        for items in self.decode_chunks(args):
+            page = [create_from_snapshot(item) for item in items]
+            num_results += len(page)
+            if len(page):
+                yield page
+        logger.info(f"Loaded {num_results} papers from the snapshot.")
+
+    def decode_chunks(self, args: tuple) -> Iterator[list[dict]]:
+        chunks = iter_chunks(self.snapshot_path, self.chunk_size)
+        if self.num_workers <= 0:
+            for chunk in chunks:
+                yield decode_chunk(chunk, *args)
+            return
+        # Bound the number of pending chunks, otherwise the whole dump would
+        # be read into the queue of the pool.
+        with Pool(self.num_workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(decode_chunk, (chunk, *args)))
+                if len(pending) >= 2 * self.num_workers:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+
+def format_date(date: str) -> str:
+    return datetime.strptime(date[:8], "%Y%m%d").strftime("%Y-%m-%d")
+
+
+def iter_chunks(path: str, chunk_size: int) -> Iterator[list[bytes]]:
+    chunk = []
+    with open(path, "rb") as fp:
+        for line in fp:
+            chunk.append(line)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if len(chunk):
+        yield chunk
+
+
+def decode_chunk(lines: list[bytes],
+                 categories: list[str],
+                 date_from: str,
+                 date_until: str) -> list[dict]:
+    keys = [c.encode("utf-8") for c in categories]
+    since = parse_update_date(date_from) if date_from else None
+    until = parse_update_date(date_until) if date_until else None
+    items = []
+    for line in lines:
+        # Most of the lines can be dropped before decoding the json.
+        if keys and not any(key in line for key in keys):
+            continue
+        item: dict = json.loads(line)
+        if categories:
+            item_categories = item.get("categories", "").split()
+            if not any(c in item_categories for c in categories):
+                continue
+        if since or until:
+            if not item.get("update_date"):
+                continue
+            updated = parse_update_date(item["update_date"])
+            if since and updated < since:
+                continue
+            if until and updated > until:
+                continue
+        items.append(item)
+    return items
+
+
+def create_from_snapshot(item: dict) -> Result:
+    versions = item.get("versions") or [{"version": "v1", "created": ""}]
+    published = parse_snapshot_date(versions[0]["created"], item)
+    updated = parse_snapshot_date(versions[-1]["created"], item)
+    authors = [
+        Result.Author(" ".join(n for n in (first, last, *suffix) if n))
+        for last, first, *suffix in item.get("authors_parsed", [])
+    ]
+    categories = item.get("categories", "").split()
+    entry_id = f"http://arxiv.org/abs/{item['id']}{versions[-1]['version']}"
+    links = [
+        Result.Link(entry_id, rel="alternate", content_type="text/html"),
+        Result.Link(entry_id.replace("abs", "pdf"), title="pdf",
+                    rel="related", content_type="application/pdf"),
+    ]
+    return Result(
+        entry_id=entry_id,
+        updated=updated,
+        published=published,
+        title=" ".join(item.get("title", "").split()),
+        authors=authors,
+        summary=item.get("abstract", "").strip(),
+        comment=item.get("comments"),
+        journal_ref=item.get("journal-ref"),
+        doi=item.get("doi"),
+        primary_category=categories[0] if categories else "",
+        categories=categories,
+        links=links,
+    )
+
+
+def parse_snapshot_date(date: str, item: dict) -> datetime:
+    # Dates of the versions look like "Mon, 2 Apr 2007 19:18:42 GMT".
+    if date:
+        return parsedate_to_datetime(date)
+    return parse_update_date(item["update_date"])
+
+
+def parse_update_date(date: str) -> datetime:
+    """
+    Returns the timezone-aware start of a "YYYY-MM-DD" date of arXiv, e.g.,
+    the `update_date` of the snapshot, like the other dates of `Result`.
+    """
+    return datetime.strptime(date, "%Y-%m-%d").replace(
+        tzinfo=ANNOUNCEMENT_TIMEZONE)
@@ -53,6 +53,8 @@ class DefaultKeywordsFilter(BasePlugin):
         >>> plugin = DefaultKeywordsFilter(keywords, ignorance)
     """
 
+    streamable = True
+
     def __init__(self,
                  keywords: dict[str, list[str]] | None = None,
                  ignorance: dict[str, list[str]] | None = None,
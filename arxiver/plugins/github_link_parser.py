@@ -21,6 +21,8 @@ class GitHubLinkParserData(BasePluginData):
 
 
 class GitHubLinkParser(BasePlugin):
+    streamable = True
+
     def process(self,
                 results: list[Result],
                 global_plugin_data: GlobalPluginData) -> list[Result]:
@@ -1,12 +1,13 @@
 
 from dataclasses import dataclass
+from functools import partial
 
 from arxiver.utils.logging import create_logger
 from arxiver.base.plugin import (
     BasePlugin, BaseKeywordsFilterData, BasePluginData, GlobalPluginData
 )
 from arxiver.base.result import Result
-from arxiver.core.agent import Agent
+from arxiver.core.agent import create_agent
 
 
 logger = create_logger(__name__)
@@ -17,6 +18,15 @@ def plugin_name():
 
 
 def default_prompt_template():
+    return default_prompt_prefix() + default_paper_template()
+
+
+def default_prompt_prefix():
+    """
+    The part of the prompt shared by all the papers of a topic. It leads the
+    prompt, so that it is served from the prompt cache of the provider, and
+    the content of the paper must come after it.
+    """
     return (
         ""
         "# Task Description\n"
@@ -46,11 +56,16 @@ def default_prompt_template():
         "# Task Input\n"
         "## Interested Topic\n{interested}\n\n"
         "## Discarded Topic\n{discarded}\n\n"
-        "## Title\n{title}\n\n"
-        "## Abstract\n{abstract}"
     )
 
 
+def default_paper_template():
+    return "## Title\n{title}\n\n## Abstract\n{abstract}"
+
+
+VERDICT_MARKERS = ["<-|RESULT: TRUE|->", "<-|RESULT: FALSE|->"]
+
+
 @dataclass
 class LanguageModelBasedKeywordsFilterData(BaseKeywordsFilterData):
     plugin_name: str = plugin_name()
@@ -63,8 +78,16 @@ class LanguageModelBasedKeywordsFilter(BasePlugin):
     Args:
         model: The model used to tell if a paper is related to a specific task.
         batch_mode: If True, the plugin will process the results in batch.
+        concurrent_mode: If True, the plugin will process the results by
+            concurrent requests.
         topics: A dictionary of topics, the key of the dict is the specified
             keyword, and the value is the related topic to be analyzed.
+        max_workers: Maximum number of concurrent requests in flight. If 0,
+            the request setting of the model is used.
+        max_tasks_per_minute: Maximum number of requests per minute. If 0,
+            the request setting of the model is used.
+        early_stop: If True, the responses are streamed and stopped once
+            the verdict is given. Not used in batch mode.
 
     Examples:
         >>> topics = {
@@ -80,15 +103,17 @@ class LanguageModelBasedKeywordsFilter(BasePlugin):
             concurrent_mode: bool,
             interested_topics: dict[str, str],
             discarded_topics: dict[str, str],
-            max_workers: int = 16,
-            max_tasks_per_minute: int = 16):
-        self.agent = Agent(model)
+            max_workers: int = 0,
+            max_tasks_per_minute: int = 0,
+            early_stop: bool = False):
+        self.agent = create_agent(model, stateless=True)
         self.batch_mode = batch_mode
         self.concurrent_mode = concurrent_mode
         self.interested_topics = interested_topics
         self.discarded_topics = discarded_topics
         self.max_workers = max_workers
         self.max_tasks_per_minute = max_tasks_per_minute
+        self.early_stop = early_stop
 
     def process(
             self, results: list[Result], global_plugin_data: GlobalPluginData):
@@ -118,7 +143,12 @@ class LanguageModelBasedKeywordsFilter(BasePlugin):
         logger.info("Sending prompts to the agent...")
         complete_method = (
             self.agent.complete_batches if self.batch_mode
-            else self.agent.complete_concurrent
+            else partial(
+                self.agent.complete_concurrent,
+                max_workers=self.max_workers,
+                requests_per_minute=self.max_tasks_per_minute,
+                **self.stream_kwargs,
+            )
         )
         responses = complete_method(prompts)
         logger.info("Processing responses...")
@@ -159,7 +189,7 @@ class LanguageModelBasedKeywordsFilter(BasePlugin):
                 logger.info(
                     f"Processing {i+1}-th of {N} paper of keyword {keyword}..."
                 )
-                r = self.agent.complete_single(prompt)
+                r = self.agent.complete_single(prompt, **self.stream_kwargs)
                 if "<-|RESULT: TRUE|->" in r or "<-|RESULT: FALSE|->" not in r:
                     if "<-|RESULT: TRUE|->" not in r:
                         logger.warning(
@@ -178,6 +208,12 @@ class LanguageModelBasedKeywordsFilter(BasePlugin):
                     logger.info(f"FALSE: Keyword {keyword} in {result.title}")
         return results
 
+    @property
+    def stream_kwargs(self) -> dict:
+        if not self.early_stop:
+            return {}
+        return {"stream": True, "stop_markers": VERDICT_MARKERS}
+
     def requires_processing(self, result: Result):
         plugin_datas: dict[str, BasePluginData] = result.local_plugin_data
         for data in plugin_datas.values():
@@ -206,10 +242,10 @@ class LanguageModelBasedKeywordsFilter(BasePlugin):
 def prepare_prompts(
         results: list[Result], interested_topic: str, discarded_topic: str):
     total_prompts: list[str] = []
+    prefix = default_prompt_prefix().format(
+        interested=interested_topic, discarded=discarded_topic)
     for result in results:
-        prompt = default_prompt_template()
-        prompt = prompt.format(
-            interested=interested_topic, discarded=discarded_topic,
+        content = default_paper_template().format(
             title=result.title, abstract=result.summary)
-        total_prompts.append(prompt)
+        total_prompts.append(prefix + content)
     return total_prompts
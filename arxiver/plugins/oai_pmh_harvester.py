@@ -0,0 +1,301 @@
+import os
+import re
+import os.path as osp
+import xml.etree.ElementTree as ET
+from time import sleep
+from datetime import datetime, timezone
+from dataclasses import dataclass
+from typing import Iterator
+
+import requests
+
+from arxiver.base.result import Result
+from arxiver.core.arxiv_client import RateLimiter
+from arxiver.utils.io import load_json, save_json_atomic
+from arxiver.utils.logging import create_logger
+from arxiver.base.plugin import BasePlugin, BasePluginData, GlobalPluginData
+from arxiver.plugins.arxiv_parser import DATE_RANGE_PATTERN
+
+
+logger = create_logger(__name__)
+
+
+OAI_NAMESPACES = {
+    "oai": "http://www.openarchives.org/OAI/2.0/",
+    "arxiv": "http://arxiv.org/OAI/arXiv/",
+}
+
+
+def plugin_name():
+    return "OAIPMHHarvester"
+
+
+@dataclass
+class OAIPMHHarvesterData(BasePluginData):
+    plugin_name: str = plugin_name()
+
+
+class OAIPMHHarvester(BasePlugin):
+    """
+    Harvest arXiv metadata through OAI-PMH `ListRecords`. It is much faster
+    than the search API for multi-year backfills and is not capped per query.
+
+    Args:
+        base_url: The OAI-PMH endpoint.
+        set_spec: The OAI-PMH set to harvest, e.g., "cs".
+        date_from: Harvest the records updated since this date (YYYY-MM-DD).
+            If empty, the start of the date range of `query` is used.
+        date_until: Harvest the records updated until this date (YYYY-MM-DD).
+            If empty, the end of the date range of `query` is used.
+        categories: Only keep the records of these categories, e.g.,
+            "(cat:cs.CV OR cat:cs.AI)". Leave it empty to keep all the records.
+        query: The arxiv query, only used to get the default date range.
+        checkpoint_file: Where to checkpoint the resumption token, so that an
+            interrupted harvest continues where it stopped. It is only
+            written once the harvested records are saved, see `commit`.
+        stream_mode: If True, the records are yielded page by page.
+        max_pages: Maximum number of pages harvested per run, so that a
+            long backfill is split into runs, each continuing from the
+            checkpoint of the previous one. If 0, the harvest runs to the
+            end.
+        interval: Minimum seconds between two requests.
+        max_retries: Number of retries of a failed request.
+    """
+
+    def __init__(self,
+                 base_url: str = "https://oaipmh.arxiv.org/oai",
+                 set_spec: str = "cs",
+                 date_from: str = "",
+                 date_until: str = "",
+                 categories: str = "",
+                 query: str = "",
+                 checkpoint_file: str = "outputs/oai_pmh_checkpoint.json",
+                 stream_mode: bool = False,
+                 max_pages: int = 0,
+                 interval: float = 3.0,
+                 max_retries: int = 10):
+        self.base_url = base_url
+        self.set_spec = set_spec
+        match = DATE_RANGE_PATTERN.search(query)
+        if match is not None:
+            _, start, end = match.groups()
+            date_from = date_from or format_oai_date(start)
+            date_until = date_until or format_oai_date(end)
+        self.date_from = date_from
+        self.date_until = date_until
+        self.categories = set(re.findall(r"cat:([\w.\-]+)", categories))
+        self.checkpoint_file = checkpoint_file
+        self.stream_mode = stream_mode
+        self.max_pages = max_pages
+        # The resumption token of the next page, checkpointed by `commit`.
+        # It is empty once the harvest is finished, and None if nothing is
+        # harvested yet.
+        self.pending_token: str | None = None
+        self.rate_limiter = RateLimiter(interval)
+        self.max_retries = max_retries
+        self.session = requests.Session()
+
+    def process(self,
+                results: list[Result],
+                global_plugin_data: GlobalPluginData) -> list[Result]:
+        return [r for page in self.harvest() for r in page]
+
+    def stream(self,
+               results: list[Result],
+               global_plugin_data: GlobalPluginData) -> Iterator[list[Result]]:
+        return self.harvest()
+
+    @property
+    def params(self) -> dict[str, str]:
+        params = {"verb": "ListRecords", "metadataPrefix": "arXiv"}
+        if self.set_spec:
+            params["set"] = self.set_spec
+        if self.date_from:
+            params["from"] = self.date_from
+        if self.date_until:
+            params["until"] = self.date_until
+        return params
+
+    def harvest(self) -> Iterator[list[Result]]:
+        token = self.load_checkpoint()
+        num_records = 0
+        num_pages = 0
+        while True:
+            if token:
+                params = {"verb": "ListRecords", "resumptionToken": token}
+            else:
+                params = self.params
+            root = self.request(params)
+            records, token, size = parse_list_records(root)
+            page = [r for r in records if self.requires_record(r)]
+            num_records += len(records)
+            num_pages += 1
+            logger.info(
+                f"Harvested {num_records}/{size or '?'} records, "
+                f"{len(page)} of the current page are kept."
+            )
+            if len(page):
+                yield page
+            # The token is only checkpointed by `commit`, once the records
+            # yielded so far are saved, so that a failed run harvests them
+            # again.
+            self.pending_token = token
+            if not token:
+                break
+            if self.max_pages and num_pages >= self.max_pages:
+                logger.info(f"Harvested {num_pages} pages, the next run "
+                            f"continues from {token}.")
+                break
+
+    def commit(self):
+        if self.pending_token is None:
+            return
+        if self.pending_token:
+            self.save_checkpoint(self.pending_token)
+        else:
+            self.remove_checkpoint()
+        self.pending_token = None
+
+    def requires_record(self, result: Result) -> bool:
+        if not self.categories:
+            return True
+        return len(self.categories & set(result.categories)) > 0
+
+    def request(self, params: dict[str, str]) -> ET.Element:
+        for i in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            try:
+                response = self.session.get(self.base_url, params=params)
+            except requests.exceptions.ConnectionError as e:
+                logger.warning(f"Failed to request {self.base_url}\n{e}")
+                sleep(self.rate_limiter.interval)
+                continue
+            if response.status_code == 503:
+                # The arXiv OAI-PMH server asks clients to wait for a while
+                # by the Retry-After header.
+                retry_after = float(response.headers.get("Retry-After", 10))
+                logger.info(f"Server is busy, retry after {retry_after}s.")
+                sleep(retry_after)
+                continue
+            if response.status_code != requests.codes.ok:
+                logger.warning(
+                    f"Request failed with status {response.status_code}, "
+                    f"retry {i + 1}/{self.max_retries}."
+                )
+                sleep(self.rate_limiter.interval)
+                continue
+            return ET.fromstring(response.content)
+        raise RuntimeError(
+            f"Failed to request {self.base_url} with {params} after "
+            f"{self.max_retries} retries."
+        )
+
+    def load_checkpoint(self) -> str:
+        if not osp.exists(self.checkpoint_file):
+            return ""
+        checkpoint = load_json(self.checkpoint_file)
+        if checkpoint.get("params") != self.params:
+            logger.warning(
+                f"Ignore the checkpoint {self.checkpoint_file} of another "
+                f"harvest: {checkpoint.get('params')}"
+            )
+            return ""
+        logger.info(f"Resume harvest from {checkpoint['resumption_token']}")
+        return checkpoint["resumption_token"]
+
+    def save_checkpoint(self, token: str):
+        directory = osp.dirname(self.checkpoint_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        save_json_atomic(
+            self.checkpoint_file,
+            {"params": self.params, "resumption_token": token},
+            indent=4,
+        )
+
+    def remove_checkpoint(self):
+        if osp.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+
+
+def format_oai_date(date: str) -> str:
+    return datetime.strptime(date[:8], "%Y%m%d").strftime("%Y-%m-%d")
+
+
+def parse_list_records(
+        root: ET.Element) -> tuple[list[Result], str, int | None]:
+    """
+    Returns the records, the resumption token and the complete list size of
+    a `ListRecords` response.
+    """
+    error = root.find("oai:error", OAI_NAMESPACES)
+    if error is not None:
+        if error.get("code") == "noRecordsMatch":
+            return [], "", 0
+        raise ValueError(f"OAI-PMH error {error.get('code')}: {error.text}")
+    list_records = root.find("oai:ListRecords", OAI_NAMESPACES)
+    if list_records is None:
+        return [], "", 0
+    results = []
+    for record in list_records.iterfind("oai:record", OAI_NAMESPACES):
+        header = record.find("oai:header", OAI_NAMESPACES)
+        if header is not None and header.get("status") == "deleted":
+            continue
+        metadata = record.find("oai:metadata/arxiv:arXiv", OAI_NAMESPACES)
+        if metadata is None:
+            continue
+        results.append(create_from_oai_metadata(metadata))
+    token, size = "", None
+    element = list_records.find("oai:resumptionToken", OAI_NAMESPACES)
+    if element is not None:
+        token = (element.text or "").strip()
+        if element.get("completeListSize"):
+            size = int(element.get("completeListSize"))  # type: ignore
+    return results, token, size
+
+
+def create_from_oai_metadata(metadata: ET.Element) -> Result:
+    def text(path: str) -> str:
+        element = metadata.find(path, OAI_NAMESPACES)
+        if element is None or element.text is None:
+            return ""
+        return " ".join(element.text.split())
+
+    arxiv_id = text("arxiv:id")
+    created = parse_oai_date(text("arxiv:created"))
+    updated = parse_oai_date(text("arxiv:updated")) or created
+    authors = []
+    for author in metadata.iterfind("arxiv:authors/arxiv:author",
+                                    OAI_NAMESPACES):
+        names = [
+            author.findtext(f"arxiv:{key}", "", OAI_NAMESPACES)
+            for key in ("forenames", "keyname", "suffix")
+        ]
+        authors.append(Result.Author(" ".join(n for n in names if n)))
+    categories = text("arxiv:categories").split()
+    entry_id = f"http://arxiv.org/abs/{arxiv_id}"
+    links = [
+        Result.Link(entry_id, rel="alternate", content_type="text/html"),
+        Result.Link(f"http://arxiv.org/pdf/{arxiv_id}", title="pdf",
+                    rel="related", content_type="application/pdf"),
+    ]
+    return Result(
+        entry_id=entry_id,
+        updated=updated,
+        published=created,
+        title=text("arxiv:title"),
+        authors=authors,
+        summary=text("arxiv:abstract"),
+        comment=text("arxiv:comments") or None,
+        journal_ref=text("arxiv:journal-ref") or None,
+        doi=text("arxiv:doi") or None,
+        primary_category=categories[0] if categories else "",
+        categories=categories,
+        links=links,
+    )
+
+
+def parse_oai_date(date: str) -> datetime | None:
+    if not date:
+        return None
+    return datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
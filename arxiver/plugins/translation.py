@@ -6,7 +6,7 @@ from arxiver.base.plugin import (
     BasePlugin, BasePluginData, BaseKeywordsFilterData, GlobalPluginData
 )
 from arxiver.base.result import Result
-from arxiver.core.agent import Agent
+from arxiver.core.agent import BatchMultiplexer, create_agent
 from arxiver.plugins.default_keywords_filter import DefaultKeywordsFilterData
 
 
@@ -43,6 +43,29 @@ class TranslatorData(BasePluginData):
 
 
 class Translator(BasePlugin):
+    """
+    Translate the titles and the summaries of the results.
+
+    Args:
+        model: The model used to translate, see `configs/core/agent.json`.
+        batch_mode: If True, the results are translated by the batch API.
+        concurrent_mode: If True, the results are translated by concurrent
+            requests.
+        prompt: The translation instruction.
+        translate_all_results: If False, only the results matched by the
+            keywords filter are translated.
+        keywords_filter_plugin: The keywords filter deciding the results to
+            translate.
+        max_workers: Maximum number of concurrent requests in flight. If 0,
+            the request setting of the model is used.
+        max_tasks_per_minute: Maximum number of requests per minute. If 0,
+            the request setting of the model is used.
+        prefix_prompt: If True, the instruction leads the prompts, so that
+            all of them share a prefix served from the prompt cache of the
+            provider. Otherwise, the text leads, which is kept to compare
+            the cached prompt tokens and the latency in the telemetry.
+    """
+
     def __init__(
             self,
             model: str,
@@ -51,9 +74,10 @@ class Translator(BasePlugin):
             prompt: str = "",
             translate_all_results: bool = False,
             keywords_filter_plugin: str = "",
-            max_workers: int = 16,
-            max_tasks_per_minute: int = 16):
-        self.agent = Agent(model)
+            max_workers: int = 0,
+            max_tasks_per_minute: int = 0,
+            prefix_prompt: bool = True):
+        self.agent = create_agent(model, stateless=True)
         self.batch_mode = batch_mode
         self.concurrent_mode = concurrent_mode
         self.prompt = prompt or translation_instruction()
@@ -61,6 +85,7 @@ class Translator(BasePlugin):
         self.keywords_filter_plugin = keywords_filter_plugin
         self.max_workers = max_workers
         self.max_tasks_per_minute = max_tasks_per_minute
+        self.prefix_prompt = prefix_prompt
 
     def process(self,
                 results: list[Result],
@@ -81,20 +106,26 @@ class Translator(BasePlugin):
         results_to_translate = [
             r for r in results if self.requires_translation(r)
         ]
-        logger.info(f"Translating {len(titles)} titles...")
+        logger.info(f"Translating {len(titles)} titles and "
+                    f"{len(summaries)} summaries...")
+        title_prompts = [self.build_prompt(t) for t in titles]
+        summary_prompts = [self.build_prompt(s) for s in summaries]
+        # The titles and the summaries are completed together, so that the
+        # translation takes one batch cycle instead of two.
         if self.batch_mode:
-            complete_method = self.agent.complete_batches
+            with BatchMultiplexer(self.agent) as multiplexer:
+                titles_future = multiplexer.submit(title_prompts)
+                summaries_future = multiplexer.submit(summary_prompts)
+            translated_titles = titles_future.result()
+            translated_summaries = summaries_future.result()
         else:
-            complete_method = self.agent.complete_concurrent
-        translated_titles = complete_method([
-            f"Given the following text:\n\n{t}\n\n{translation_instruction()}"
-            for t in titles
-        ])
-        logger.info(f"Translating {len(summaries)} summaries...")
-        translated_summaries = complete_method([
-            f"Given the following text:\n\n{s}\n\n{translation_instruction()}"
-            for s in summaries
-        ])
+            translated = self.agent.complete_concurrent(
+                title_prompts + summary_prompts,
+                max_workers=self.max_workers,
+                requests_per_minute=self.max_tasks_per_minute,
+            )
+            translated_titles = translated[:len(titles)]
+            translated_summaries = translated[len(titles):]
         for result, title, translation in zip(results_to_translate,
                                               translated_titles,
                                               translated_summaries):
@@ -121,9 +152,7 @@ class Translator(BasePlugin):
                 f"{idx+1}-th/{len(results_to_translate)} paper: {result.title}"
             )
             translation = self.agent.complete_single(
-                f"Given the following text:\n\n{summary}\n\n"
-                f"{translation_instruction()}"
-            )
+                self.build_prompt(summary))
             plugin = result.local_plugin_data.get(plugin_name(), None)
             if plugin is None:
                 result.add_plugin_data(TranslatorData(model=self.agent.model))
@@ -131,6 +160,11 @@ class Translator(BasePlugin):
             plugin.translated_summary = translation
         return results
 
+    def build_prompt(self, text: str) -> str:
+        if self.prefix_prompt:
+            return f"{self.prompt}\n\nThe text:\n\n{text}"
+        return f"Given the following text:\n\n{text}\n\n{self.prompt}"
+
     def requires_translation(self, result: Result) -> bool:
         if self.translate_all_results:
             return True
@@ -1,4 +1,5 @@
 
+import os
 import json
 
 from arxiver.utils.logging import create_logger, setup_format
@@ -13,6 +14,16 @@ def save_json(path: str, data: dict, **kwargs):
         json.dump(data, fp, **kwargs)
 
 
+def save_json_atomic(path: str, data: dict, **kwargs):
+    # Write to a temporary file and then rename it, so that the file is
+    # never left half written if the process is interrupted.
+    logger.info(f"Saving data to {path}")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as fp:
+        json.dump(data, fp, **kwargs)
+    os.replace(tmp_path, path)
+
+
 def load_json(path: str):
     logger.info(f"Loading data from {path}")
     with open(path, 'r') as fp:
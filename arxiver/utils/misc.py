@@ -1,5 +1,5 @@
-
-from time import sleep
+import random
+from time import sleep, monotonic
 import openai
 from openai import OpenAI
 
@@ -9,22 +9,58 @@ from arxiver.utils.logging import create_logger
 logger = create_logger(__name__)
 
 
+BATCH_RUNNING_STATUS = ("validating", "in_progress", "finalizing")
+
+
 def wait_batch_task(client: OpenAI,
                     batch: openai.types.Batch,
-                    interval: float = 10):
-    while True:
-        sleep(interval)
-        job = client.batches.retrieve(batch.id)
-        if job.status in ("validating", "in_progress", "finalizing"):
-            logger.info(f"Completion status: {job.status}, "
-                        f"batch id: {batch.id}")
+                    interval: float = 10,
+                    max_interval: float = 300,
+                    backoff: float = 1.5,
+                    jitter: float = 0.1,
+                    timeout: float = 0):
+    """
+    Poll the batch until it exits. The interval grows by `backoff` up to
+    `max_interval` while the batch makes no progress and is reset once it
+    does. A random jitter keeps concurrent jobs from polling in lockstep.
+    If `timeout` is positive, stop waiting after `timeout` seconds and
+    return the last retrieved batch.
+    """
+    start = monotonic()
+    delay = interval
+    job = batch
+    progress = None
+    while job.status in BATCH_RUNNING_STATUS:
+        if timeout and monotonic() - start > timeout:
+            logger.warning(f"Stop waiting for batch {batch.id} after "
+                           f"{timeout} seconds.")
+            break
+        sleep(delay * random.uniform(1 - jitter, 1 + jitter))
+        try:
+            job = client.batches.retrieve(batch.id)
+        except Exception as e:
+            logger.warning(f"Failed to retrieve job {batch.id}\n{e}")
             continue
+        counts = job.request_counts
+        current = (
+            job.status,
+            counts.completed if counts else None,
+            counts.failed if counts else None,
+        )
+        if current != progress:
+            delay = interval
+            progress = current
         else:
-            logger.info(
-                f"Complete batches task exists with status: {job.status}.\n"
-                f"Details: {job}")
-            break
-    return client.batches.retrieve(batch.id)
+            delay = min(delay * backoff, max_interval)
+        logger.info(
+            f"Completion status: {job.status}, batch id: {batch.id}"
+            + (f", {counts.completed + counts.failed}/{counts.total} "
+               f"requests done" if counts else "")
+        )
+    logger.info(
+        f"Complete batches task exists with status: {job.status}.\n"
+        f"Details: {job}")
+    return job
 
 
 def batch_task_success(batch: openai.types.Batch):
@@ -0,0 +1,174 @@
+"""
+Load-test `Agent` against the mock provider of
+`benchmark/mock_openai_server.py`, which is started on a free port with the
+given settings, e.g.,
+
+    python benchmark/agent_load.py --mode concurrent --num_requests 500 \
+--max_workers 32 --latency 0.5 --rate_limit_rate 0.05 --rpm 3000
+
+The request setting of `--model` in `configs/core/agent.json`, e.g., the
+concurrency, the rate limits and the retries, is used unless overridden, so
+the settings of a model can be tuned offline. Use `--base_url` to drive an
+already running server instead.
+
+Without `adaptive_concurrency` in the request setting, the openai client
+retries the 429 and 5xx responses by itself before the retries of `Agent`,
+so the injected errors are only reported by the server stats.
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+import statistics
+import subprocess
+import os.path as osp
+from time import perf_counter, sleep
+from urllib.request import urlopen
+
+from openai import OpenAI
+from tabulate import tabulate
+
+# Run from a checkout of the repository without installing the package.
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+from arxiver.core.agent import Agent
+from arxiver.core.telemetry import TELEMETRY
+from mock_openai_server import MockSettings, add_settings_arguments
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args) -> tuple[subprocess.Popen, str]:
+    port = free_port()
+    command = [
+        sys.executable,
+        osp.join(osp.dirname(osp.abspath(__file__)), "mock_openai_server.py"),
+        "--port", str(port),
+    ]
+    for name, value in MockSettings.__dataclass_fields__.items():
+        if value.type is bool:
+            command += [f"--{name}"] if getattr(args, name) else []
+        else:
+            command += [f"--{name}", str(getattr(args, name))]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}/v1"
+    for _ in range(100):
+        try:
+            server_stats(base_url)
+            return server, base_url
+        except OSError:
+            sleep(0.1)
+    server.kill()
+    raise RuntimeError("The mock server is not started.")
+
+
+def server_stats(base_url: str) -> dict:
+    with urlopen(base_url.replace("/v1", "/stats"), timeout=5) as response:
+        return json.load(response)
+
+
+def create_agent(args, base_url: str) -> Agent:
+    # The mock server ignores the key, but the client requires one.
+    os.environ.setdefault("OPENAI_API_KEY", "mock")
+    agent = Agent(args.model)
+    agent.model = args.model or "mock"
+    agent.cache = None
+    # The limit learned against the mock is not a limit of the model.
+    agent.concurrency_path = None
+    agent.config.base_url = base_url
+    agent.config.model = agent.config.model or "mock"
+    agent.config.endpoint = agent.config.endpoint or "/v1/chat/completions"
+    agent.client = OpenAI(api_key="mock", base_url=base_url)
+    request_setting = agent.config.request_setting or {}
+    overrides = {
+        "max_concurrency": args.max_workers,
+        "requests_per_minute": args.requests_per_minute,
+        "max_retries": args.max_retries,
+        "batch_poll_interval": args.batch_poll_interval,
+    }
+    request_setting.update({k: v for k, v in overrides.items() if v >= 0})
+    agent.config.request_setting = request_setting
+    return agent
+
+
+def run(agent: Agent, mode: str, messages: list[str]) -> list[str]:
+    if mode == "concurrent":
+        return agent.complete_concurrent(messages)
+    if mode == "stream":
+        return agent.complete_concurrent(messages, stream=True)
+    if mode == "batch":
+        return agent.complete_batches(messages)
+    raise ValueError(f"Unknown mode: {mode}")
+
+
+def percentile(quantiles: list[float], p: int) -> str:
+    return f"{quantiles[p - 1]:.2f}" if quantiles else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").split("\n")[1])
+    parser.add_argument("--model", default="",
+                        help="A model of `configs/core/agent.json`.")
+    parser.add_argument("--mode", default="concurrent",
+                        choices=["concurrent", "stream", "batch"])
+    parser.add_argument("--num_requests", type=int, default=200)
+    parser.add_argument("--prompt_tokens", type=int, default=256)
+    parser.add_argument("--base_url", default="",
+                        help="Use a running server instead of starting one.")
+    # The request setting of the model is used if negative.
+    parser.add_argument("--max_workers", type=int, default=-1)
+    parser.add_argument("--requests_per_minute", type=int, default=-1)
+    parser.add_argument("--max_retries", type=int, default=-1)
+    parser.add_argument("--batch_poll_interval", type=float, default=1)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = start_server(args)
+    try:
+        agent = create_agent(args, base_url)
+        # Distinct messages, so that none of them is coalesced or cached.
+        messages = [
+            f"{idx} " + "word " * args.prompt_tokens
+            for idx in range(args.num_requests)
+        ]
+        start = perf_counter()
+        responses = run(agent, args.mode, messages)
+        elapsed = perf_counter() - start
+        stats = server_stats(base_url)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    records = TELEMETRY.records
+    latencies = [r.latency for r in records if r.outcome != "cached"]
+    quantiles = (
+        statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+    )
+    header = [
+        "Mode", "Requests", "Failed", "Retries", "Elapsed (s)",
+        "Requests/s", "p50 (s)", "p95 (s)", "p99 (s)"
+    ]
+    data = [
+        args.mode, len(responses), sum(not r for r in responses),
+        sum(max(r.attempts - 1, 0) for r in records),
+        f"{elapsed:.1f}", f"{len(responses) / elapsed:.1f}",
+        percentile(quantiles, 50), percentile(quantiles, 95),
+        percentile(quantiles, 99),
+    ]
+    print(tabulate([data], headers=header, tablefmt="pretty"))
+    print(tabulate([stats.values()], headers=list(stats.keys()),
+                   tablefmt="pretty"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Compare the cost of decoding an arXiv API page into `Result`:
+
+- arxiv: `arxiv.Client` parses the page into `arxiv.Result`, which is then
+  copied by `Result.create_from_arxiv_result`;
+- native: `NativeClient` decodes the page into `Result` directly.
+
+Record a page first, e.g.,
+
+    curl -o page.xml "https://export.arxiv.org/api/query?\
+search_query=cat:cs.CV&sortBy=lastUpdatedDate&max_results=2000"
+
+then run
+
+    python benchmark/atom_decoder.py --feed page.xml
+
+Without `--feed`, a synthetic page of `--num_entries` entries is used.
+"""
+import sys
+import argparse
+import statistics
+import os.path as osp
+from time import perf_counter
+
+import arxiv
+from tabulate import tabulate
+
+# Run from a checkout of the repository without installing the package.
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+
+from arxiver.base.result import Result
+from arxiver.core.arxiv_client import (
+    RateLimiter, cached_response, create_client
+)
+
+
+ENTRY = """<entry>
+<id>http://arxiv.org/abs/2401.{idx:05d}v1</id>
+<updated>2024-01-01T10:00:00Z</updated>
+<published>2024-01-01T09:00:00Z</published>
+<title>A Synthetic Paper about Segmentation and Detection {idx}</title>
+<summary>{summary}</summary>
+{authors}
+<arxiv:comment xmlns:arxiv="http://arxiv.org/schemas/atom">10 pages, code: https://github.com/a/b</arxiv:comment>
+<link href="http://arxiv.org/abs/2401.{idx:05d}v1" rel="alternate" type="text/html"/>
+<link title="pdf" href="http://arxiv.org/pdf/2401.{idx:05d}v1" rel="related" type="application/pdf"/>
+<arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="cs.CV" scheme="http://arxiv.org/schemas/atom"/>
+<category term="cs.CV" scheme="http://arxiv.org/schemas/atom"/>
+<category term="cs.LG" scheme="http://arxiv.org/schemas/atom"/>
+<category term="cs.AI" scheme="http://arxiv.org/schemas/atom"/>
+</entry>
+"""
+
+
+def synthesize_feed(num_entries: int) -> bytes:
+    summary = "We study image segmentation with transformers. " * 20
+    authors = "".join(
+        f"<author><name>Author {i}</name></author>" for i in range(6)
+    )
+    entries = "".join(
+        ENTRY.format(idx=idx, summary=summary, authors=authors)
+        for idx in range(num_entries)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+        '<opensearch:totalResults xmlns:opensearch='
+        f'"http://a9.com/-/spec/opensearch/1.1/">{num_entries}'
+        '</opensearch:totalResults>\n'
+        f"{entries}</feed>\n"
+    ).encode("utf-8")
+
+
+def decode(content: bytes, max_results: int, native_decoder: bool):
+    client = create_client(page_size=max_results,
+                           rate_limiter=RateLimiter(interval=0),
+                           native_decoder=native_decoder)
+    client._session.get = (  # type: ignore
+        lambda url, **kwargs: cached_response(str(url), content))
+    search = arxiv.Search(query="benchmark", max_results=max_results)
+    results: list[Result] = []
+    for r in client.results(search):
+        if not isinstance(r, Result):
+            r = Result.create_from_arxiv_result(r)
+        results.append(r)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").split("\n")[1])
+    parser.add_argument("--feed", default="", help="A recorded API page.")
+    parser.add_argument("--num_entries", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    if args.feed:
+        with open(args.feed, "rb") as fp:
+            content = fp.read()
+    else:
+        content = synthesize_feed(args.num_entries)
+
+    rows = []
+    results: list[Result] = []
+    for name, native_decoder in (("arxiv", False), ("native", True)):
+        durations = []
+        for _ in range(args.repeats):
+            start = perf_counter()
+            # Decode the whole page in one request.
+            results = decode(content, 10 ** 6, native_decoder)
+            durations.append(perf_counter() - start)
+        best = min(durations)
+        rows.append([
+            name, len(results), f"{best * 1000:.1f}",
+            f"{statistics.mean(durations) * 1000:.1f}",
+            f"{len(results) / best:.0f}",
+        ])
+    header = ["Decoder", "Entries", "Best (ms)", "Mean (ms)", "Entries/s"]
+    print(f"Page size: {len(content) / 2 ** 20:.2f} MiB")
+    print(tabulate(rows, headers=header, tablefmt="pretty"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""
+A local stand-in of the arXiv OAI-PMH endpoint, serving canned `ListRecords`
+pages for `arxiver/plugins/oai_pmh_harvester.py`.
+
+The pages are the xml files of `--directory`. The request without a
+resumption token gets the first file by name, and a resumption token is the
+name of the file of the next page, e.g., `page2` for `page2.xml`. Unknown
+tokens get a `badResumptionToken` error. A fraction of the requests can be
+answered by `503 Retry-After`, as the real endpoint does under load, e.g.,
+
+    python benchmark/mock_oai_pmh_server.py --port 8001 --busy_rate 0.2
+
+then set `base_url` of `configs/plugins/oai_pmh_harvester.json` to
+`http://127.0.0.1:8001/oai`.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import threading
+import os.path as osp
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+FIXTURE_DIRECTORY = osp.join(
+    osp.dirname(osp.abspath(__file__)), "..", "tests", "fixtures", "oai_pmh")
+
+BAD_TOKEN = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">\n'
+    '  <error code="badResumptionToken">{token}</error>\n'
+    '</OAI-PMH>\n'
+)
+
+
+@dataclass
+class MockOAISettings:
+    """
+    Args:
+        directory: The directory of the canned pages.
+        busy_rate: Probability of a `503` response.
+        retry_after: The `Retry-After` header of the `503` responses.
+    """
+    directory: str = FIXTURE_DIRECTORY
+    busy_rate: float = 0
+    retry_after: float = 0.1
+
+
+class MockOAIHandler(BaseHTTPRequestHandler):
+    settings: MockOAISettings
+    # The number of the requests of each page, and of the busy responses.
+    stats: dict[str, int]
+    lock: threading.Lock
+
+    def log_message(self, format, *args):
+        pass
+
+    def count(self, key: str):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            with self.lock:
+                self.respond(200, json.dumps(self.stats).encode("utf-8"),
+                             "application/json")
+            return
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if params.get("verb") != "ListRecords":
+            self.respond(400, b"Only ListRecords is served.", "text/plain")
+            return
+        if random.random() < self.settings.busy_rate:
+            self.count("busy")
+            self.send_response(503)
+            self.send_header("Retry-After", str(self.settings.retry_after))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        token = params.get("resumptionToken", "")
+        page = token or self.first_page()
+        path = osp.join(self.settings.directory, f"{page}.xml")
+        if not page or "/" in page or not osp.exists(path):
+            self.count("bad_token")
+            body = BAD_TOKEN.format(token=token).encode("utf-8")
+        else:
+            self.count(page)
+            with open(path, "rb") as fp:
+                body = fp.read()
+        self.respond(200, body, "text/xml")
+
+    def first_page(self) -> str:
+        names = sorted(
+            osp.splitext(name)[0]
+            for name in os.listdir(self.settings.directory)
+            if name.endswith(".xml")
+        )
+        return names[0] if names else ""
+
+    def respond(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(settings: MockOAISettings,
+                  host: str = "127.0.0.1",
+                  port: int = 8001) -> ThreadingHTTPServer:
+    handler = type("BoundMockOAIHandler", (MockOAIHandler,), {
+        "settings": settings, "stats": {}, "lock": threading.Lock()
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    for name, value in MockOAISettings.__dataclass_fields__.items():
+        parser.add_argument(
+            f"--{name}", type=value.type,  # type: ignore
+            default=value.default)
+    args = parser.parse_args()
+    settings = MockOAISettings(**{
+        name: getattr(args, name)
+        for name in MockOAISettings.__dataclass_fields__
+    })
+    server = create_server(settings, args.host, args.port)
+    print(f"Serving {settings} on http://{args.host}:{args.port}/oai",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
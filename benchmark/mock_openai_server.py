@@ -0,0 +1,419 @@
+"""
+A local stand-in of an OpenAI-compatible provider, implementing the
+endpoints used by `arxiver/core/agent.py`:
+
+- POST /v1/chat/completions, streamed or not;
+- POST /v1/files, GET /v1/files/{id}/content and DELETE /v1/files/{id};
+- POST /v1/batches and GET /v1/batches/{id};
+- GET /stats, the counters of the server.
+
+The latency of the completions, the injected 429 and 5xx responses and the
+turnaround of the batches are configurable, e.g.,
+
+    python benchmark/mock_openai_server.py --port 8000 --latency 0.5 \
+--latency_distribution lognormal --rate_limit_rate 0.05 --rpm 600
+
+then point a model of `configs/core/agent.json` to
+`http://127.0.0.1:8000/v1`, or run `benchmark/agent_load.py`.
+"""
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class MockSettings:
+    """
+    Args:
+        latency: Mean seconds until the response of a completion.
+        latency_distribution: One of "constant", "uniform", "exponential"
+            and "lognormal".
+        latency_sigma: Sigma of the lognormal distribution.
+        completion_tokens: Number of tokens of each completion.
+        token_interval: Seconds between two chunks of a streamed completion.
+        rate_limit_rate: Probability of a 429 response.
+        server_error_rate: Probability of a 5xx response. The items of a
+            batch fail with the same probability.
+        rpm: Respond 429 beyond this number of requests per minute. If 0,
+            unlimited.
+        max_in_flight: Respond 429 beyond this number of requests in
+            flight. If 0, unlimited.
+        retry_after: The `Retry-After` header of the 429 responses.
+        batch_turnaround: Seconds until a batch is completed.
+        echo: If True, the content of a completion which is not streamed is
+            its prompt instead of `completion_tokens` tokens, so that the
+            responses can be told apart, e.g., by the tests.
+    """
+    latency: float = 0.5
+    latency_distribution: str = "lognormal"
+    latency_sigma: float = 0.5
+    completion_tokens: int = 64
+    token_interval: float = 0.01
+    rate_limit_rate: float = 0
+    server_error_rate: float = 0
+    rpm: int = 0
+    max_in_flight: int = 0
+    retry_after: float = 1
+    batch_turnaround: float = 10
+    echo: bool = False
+
+    def sample_latency(self) -> float:
+        if self.latency_distribution == "constant":
+            return self.latency
+        if self.latency_distribution == "uniform":
+            return random.uniform(0, 2 * self.latency)
+        if self.latency_distribution == "exponential":
+            return random.expovariate(1 / self.latency)
+        if self.latency_distribution == "lognormal":
+            # The mean of the lognormal distribution is `latency`.
+            mu = math.log(self.latency) - self.latency_sigma ** 2 / 2
+            return random.lognormvariate(mu, self.latency_sigma)
+        raise ValueError(
+            f"Unknown latency distribution: {self.latency_distribution}")
+
+
+@dataclass
+class MockState:
+    settings: MockSettings
+    files: dict[str, dict] = field(default_factory=dict)
+    batches: dict[str, dict] = field(default_factory=dict)
+    requests: deque[float] = field(default_factory=deque)
+    stats: dict[str, int] = field(default_factory=lambda: {
+        "completions": 0, "in_flight": 0, "max_in_flight": 0,
+        "rate_limited": 0, "server_errors": 0, "files": 0, "batches": 0,
+        "batch_polls": 0,
+    })
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def admit(self) -> int:
+        """
+        Returns the status code of an incoming completion request. The
+        request is in flight unless it is rate limited.
+        """
+        settings = self.settings
+        now = time.monotonic()
+        with self.lock:
+            self.stats["completions"] += 1
+            while self.requests and self.requests[0] + 60 <= now:
+                self.requests.popleft()
+            limited = (
+                settings.rpm and len(self.requests) >= settings.rpm
+                or settings.max_in_flight
+                and self.stats["in_flight"] >= settings.max_in_flight
+            )
+            if limited or random.random() < settings.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429
+            self.requests.append(now)
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(
+                self.stats["max_in_flight"], self.stats["in_flight"])
+            if random.random() < settings.server_error_rate:
+                self.stats["server_errors"] += 1
+                return 503
+        return 200
+
+    def batch(self, batch_id: str) -> dict:
+        with self.lock:
+            self.stats["batch_polls"] += 1
+            batch = self.batches[batch_id]
+            total = batch["request_counts"]["total"]
+            elapsed = time.time() - batch["created_at"]
+            turnaround = self.settings.batch_turnaround
+            if batch["status"] not in ("validating", "in_progress"):
+                return dict(batch)
+            if elapsed >= turnaround:
+                self.complete_batch(batch)
+            else:
+                batch["status"] = "in_progress"
+                batch["request_counts"]["completed"] = int(
+                    total * elapsed / max(turnaround, 1e-6))
+            return dict(batch)
+
+    def complete_batch(self, batch: dict):
+        lines = []
+        failed = 0
+        content = self.files[batch["input_file_id"]]["content"]
+        for line in content.decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if random.random() < self.settings.server_error_rate:
+                failed += 1
+                response = {"status_code": 500, "body": error_body()}
+            else:
+                response = {
+                    "status_code": 200,
+                    "body": completion(item["body"], self.settings),
+                }
+            lines.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:8]}",
+                "custom_id": item["custom_id"],
+                "response": response,
+                "error": None,
+            }))
+        output_file_id = self.add_file(
+            ("\n".join(lines) + "\n").encode("utf-8"), "output.jsonl")
+        batch["status"] = "completed"
+        batch["output_file_id"] = output_file_id
+        batch["completed_at"] = int(time.time())
+        total = batch["request_counts"]["total"]
+        batch["request_counts"] = {
+            "total": total, "completed": total - failed, "failed": failed
+        }
+
+    def add_file(self, content: bytes, filename: str) -> str:
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.files[file_id] = {"content": content, "filename": filename}
+        return file_id
+
+    def file(self, file_id: str) -> dict:
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(self.files[file_id]["content"]),
+            "created_at": int(time.time()),
+            "filename": self.files[file_id]["filename"],
+            "purpose": "batch",
+            "status": "processed",
+        }
+
+
+def error_body(message: str = "The server is overloaded.") -> dict:
+    return {"error": {"message": message, "type": "server_error"}}
+
+
+def completion(body: dict, settings: MockSettings) -> dict:
+    prompt = " ".join(m.get("content", "") for m in body["messages"])
+    prompt_tokens = len(prompt) // 4 + 1
+    content = (
+        prompt if settings.echo else "token " * settings.completion_tokens
+    )
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {
+                "role": "assistant",
+                "content": content,
+            },
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": settings.completion_tokens,
+            "total_tokens": prompt_tokens + settings.completion_tokens,
+        },
+    }
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: MockState
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, obj, status: int = 200, headers: dict | None = None):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.path.endswith("/chat/completions"):
+            return self.complete(json.loads(body))
+        if self.path.endswith("/files"):
+            return self.upload(body)
+        if self.path.endswith("/batches"):
+            return self.create_batch(json.loads(body))
+        self.send_json(error_body(f"Unknown path {self.path}"), 404)
+
+    def do_GET(self):
+        state = self.state
+        match = re.search(r"/batches/([^/]+)$", self.path)
+        if match and match.group(1) in state.batches:
+            return self.send_json(state.batch(match.group(1)))
+        match = re.search(r"/files/([^/]+)/content$", self.path)
+        if match and match.group(1) in state.files:
+            data = state.files[match.group(1)]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if self.path == "/stats":
+            with state.lock:
+                return self.send_json(state.stats)
+        self.send_json(error_body(f"Unknown path {self.path}"), 404)
+
+    def do_DELETE(self):
+        match = re.search(r"/files/([^/]+)$", self.path)
+        if match is None:
+            return self.send_json(error_body(f"Unknown path {self.path}"), 404)
+        with self.state.lock:
+            deleted = self.state.files.pop(match.group(1), None) is not None
+        self.send_json(
+            {"id": match.group(1), "object": "file", "deleted": deleted})
+
+    def complete(self, body: dict):
+        state = self.state
+        settings = state.settings
+        status = state.admit()
+        if status == 429:
+            return self.send_json(
+                error_body("Rate limit reached."), 429,
+                {"Retry-After": str(settings.retry_after)})
+        try:
+            time.sleep(settings.sample_latency())
+            if status != 200:
+                return self.send_json(error_body(), status)
+            if body.get("stream"):
+                return self.stream(body)
+            self.send_json(completion(body, settings))
+        finally:
+            with state.lock:
+                state.stats["in_flight"] -= 1
+
+    def stream(self, body: dict):
+        settings = self.state.settings
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        try:
+            for _ in range(settings.completion_tokens):
+                chunk = {
+                    "id": chunk_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": "token "},
+                        "finish_reason": None,
+                    }],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(settings.token_interval)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped the stream early.
+            pass
+        self.close_connection = True
+
+    def upload(self, body: bytes):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+            + body)
+        for part in message.iter_parts():  # type: ignore
+            if part.get_param("name", header="content-disposition") != "file":
+                continue
+            content = part.get_payload(decode=True)
+            if not isinstance(content, bytes):
+                break
+            with self.state.lock:
+                self.state.stats["files"] += 1
+                file_id = self.state.add_file(
+                    content, part.get_filename() or "input.jsonl")
+                return self.send_json(self.state.file(file_id))
+        self.send_json(error_body("No file is uploaded."), 400)
+
+    def create_batch(self, body: dict):
+        state = self.state
+        with state.lock:
+            if body.get("input_file_id") not in state.files:
+                return self.send_json(error_body("Unknown input file."), 400)
+            state.stats["batches"] += 1
+            content = state.files[body["input_file_id"]]["content"]
+            batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+            state.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"],
+                "completion_window": body.get("completion_window", "24h"),
+                "status": "validating",
+                "output_file_id": None,
+                "created_at": int(time.time()),
+                "metadata": body.get("metadata"),
+                "request_counts": {
+                    "total": len(content.strip().splitlines()),
+                    "completed": 0,
+                    "failed": 0,
+                },
+            }
+            batch = dict(state.batches[batch_id])
+        self.send_json(batch)
+
+
+def create_server(settings: MockSettings,
+                  host: str = "127.0.0.1",
+                  port: int = 8000) -> ThreadingHTTPServer:
+    handler = type(
+        "BoundMockHandler", (MockHandler,), {"state": MockState(settings)})
+    # Accept the bursts of connections of a highly concurrent client.
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def add_settings_arguments(parser: argparse.ArgumentParser):
+    for name, value in MockSettings.__dataclass_fields__.items():
+        if value.type is bool:
+            parser.add_argument(f"--{name}", action="store_true")
+            continue
+        parser.add_argument(
+            f"--{name}", type=value.type,  # type: ignore
+            default=value.default)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").split("\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+    settings = MockSettings(**{
+        name: getattr(args, name)
+        for name in MockSettings.__dataclass_fields__
+    })
+    server = create_server(settings, args.host, args.port)
+    print(f"Serving {settings} on http://{args.host}:{args.port}/v1",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import re
+import os.path as osp
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import arxiv
+import pytest
+from openai import OpenAI
+
+from arxiver.base.result import Result
+from arxiver.core.agent import Agent, ModelConfig
+from arxiver.core.arxiv_client import ARXIV_RATE_LIMITER
+from mock_openai_server import MockSettings, create_server
+
+
+@pytest.fixture
+def make_result():
+    def make(arxiv_id: str,
+             updated: datetime | None = None,
+             categories: list[str] | None = None) -> Result:
+        updated = updated or datetime(2024, 10, 15, tzinfo=timezone.utc)
+        categories = categories or ["cs.CV"]
+        return Result(
+            entry_id=f"http://arxiv.org/abs/{arxiv_id}",
+            updated=updated,
+            published=updated,
+            title=f"Paper {arxiv_id}",
+            summary="",
+            primary_category=categories[0],
+            categories=categories,
+        )
+
+    return make
+
+
+@pytest.fixture(autouse=True)
+def working_directory(tmp_path, monkeypatch):
+    # The caches and the states default to relative paths, keep them out of
+    # the repository.
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+FIXTURES = osp.join(osp.dirname(__file__), "fixtures")
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """
+    Serve the canned announcement feed at `/atom/{category}`, with an ETag
+    honored by the conditional requests.
+    """
+    feed = b""
+    etag = '"v1"'
+    requests: list[int] = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == self.etag:
+            self.requests.append(304)
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.requests.append(200)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/atom+xml")
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(self.feed)))
+        self.end_headers()
+        self.wfile.write(self.feed)
+
+
+@pytest.fixture
+def feed_server():
+    with open(osp.join(FIXTURES, "arxiv_feed.xml"), "rb") as fp:
+        feed = fp.read()
+    handler = type("BoundFeedHandler", (FeedHandler,), {
+        "feed": feed, "requests": []
+    })
+    server = serve(ThreadingHTTPServer(("127.0.0.1", 0), handler))
+    host, port = server.server_address
+    server.feed_url = f"http://{host}:{port}/atom/{{category}}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class ArxivAPIHandler(BaseHTTPRequestHandler):
+    """
+    Serve the entries of the canned API page by `start` and `max_results`,
+    like the arXiv API. The pages of the offsets in `empty_pages` are
+    served without entries, as the flaky API does, that many times.
+    """
+    head = ""
+    entries: list[str] = []
+    requests: list[int] = []
+    user_agents: list[str] = []
+    empty_pages: dict[int, int] = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        start = int(params.get("start", ["0"])[0])
+        size = int(params.get("max_results", ["10"])[0])
+        self.requests.append(start)
+        self.user_agents.append(self.headers.get("User-Agent", ""))
+        entries = self.entries[start:start + size]
+        if self.empty_pages.get(start, 0) > 0:
+            self.empty_pages[start] -= 1
+            entries = []
+        body = (self.head + "".join(entries) + "</feed>\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/atom+xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def arxiv_api_server(monkeypatch):
+    """
+    Serve the canned API page and direct the arxiv clients to it, without
+    the rate limit of arXiv.
+    """
+    with open(osp.join(FIXTURES, "arxiv_api.xml"), encoding="utf-8") as fp:
+        feed = fp.read()
+    entries = re.findall(r"\s*<entry>.*?</entry>", feed, re.S)
+    handler = type("BoundArxivAPIHandler", (ArxivAPIHandler,), {
+        "head": feed[:feed.index(entries[0])], "entries": entries,
+        "requests": [], "user_agents": [], "empty_pages": {},
+    })
+    server = serve(ThreadingHTTPServer(("127.0.0.1", 0), handler))
+    host, port = server.server_address
+    monkeypatch.setattr(arxiv.Client, "query_url_format",
+                        f"http://{host}:{port}/api/query?{{}}")
+    monkeypatch.setattr(ARXIV_RATE_LIMITER, "interval", 0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def serve(server):
+    thread = threading.Thread(
+        target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    return server
+
+
+@pytest.fixture
+def make_openai_server():
+    """
+    Returns a factory of the mock providers, fast unless the settings given
+    say otherwise.
+    """
+    servers = []
+
+    def make(**settings):
+        settings = {
+            "latency": 0.01, "latency_distribution": "constant",
+            "completion_tokens": 4, "token_interval": 0, "retry_after": 0.1,
+            **settings
+        }
+        server = create_server(MockSettings(**settings), port=0)
+        # The cancelled requests, e.g., of the hedging, break the pipes.
+        server.handle_error = lambda request, client_address: None
+        servers.append(serve(server))
+        return server
+
+    yield make
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def openai_server(make_openai_server):
+    return make_openai_server()
+
+
+@pytest.fixture
+def make_agent(openai_server, monkeypatch):
+    """
+    Returns a factory of the agents of the mock provider, without response
+    cache, the client does not retry by itself.
+    """
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+
+    def make(model: str = "mock",
+             server=None,
+             request_setting: dict | None = None,
+             model_kwargs: dict | None = None) -> Agent:
+        host, port = (server or openai_server).server_address
+        base_url = f"http://{host}:{port}/v1"
+        agent = Agent(model, stateless=True)
+        agent.config = ModelConfig(
+            base_url=base_url, endpoint="/v1/chat/completions", model=model,
+            api_key="OPENAI_API_KEY",
+            model_kwargs=model_kwargs or {"temperature": 0},
+            request_setting=request_setting or {})
+        agent.client = OpenAI(api_key="mock", base_url=base_url,
+                              max_retries=0)
+        agent.cache = None
+        return agent
+
+    return make
+
+
+def server_stats(server) -> dict:
+    return server.RequestHandlerClass.state.stats
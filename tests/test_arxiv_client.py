@@ -0,0 +1,94 @@
+import os
+from time import time
+from datetime import datetime, timedelta, timezone
+
+import arxiv
+import pytest
+
+from arxiver.core.arxiv_client import (
+    ArxivSession, PageCache, WatermarkStore, cached_response, create_client
+)
+
+
+STAMP = datetime(2024, 10, 15, 10, tzinfo=timezone.utc)
+
+
+def test_watermark_is_persisted():
+    store = WatermarkStore("marks.json")
+    assert store.get("cat:cs.CV") is None
+    store.advance("cat:cs.CV", STAMP, {"a"})
+    store = WatermarkStore("marks.json")
+    assert store.get("cat:cs.CV") == STAMP
+    assert store.seen("cat:cs.CV") == {"a"}
+
+
+def test_watermark_never_goes_back():
+    store = WatermarkStore("marks.json")
+    store.advance("cat:cs.CV", STAMP, {"a"})
+    store.advance("cat:cs.CV", STAMP - timedelta(hours=1), {"b"})
+    assert store.get("cat:cs.CV") == STAMP
+    assert store.seen("cat:cs.CV") == {"a"}
+
+
+def test_watermark_merges_ids_of_same_timestamp():
+    store = WatermarkStore("marks.json")
+    store.advance("cat:cs.CV", STAMP, {"a"})
+    store.advance("cat:cs.CV", STAMP, {"b"})
+    assert WatermarkStore("marks.json").seen("cat:cs.CV") == {"a", "b"}
+    store.advance("cat:cs.CV", STAMP + timedelta(minutes=1), {"c"})
+    assert store.seen("cat:cs.CV") == {"c"}
+
+
+def test_page_cache_round_trip():
+    cache = PageCache("pages")
+    assert cache.get("url") is None
+    cache.put("url", b"<feed/>")
+    assert cache.get("url") == b"<feed/>"
+    assert PageCache("pages").get("other") is None
+
+
+def test_page_cache_expires_pages():
+    cache = PageCache("pages", ttl=60)
+    cache.put("url", b"<feed/>")
+    stale = time() - 120
+    os.utime(cache.path("url"), (stale, stale))
+    assert cache.get("url") is None
+    assert not os.path.exists(cache.path("url"))
+
+
+def test_cached_response_is_ok():
+    response = cached_response("url", b"<feed/>")
+    assert response.ok
+    assert response.content == b"<feed/>"
+
+
+def test_only_complete_pages_are_cached(arxiv_api_server):
+    handler = arxiv_api_server.RequestHandlerClass
+    handler.empty_pages[0] = 1
+    session = ArxivSession(page_cache=PageCache("pages"))
+    url = arxiv.Client.query_url_format.format("start=0&max_results=1")
+    assert b"<entry" not in session.get(url).content
+    assert b"<entry" in session.get(url).content
+    assert b"<entry" in session.get(url).content
+    assert handler.requests == [0, 0]
+
+
+@pytest.mark.parametrize("native_decoder", [False, True])
+def test_retried_search_downloads_missing_pages(arxiv_api_server,
+                                                native_decoder):
+    handler = arxiv_api_server.RequestHandlerClass
+    handler.empty_pages[2] = 2
+    search = arxiv.Search("cat:cs.CV", max_results=3)
+
+    def results() -> list:
+        client = create_client(
+            page_size=1, num_retries=1, page_cache=PageCache("pages"),
+            native_decoder=native_decoder)
+        return list(client.results(search))
+
+    with pytest.raises(arxiv.UnexpectedEmptyPageError):
+        results()
+    assert handler.requests == [0, 1, 2, 2]
+    handler.requests.clear()
+    assert len(results()) == 3
+    assert handler.requests == [2]
@@ -0,0 +1,82 @@
+from datetime import datetime
+
+from arxiver.base.constants import ANNOUNCEMENT_TIMEZONE
+from arxiver.plugins.arxiv_feed_parser import ArxivFeedParser, announced_since
+
+
+# The papers of the canned feed are announced in the evening of October 14.
+ANNOUNCED = "lastUpdatedDate:[202410130000 TO 202410140000]"
+NEXT = "lastUpdatedDate:[202410140000 TO 202410150000]"
+
+
+def create_parser(feed_server, date_range: str = "") -> ArxivFeedParser:
+    return ArxivFeedParser(
+        "(cat:cs.CV)", datetime=date_range, feed_url=feed_server.feed_url,
+        state_file="feed_state.json", complete_from_api=False)
+
+
+def short_ids(results) -> list[str]:
+    return [r.get_short_id() for r in results]
+
+
+def test_feed_is_parsed(feed_server):
+    results = create_parser(feed_server).process([], None)
+    assert short_ids(results) == ["2410.00001v1", "2410.00002v1"]
+    first = results[0]
+    assert first.title == "Detecting Objects"
+    assert first.summary == "An abstract about detection."
+    assert [a.name for a in first.authors] == ["Jane Doe", "John Roe"]
+    assert first.categories == ["cs.CV", "cs.AI"]
+
+
+def test_unmodified_feed_is_parsed_again(feed_server):
+    first = create_parser(feed_server).process([], None)
+    # A rerun, or another pipeline sharing the state file, gets a 304 but
+    # still the papers of the latest announcement.
+    second = create_parser(feed_server).process([], None)
+    assert feed_server.RequestHandlerClass.requests == [200, 304]
+    assert short_ids(second) == short_ids(first)
+
+
+def test_state_without_feed_is_not_conditional(feed_server):
+    parser = create_parser(feed_server)
+    parser.save_state("cs.CV", {"etag": '"v1"', "last_modified": ""})
+    results = create_parser(feed_server).process([], None)
+    assert feed_server.RequestHandlerClass.requests == [200]
+    assert len(results) == 2
+
+
+def test_modified_feed_replaces_kept_feed(feed_server):
+    create_parser(feed_server).process([], None)
+    handler = feed_server.RequestHandlerClass
+    handler.etag = '"v2"'
+    handler.feed = handler.feed.replace(b"2410.00001", b"2410.00009")
+    results = create_parser(feed_server).process([], None)
+    assert handler.requests == [200, 200]
+    assert short_ids(results)[0] == "2410.00009v1"
+    assert create_parser(feed_server).state["cs.CV"]["etag"] == '"v2"'
+
+
+def test_announced_since_end_of_range():
+    assert announced_since(NEXT) == datetime(
+        2024, 10, 15, tzinfo=ANNOUNCEMENT_TIMEZONE)
+    assert announced_since("") is None
+    assert announced_since(None) is None
+
+
+def test_feed_of_the_date_range_is_kept(feed_server):
+    assert len(create_parser(feed_server, ANNOUNCED).process([], None)) == 2
+
+
+def test_unmodified_feed_of_previous_date_is_skipped(feed_server):
+    create_parser(feed_server, ANNOUNCED).process([], None)
+    # The announcement of the next date is late, the feed is not modified.
+    assert create_parser(feed_server, NEXT).process([], None) == []
+    assert feed_server.RequestHandlerClass.requests == [200, 304]
+
+
+def test_unchanged_feed_of_previous_date_is_skipped(feed_server):
+    # The feed is served again in full, still with the papers of the
+    # previous announcement.
+    assert create_parser(feed_server, NEXT).process([], None) == []
+    assert feed_server.RequestHandlerClass.requests == [200]
@@ -0,0 +1,252 @@
+import doctest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import arxiv
+import pytest
+
+from arxiver.core.arxiv_client import WatermarkStore
+from arxiver.utils.io import load_json, save_json_atomic
+from arxiver.plugins import arxiv_parser
+from arxiver.plugins.arxiv_parser import (
+    iter_search, parse_arxiv_id, plan_queries, search_by_id_list,
+    search_concurrently, search_shard, split_date_range
+)
+
+
+class FakeClient:
+    """
+    Returns the items of `responses` in turn, one list per search.
+    """
+
+    def __init__(self, responses: list):
+        self.responses = responses
+        self.searches = 0
+
+    def results(self, search):
+        response = self.responses[min(self.searches, len(self.responses) - 1)]
+        self.searches += 1
+        if isinstance(response, Exception):
+            raise response
+        yield from response
+
+
+def patch_client(monkeypatch, responses: list) -> FakeClient:
+    client = FakeClient(responses)
+    monkeypatch.setattr(
+        arxiv_parser, "create_client", lambda *args, **kwargs: client)
+    return client
+
+
+def test_iter_search_retries_empty_results(monkeypatch, make_result):
+    results = [make_result(f"2410.0000{i}v1") for i in range(3)]
+    client = patch_client(monkeypatch, [[], [], results])
+    pages = list(iter_search("cat:cs.CV", page_size=2))
+    assert [len(page) for page in pages] == [2, 1]
+    assert client.searches == 3
+
+
+def test_iter_search_gives_up_after_retries(monkeypatch):
+    client = patch_client(monkeypatch, [[]])
+    assert list(iter_search("cat:cs.CV", num_empty_retries=2)) == []
+    assert client.searches == 3
+
+
+def test_iter_search_retries_errors_before_first_page(monkeypatch,
+                                                      make_result):
+    error = arxiv.UnexpectedEmptyPageError("url", 1, b"")
+    client = patch_client(monkeypatch, [error, [make_result("2410.00001v1")]])
+    pages = list(iter_search("cat:cs.CV"))
+    assert len(pages) == 1
+    assert client.searches == 2
+
+
+def test_stream_mode_is_off_by_default():
+    path = arxiv_parser.__file__.replace("arxiver", "configs")
+    assert not load_json(path.replace(".py", ".json"))["stream_mode"]
+
+
+def patch_search(monkeypatch, pages: list) -> list[str]:
+    queries = []
+
+    def fake_iter_search(query, *args, **kwargs):
+        queries.append(query)
+        return iter(pages)
+
+    monkeypatch.setattr(arxiv_parser, "iter_search", fake_iter_search)
+    return queries
+
+
+def test_incremental_watermark_waits_for_commit(monkeypatch, make_result):
+    first = datetime(2024, 10, 15, 10, tzinfo=timezone.utc)
+    patch_search(monkeypatch, [[make_result("2410.00001v1", first)]])
+    parser = arxiv_parser.ArxivParser(
+        "cat:cs.CV", incremental_mode=True, watermark_file="marks.json")
+    assert len(parser.process([], None)) == 1
+    # The run failed before its results are saved.
+    assert WatermarkStore("marks.json").get("cat:cs.CV") is None
+    parser.commit()
+    assert WatermarkStore("marks.json").get("cat:cs.CV") == first
+
+
+def test_incremental_keeps_unseen_entries_at_watermark(monkeypatch,
+                                                       make_result):
+    stamp = datetime(2024, 10, 15, 10, tzinfo=timezone.utc)
+    store = WatermarkStore("marks.json")
+    store.advance("cat:cs.CV", stamp, {"http://arxiv.org/abs/2410.00001v1"})
+    queries = patch_search(monkeypatch, [[
+        make_result("2410.00002v1", stamp + timedelta(minutes=1)),
+        make_result("2410.00003v1", stamp),
+        make_result("2410.00001v1", stamp),
+        make_result("2410.00004v1", stamp - timedelta(minutes=1)),
+    ]])
+    parser = arxiv_parser.ArxivParser(
+        "cat:cs.CV", incremental_mode=True, watermark_file="marks.json")
+    results = parser.process([], None)
+    assert [r.get_short_id() for r in results] == [
+        "2410.00002v1", "2410.00003v1"
+    ]
+    assert "lastUpdatedDate:[202410151000 TO" in queries[0]
+    parser.commit()
+    store = WatermarkStore("marks.json")
+    assert store.get("cat:cs.CV") == stamp + timedelta(minutes=1)
+    assert store.seen("cat:cs.CV") == {"http://arxiv.org/abs/2410.00002v1"}
+
+
+def test_docstring_examples():
+    assert doctest.testmod(arxiv_parser).failed == 0
+
+
+@pytest.mark.parametrize("query, window, expected", [
+    (
+        "cat:cs.CV AND lastUpdatedDate:[202410140000 TO 202410151200]",
+        "day",
+        [
+            "cat:cs.CV AND lastUpdatedDate:[202410140000 TO 202410150000]",
+            "cat:cs.CV AND lastUpdatedDate:[202410150000 TO 202410151200]",
+        ],
+    ),
+    (
+        "cat:cs.CV AND submittedDate:[2024101400 TO 2024101402]",
+        "hour",
+        [
+            "cat:cs.CV AND submittedDate:[202410140000 TO 202410140100]",
+            "cat:cs.CV AND submittedDate:[202410140100 TO 202410140200]",
+        ],
+    ),
+    ("cat:cs.CV", "day", ["cat:cs.CV"]),
+])
+def test_split_date_range(query, window, expected):
+    assert split_date_range(query, window) == expected
+
+
+def test_split_date_range_rejects_unknown_window():
+    with pytest.raises(ValueError):
+        split_date_range("cat:cs.CV", "week")
+
+
+def test_plan_queries_of_single_category():
+    query = "cat:cs.CV AND lastUpdatedDate:[202410140000 TO 202410150000]"
+    assert plan_queries(query, split_categories=True) == [query]
+
+
+def test_search_concurrently_deduplicates_by_id_and_version(monkeypatch,
+                                                            make_result):
+    shards = {
+        "a": [make_result("2410.00001v1"), make_result("2410.00002v1")],
+        "b": [make_result("2410.00002v1"), make_result("2410.00002v2")],
+    }
+    monkeypatch.setattr(
+        arxiv_parser, "search_shard",
+        lambda query, *args, **kwargs: shards[query])
+    pages = list(search_concurrently(["a", "b"], max_workers=1))
+    assert sorted(r.get_short_id() for page in pages for r in page) == [
+        "2410.00001v1", "2410.00002v1", "2410.00002v2"
+    ]
+
+
+def test_search_shard_warns_at_the_cap(monkeypatch, make_result):
+    patch_client(monkeypatch, [[make_result(f"2410.0000{i}v1")
+                                for i in range(3)]])
+    logger = mock.Mock()
+    monkeypatch.setattr(arxiv_parser, "logger", logger)
+    assert len(search_shard("cat:cs.CV", max_results=3)) == 3
+    logger.warning.assert_called_once()
+    logger.reset_mock()
+    search_shard("cat:cs.CV", max_results=4)
+    logger.warning.assert_not_called()
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("https://arxiv.org/abs/2410.08209v1", ("2410.08209", "v1")),
+    ("https://arxiv.org/pdf/2410.08209v12.pdf", ("2410.08209", "v12")),
+    ("https://arxiv.org/abs/2410.08209", ("2410.08209", "")),
+    ("2410.08209", ("2410.08209", "")),
+    ("0704.0001v1", ("0704.0001", "v1")),
+    ("http://arxiv.org/abs/hep-th/9901001v2", ("hep-th/9901001", "v2")),
+    ("hep-th/9901001", ("hep-th/9901001", "")),
+    ("http://arxiv.org/abs/math.GT/0309136v1", ("math.GT/0309136", "v1")),
+])
+def test_parse_arxiv_id(text, expected):
+    assert parse_arxiv_id(text) == expected
+
+
+def test_parse_arxiv_id_rejects_other_links():
+    with pytest.raises(ValueError):
+        parse_arxiv_id("https://github.com/a/b")
+
+
+class IdListClient:
+    """
+    Returns the latest version of the requested ids, unless a version is
+    requested.
+    """
+
+    def __init__(self, make_result, id_lists: list):
+        self.make_result = make_result
+        self.id_lists = id_lists
+
+    def results(self, search):
+        self.id_lists.append(search.id_list)
+        for arxiv_id in search.id_list:
+            version = "" if parse_arxiv_id(arxiv_id)[1] else "v5"
+            yield self.make_result(arxiv_id + version)
+
+
+def patch_id_list_client(monkeypatch, make_result) -> list:
+    id_lists: list = []
+    monkeypatch.setattr(
+        arxiv_parser, "create_client",
+        lambda *args, **kwargs: IdListClient(make_result, id_lists))
+    return id_lists
+
+
+def test_search_by_id_list_in_chunks(monkeypatch, make_result):
+    id_lists = patch_id_list_client(monkeypatch, make_result)
+    ids = [f"2410.0000{i}" for i in range(5)]
+    results = search_by_id_list(ids, id_list_size=2, max_workers=2)
+    assert [r.get_short_id() for r in results] == [i + "v5" for i in ids]
+    assert sorted(id_lists) == [ids[:2], ids[2:4], ids[4:]]
+
+
+@pytest.mark.parametrize("link, requested, short_id", [
+    ("https://arxiv.org/abs/2410.00001v2", "2410.00001v2", "2410.00001v2"),
+    ("https://arxiv.org/abs/2410.00002", "2410.00002", "2410.00002v5"),
+    ("hep-th/9901001v3", "hep-th/9901001v3", "hep-th/9901001v3"),
+])
+def test_json_file_items_match_results(monkeypatch, make_result, link,
+                                       requested, short_id):
+    id_lists = patch_id_list_client(monkeypatch, make_result)
+    save_json_atomic("papers.json", [
+        {"link": link, "tags": ["tag"], "journal": "CVPR",
+         "category": "Vision", "download": True},
+        {"link": "2410.09999v1", "tags": [], "journal": "arXiv",
+         "category": "Other", "download": False},
+    ])
+    parser = arxiv_parser.ArxivParserFromJsonFile("papers.json")
+    results = {r.get_short_id(): r for r in parser.process([], None)}
+    assert requested in id_lists[0]
+    metainfo = results[short_id].metainfo
+    assert (metainfo.journal, metainfo.tags, metainfo.download) == (
+        "CVPR", ["tag"], True)
+    assert results["2410.09999v1"].metainfo.journal == "arXiv"
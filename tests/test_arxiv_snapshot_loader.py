@@ -0,0 +1,48 @@
+import os.path as osp
+from datetime import datetime, timezone
+
+from arxiver.plugins.arxiv_snapshot_loader import ArxivSnapshotLoader
+
+
+SNAPSHOT = osp.join(osp.dirname(__file__), "fixtures", "arxiv_snapshot.json")
+
+
+def load(**kwargs) -> list:
+    loader = ArxivSnapshotLoader(SNAPSHOT, num_workers=0, **kwargs)
+    return loader.process([], None)
+
+
+def test_snapshot_is_decoded():
+    results = load()
+    assert [r.get_short_id() for r in results] == [
+        "2410.00001v1", "2410.00002v1", "2410.00003v1", "2409.00004v1"
+    ]
+    first = results[0]
+    assert first.title == "Detecting Objects"
+    assert first.summary == "An abstract."
+    assert first.authors[0].name == "Jane Doe"
+    assert first.categories == ["cs.CV", "cs.AI"]
+
+
+def test_dates_are_timezone_aware():
+    results = load()
+    for result in results:
+        assert result.updated.tzinfo is not None
+        assert result.published.tzinfo is not None
+    # Without versions, the date is the update date of arXiv, i.e., its
+    # midnight in US/Eastern.
+    assert results[2].updated == datetime(
+        2024, 10, 16, 4, tzinfo=timezone.utc)
+    # The dates compare with the dates of the other sources.
+    assert sorted(results, key=lambda r: r.updated)[0] is results[3]
+
+
+def test_filter_by_date_and_category():
+    results = load(categories="(cat:cs.CV)", date_from="2024-10-14",
+                   date_until="2024-10-15")
+    assert [r.get_short_id() for r in results] == ["2410.00001v1"]
+    results = load(query="cat:cs.CV AND "
+                         "lastUpdatedDate:[202410150000 TO 202410160000]")
+    assert [r.get_short_id() for r in results] == [
+        "2410.00002v1", "2410.00003v1"
+    ]
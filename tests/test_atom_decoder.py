@@ -0,0 +1,40 @@
+import arxiv
+
+from arxiver.base.result import Result
+from arxiver.core.arxiv_client import USER_AGENT, create_client
+from arxiver.plugins.arxiv_parser import to_result
+
+
+def search_fixture(native_decoder: bool) -> list[Result]:
+    client = create_client(page_size=2, native_decoder=native_decoder)
+    search = arxiv.Search("cat:cs.CV", max_results=10)
+    return [to_result(r) for r in client.results(search)]
+
+
+def test_native_decoder_matches_arxiv(arxiv_api_server):
+    expected = search_fixture(native_decoder=False)
+    results = search_fixture(native_decoder=True)
+    assert len(results) == len(expected) == 3
+    for result, other in zip(results, expected):
+        for name in Result.fields:
+            assert getattr(result, name) == getattr(other, name), name
+
+
+def test_native_decoder_fields(arxiv_api_server):
+    first, second, old = search_fixture(native_decoder=True)
+    assert first.get_short_id() == "2410.00001v2"
+    assert first.title == "Detecting Objects with Transformers"
+    assert [a.name for a in first.authors] == ["Jane Doe", "John Roe"]
+    assert first.doi == "10.1000/detr.2024"
+    assert first.journal_ref == "CVPR 2024"
+    assert first.pdf_url == "http://arxiv.org/pdf/2410.00001v2"
+    assert first.updated.isoformat() == "2024-10-14T17:59:46+00:00"
+    assert second.comment is None
+    assert second.primary_category == "cs.LG"
+    assert old.get_short_id() == "hep-th/9901001v3"
+
+
+def test_native_client_identifies_itself(arxiv_api_server):
+    search_fixture(native_decoder=True)
+    user_agents = arxiv_api_server.RequestHandlerClass.user_agents
+    assert user_agents and set(user_agents) == {USER_AGENT}
@@ -0,0 +1,258 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from arxiver.core.agent import (
+    BatchMultiplexer,
+    create_batch_items,
+    parse_batch_output,
+    split_batch_items,
+)
+from arxiver.utils import misc
+from arxiver.utils.io import load_json, save_json_atomic
+from arxiver.utils.misc import wait_batch_task
+from conftest import server_stats
+
+
+POLLING = {"batch_poll_interval": 0.01, "batch_max_poll_interval": 0.05}
+
+
+@pytest.fixture(autouse=True)
+def journal_directory():
+    os.makedirs("tmp", exist_ok=True)
+
+
+@pytest.fixture
+def batch_server(make_openai_server):
+    return make_openai_server(echo=True, batch_turnaround=0)
+
+
+@pytest.fixture
+def batch_agent(make_agent, batch_server):
+    return make_agent(server=batch_server, request_setting=POLLING)
+
+
+def shard_of(agent, messages: list[str]) -> list[bytes]:
+    """
+    Returns the batch input of `messages`, as submitted by the agent.
+    """
+    items = create_batch_items(
+        messages, agent.config.endpoint, agent.config.model)
+    for item in items:
+        item["body"].update(agent.config.model_kwargs)
+    return split_batch_items(items, max_requests=100, max_bytes=2 ** 20)[0]
+
+
+def state_of(server):
+    return server.RequestHandlerClass.state
+
+
+def journals() -> list[str]:
+    if not os.path.exists("tmp"):
+        return []
+    return [name for name in os.listdir("tmp") if ".agent.batch.job" in name]
+
+
+def test_batch_is_completed_and_cleaned_up(batch_agent, batch_server):
+    messages = ["First", "Second", "Third"]
+    assert batch_agent.complete_batches(messages) == messages
+    stats = server_stats(batch_server)
+    assert (stats["files"], stats["batches"]) == (1, 1)
+    # The input and the output files are deleted, and so is the journal.
+    assert state_of(batch_server).files == {}
+    assert journals() == []
+
+
+def test_restarted_process_reattaches_to_running_batch(
+        make_agent, batch_agent, batch_server):
+    state_of(batch_server).settings.batch_turnaround = 60
+    shard = shard_of(batch_agent, ["First", "Second"])
+    sha, journal_path = batch_agent.submit_batch(shard)
+    batch_id = load_json(journal_path)["batch_id"]
+    # Another process submits the same input.
+    agent = make_agent(server=batch_server, request_setting=POLLING)
+    assert agent.submit_batch(shard) == (sha, journal_path)
+    assert load_json(journal_path)["batch_id"] == batch_id
+    state_of(batch_server).settings.batch_turnaround = 0
+    outputs = agent.collect_batch(sha, journal_path, len(shard))
+    assert [content for content, _ in outputs.values()] == [
+        "First", "Second"
+    ]
+    stats = server_stats(batch_server)
+    assert (stats["files"], stats["batches"]) == (1, 1)
+
+
+def test_completed_batch_is_collected_after_restart(
+        make_agent, batch_agent, batch_server):
+    messages = ["First", "Second"]
+    sha, journal_path = batch_agent.submit_batch(
+        shard_of(batch_agent, messages))
+    state = state_of(batch_server)
+    state.batch(load_json(journal_path)["batch_id"])
+    # The process died before collecting the output.
+    agent = make_agent(server=batch_server, request_setting=POLLING)
+    assert agent.complete_batches(messages) == messages
+    assert server_stats(batch_server)["batches"] == 1
+
+
+def test_uploaded_file_without_batch_is_batched(batch_agent, batch_server):
+    shard = shard_of(batch_agent, ["First"])
+    task_file = batch_agent.client.files.create(
+        file=("input.jsonl", b"".join(shard)), purpose="batch")
+    journal_path = "tmp/.agent.batch.job.test.json"
+    save_json_atomic(journal_path, {"input_file_id": task_file.id})
+    job = batch_agent.reattach_batch(journal_path)
+    assert job is not None and job.input_file_id == task_file.id
+    assert load_json(journal_path)["batch_id"] == job.id
+    assert server_stats(batch_server)["files"] == 1
+
+
+@pytest.mark.parametrize("status", ["failed", "expired", "cancelled"])
+def test_exited_batch_is_submitted_again(batch_agent, batch_server, status):
+    state_of(batch_server).settings.batch_turnaround = 60
+    shard = shard_of(batch_agent, ["First"])
+    _, journal_path = batch_agent.submit_batch(shard)
+    batch_id = load_json(journal_path)["batch_id"]
+    state_of(batch_server).batches[batch_id]["status"] = status
+    batch_agent.submit_batch(shard)
+    assert load_json(journal_path)["batch_id"] != batch_id
+    assert server_stats(batch_server)["batches"] == 2
+
+
+def test_unknown_batch_of_journal_is_dropped(batch_agent):
+    journal_path = "tmp/.agent.batch.job.test.json"
+    save_json_atomic(
+        journal_path, {"input_file_id": "file-x", "batch_id": "batch-x"})
+    assert batch_agent.reattach_batch(journal_path) is None
+    assert not os.path.exists(journal_path)
+
+
+def test_split_by_requests():
+    items = [{"custom_id": str(i)} for i in range(5)]
+    shards = split_batch_items(items, max_requests=2, max_bytes=2 ** 20)
+    assert [len(shard) for shard in shards] == [2, 2, 1]
+    assert [json.loads(line) for shard in shards for line in shard] == items
+
+
+def test_split_by_bytes():
+    items = [{"custom_id": str(i), "body": "x" * 100} for i in range(5)]
+    size = len(json.dumps(items[0])) + 1
+    shards = split_batch_items(items, max_requests=100, max_bytes=size * 2)
+    assert [len(shard) for shard in shards] == [2, 2, 1]
+    assert all(sum(map(len, shard)) <= size * 2 for shard in shards)
+
+
+def test_oversized_item_gets_its_own_shard():
+    items = [{"custom_id": "0"}, {"custom_id": "1", "body": "x" * 1000},
+             {"custom_id": "2"}]
+    shards = split_batch_items(items, max_requests=100, max_bytes=100)
+    assert [len(shard) for shard in shards] == [1, 1, 1]
+    assert json.loads(shards[1][0]) == items[1]
+
+
+def output_line(custom_id: str, response: dict | None) -> str:
+    return json.dumps(
+        {"custom_id": custom_id, "response": response, "error": None})
+
+
+def test_parse_batch_output_skips_failed_requests():
+    body = {
+        "choices": [{"message": {"content": "Answer"}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 1},
+    }
+    lines = [
+        output_line("0", {"status_code": 200, "body": body}),
+        "",
+        output_line("1", {"status_code": 500, "body": {"error": "busy"}}),
+        output_line("2", None),
+        output_line("3", {"status_code": 200, "body": None}),
+        output_line("4", {"status_code": 200, "body": {"choices": []}}),
+    ]
+    assert dict(parse_batch_output(iter(lines))) == {
+        "0": ("Answer", body["usage"])
+    }
+
+
+def test_sharded_batches_resume(make_agent, batch_server):
+    agent = make_agent(server=batch_server,
+                       request_setting={**POLLING, "batch_max_requests": 2})
+    messages = [f"Message {i}" for i in range(5)]
+    # The first shard was submitted before the process died.
+    state_of(batch_server).settings.batch_turnaround = 60
+    agent.submit_batch(shard_of(agent, messages[:2]))
+    assert len(journals()) == 1
+    state_of(batch_server).settings.batch_turnaround = 0
+    assert agent.complete_batches(messages) == messages
+    stats = server_stats(batch_server)
+    assert (stats["files"], stats["batches"]) == (3, 3)
+    assert journals() == []
+
+
+def test_multiplexed_groups_share_one_batch(
+        batch_agent, batch_server, monkeypatch):
+    state = state_of(batch_server)
+    bodies: list[dict] = []
+    complete_batch = state.complete_batch
+
+    def record_bodies(batch: dict):
+        content = state.files[batch["input_file_id"]]["content"]
+        bodies.extend(
+            json.loads(line)["body"] for line in content.splitlines())
+        complete_batch(batch)
+
+    monkeypatch.setattr(state, "complete_batch", record_bodies)
+    with BatchMultiplexer(batch_agent) as multiplexer:
+        titles = multiplexer.submit(["Title A", "Shared"], max_tokens=16)
+        summaries = multiplexer.submit(["Shared", "Summary B", "Summary C"],
+                                       temperature=0.5)
+        assert not titles.done()
+    assert titles.result() == ["Title A", "Shared"]
+    assert summaries.result() == ["Shared", "Summary B", "Summary C"]
+    assert server_stats(batch_server)["batches"] == 1
+    # The message shared by the groups is requested with the kwargs of each.
+    kwargs = [
+        {k: v for k, v in body.items() if k not in ("model", "messages")}
+        for body in bodies
+    ]
+    assert kwargs == [{"temperature": 0, "max_tokens": 16}] * 2 + [
+        {"temperature": 0.5}] * 3
+
+
+def test_multiplexer_without_groups_does_not_submit(
+        batch_agent, batch_server):
+    with BatchMultiplexer(batch_agent):
+        pass
+    assert server_stats(batch_server)["batches"] == 0
+
+
+class FakeBatches:
+    """
+    Returns the given states of a batch, one per retrieval.
+    """
+
+    def __init__(self, states: list[tuple[str, int]]):
+        self.states = states
+
+    def retrieve(self, batch_id: str):
+        status, completed = self.states.pop(0)
+        return SimpleNamespace(
+            id=batch_id, status=status,
+            request_counts=SimpleNamespace(
+                completed=completed, failed=0, total=10))
+
+
+def test_wait_batch_task_backs_off_without_progress(monkeypatch):
+    delays: list[float] = []
+    monkeypatch.setattr(misc, "sleep", delays.append)
+    states = [("in_progress", 0)] * 4 + [("in_progress", 5)] + [
+        ("in_progress", 5)] * 2 + [("completed", 10)]
+    client = SimpleNamespace(batches=FakeBatches(states))
+    batch = SimpleNamespace(id="batch", status="validating")
+    job = wait_batch_task(client, batch, interval=1, max_interval=3,
+                          backoff=2, jitter=0)  # type: ignore
+    assert job.status == "completed"
+    # The interval doubles up to the maximum while the batch is stuck, and
+    # is reset once it makes progress.
+    assert delays == [1, 1, 2, 3, 3, 1, 2, 3]
@@ -0,0 +1,42 @@
+import asyncio
+
+from arxiver.core.clients import ASYNC_CLIENTS, EVENT_LOOP
+from arxiver.core.telemetry import CURRENT_PLUGIN, plugin_scope
+
+
+def test_async_client_is_shared_across_calls(make_agent, openai_server):
+    agent = make_agent()
+    clients = []
+
+    async def request_completion_async(message, *args, **kwargs):
+        clients.append(agent.async_client)
+        return message
+
+    agent.request_completion_async = request_completion_async
+    agent.complete_concurrent(["A", "B"])
+    agent.complete_concurrent(["C"])
+    assert len(clients) == 3 and len(set(map(id, clients))) == 1
+    base_url = agent.config.base_url
+    assert [key for key in ASYNC_CLIENTS.clients if key[0] == base_url]
+
+
+def test_async_client_of_another_loop_lives_for_the_session(make_agent):
+    agent = make_agent()
+
+    async def run():
+        async with agent.async_session():
+            client = agent.async_client
+        return client
+
+    client = asyncio.run(run())
+    assert client is not None and client.is_closed()
+    assert client not in ASYNC_CLIENTS.clients.values()
+
+
+def test_event_loop_keeps_the_context():
+    async def plugin():
+        return CURRENT_PLUGIN.get()
+
+    with plugin_scope("translator"):
+        assert EVENT_LOOP.run(plugin()) == "translator"
+    assert EVENT_LOOP.run(plugin()) == ""
@@ -0,0 +1,151 @@
+import asyncio
+
+import pytest
+
+from arxiver.core.agent import CompletionProgress, SlidingWindowLimiter
+from arxiver.core.concurrency import AdaptiveConcurrency, ConcurrencyStore
+
+
+def test_limit_grows_when_reached_and_healthy():
+    async def run():
+        concurrency = AdaptiveConcurrency(limit=2)
+        for _ in range(4):
+            await concurrency.acquire()
+            await concurrency.acquire()
+            await concurrency.release(1.0, success=True)
+            await concurrency.release(1.0, success=True)
+        return concurrency
+
+    concurrency = asyncio.run(run())
+    assert 2 < concurrency.limit < 4
+    assert concurrency.updated
+
+
+def test_limit_holds_below_the_limit():
+    async def run():
+        concurrency = AdaptiveConcurrency(limit=4)
+        for _ in range(8):
+            await concurrency.acquire()
+            await concurrency.release(1.0, success=True)
+        return concurrency
+
+    assert asyncio.run(run()).limit == 4
+
+
+def test_limit_holds_when_latency_degrades():
+    async def run():
+        concurrency = AdaptiveConcurrency(limit=1, latency_tolerance=2)
+        concurrency.min_latency = concurrency.latency = 1.0
+        for _ in range(4):
+            await concurrency.acquire()
+            await concurrency.release(30.0, success=True)
+        return concurrency
+
+    assert asyncio.run(run()).limit == 1
+
+
+def test_overload_cuts_the_limit_once_per_latency():
+    async def run():
+        concurrency = AdaptiveConcurrency(limit=8)
+        concurrency.latency = 10
+        for _ in range(3):
+            await concurrency.acquire()
+        for _ in range(3):
+            await concurrency.release(1.0, success=False, overloaded=True)
+        return concurrency
+
+    concurrency = asyncio.run(run())
+    assert concurrency.limit == 4
+    assert concurrency.updated
+
+
+def test_limit_is_fixed_unless_adaptive():
+    async def run():
+        concurrency = AdaptiveConcurrency(limit=2, adaptive=False)
+        for _ in range(4):
+            await concurrency.acquire()
+            await concurrency.acquire()
+            await concurrency.release(1.0, success=True)
+            await concurrency.release(1.0, success=False, overloaded=True)
+        return concurrency
+
+    concurrency = asyncio.run(run())
+    assert concurrency.limit == 2
+    assert not concurrency.updated
+
+
+def test_retry_after_holds_new_requests():
+    async def run():
+        concurrency = AdaptiveConcurrency(limit=4)
+        await concurrency.acquire()
+        await concurrency.release(
+            0.01, success=False, overloaded=True, retry_after=0.2)
+        assert not concurrency.available()
+        start = asyncio.get_running_loop().time()
+        await concurrency.acquire()
+        return asyncio.get_running_loop().time() - start
+
+    assert asyncio.run(run()) >= 0.15
+
+
+def test_available_within_the_limit():
+    async def run():
+        concurrency = AdaptiveConcurrency(limit=1)
+        assert concurrency.available()
+        await concurrency.acquire()
+        assert not concurrency.available()
+        await concurrency.release(0.01, success=True)
+        assert concurrency.available()
+
+    asyncio.run(run())
+
+
+def test_store_round_trip():
+    store = ConcurrencyStore("limits/concurrency.json")
+    assert store.get("model") is None
+    store.put("model", 5.4321)
+    assert ConcurrencyStore("limits/concurrency.json").get("model") == 5.43
+
+
+
+@pytest.mark.parametrize("request_setting, limit", [
+    # 2 requests per second for the expected 10 seconds.
+    ({"requests_per_minute": 120}, 20),
+    ({"requests_per_minute": 120, "expected_latency": 2}, 4),
+    ({"requests_per_minute": 6000}, 64),
+    ({"requests_per_minute": 120, "initial_concurrency": 3}, 3),
+])
+def test_initial_limit_keeps_up_with_the_rate(
+        make_agent, request_setting, limit):
+    agent = make_agent(request_setting=request_setting)
+    assert agent.create_concurrency().limit == limit
+
+
+def test_learned_limit_is_reused(make_agent):
+    ConcurrencyStore().put("mock", 7)
+    agent = make_agent(request_setting={"requests_per_minute": 120})
+    assert agent.create_concurrency().limit == 7
+    agent.concurrency_path = None
+    assert agent.create_concurrency().limit == 20
+
+
+def test_slot_is_free_while_waiting_for_the_rate_limit(make_agent):
+    agent = make_agent()
+
+    async def run():
+        async with agent.async_session():
+            assert agent.concurrency is not None
+            agent.limiter = SlidingWindowLimiter(1, window=0.3)
+            await agent.limiter.acquire()
+            task = asyncio.ensure_future(agent.limited_completion_async(
+                "Hi", CompletionProgress(agent.model, 1)))
+            await asyncio.sleep(0.1)
+            waiting = agent.concurrency.in_flight
+            content = await task
+            return waiting, content, agent.concurrency.min_latency
+
+    waiting, content, latency = asyncio.run(run())
+    assert waiting == 0
+    assert content
+    # The latency of the request excludes the wait for the rate limit.
+    assert latency < 0.2
@@ -0,0 +1,64 @@
+import asyncio
+
+from arxiver.core.agent import Agent, CompletionProgress, Hedger
+from arxiver.core.concurrency import AdaptiveConcurrency
+from conftest import server_stats
+
+
+def hedged_completion(agent: Agent, hedge_agent: Agent, saturated=False):
+    """
+    Returns the response of a request hedged to `hedge_agent` after 50ms,
+    the hedger, and the tasks left once it returns.
+    """
+    async def run():
+        async with agent.async_session(), hedge_agent.async_session():
+            agent.hedger = Hedger(50, budget=1, min_samples=1)
+            agent.hedger.observe(0.05)
+            agent.hedge_agent = hedge_agent
+            if saturated:
+                hedge_agent.concurrency = AdaptiveConcurrency(
+                    1, adaptive=False)
+                await hedge_agent.concurrency.acquire()
+            content = await agent.hedged_completion_async(
+                "Hi", CompletionProgress(agent.model, 1))
+            tasks = asyncio.all_tasks() - {asyncio.current_task()}
+            return content, agent.hedger, hedge_agent.concurrency, tasks
+
+    return asyncio.run(run())
+
+
+def test_hedge_wins_over_slow_request(make_agent, make_openai_server):
+    slow = make_openai_server(latency=1)
+    fast = make_openai_server()
+    content, hedger, concurrency, tasks = hedged_completion(
+        make_agent("slow", server=slow), make_agent("fast", server=fast))
+    assert content
+    assert (hedger.hedges, hedger.wins) == (1, 1)
+    # The hedge released its slot, and the slow request was cancelled and
+    # awaited.
+    assert concurrency.in_flight == 0
+    assert not tasks
+    assert server_stats(fast)["completions"] == 1
+
+
+def test_loser_hedge_is_cancelled(make_agent, make_openai_server):
+    primary = make_openai_server(latency=0.2)
+    hedge = make_openai_server(latency=2)
+    content, hedger, concurrency, tasks = hedged_completion(
+        make_agent("primary", server=primary),
+        make_agent("hedge", server=hedge))
+    assert content
+    assert (hedger.hedges, hedger.wins) == (1, 0)
+    assert concurrency.in_flight == 0
+    assert not tasks
+
+
+def test_no_hedge_without_a_free_slot(make_agent, make_openai_server):
+    slow = make_openai_server(latency=0.2)
+    fast = make_openai_server()
+    content, hedger, _, _ = hedged_completion(
+        make_agent("slow", server=slow), make_agent("fast", server=fast),
+        saturated=True)
+    assert content
+    assert hedger.hedges == 0
+    assert server_stats(fast)["completions"] == 0
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from arxiver.core.agent import History, Message
+
+
+def test_oldest_messages_are_dropped():
+    history = History(max_messages=3)
+    for i in range(5):
+        history.append("user", str(i))
+    assert len(history) == 3
+    assert [m["content"] for m in history.tolist()] == ["2", "3", "4"]
+
+
+def test_unlimited_history():
+    history = History(max_messages=0)
+    for i in range(100):
+        history.append("user", str(i))
+    assert len(history) == 100
+
+
+def test_initial_messages_are_bounded():
+    history = History([Message("user", str(i)) for i in range(5)], 2)
+    assert [m["content"] for m in history.tolist()] == ["3", "4"]
+
+
+def test_exchanges_are_not_interleaved():
+    history = History(max_messages=0)
+
+    def exchange(i: int):
+        for _ in range(100):
+            history.extend([Message("user", f"question {i}"),
+                            Message("assistant", f"answer {i}")])
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(exchange, range(8)))
+    messages = history.tolist()
+    assert len(messages) == 1600
+    for question, answer in zip(messages[::2], messages[1::2]):
+        assert question["role"] == "user"
+        assert answer["content"] == question["content"].replace(
+            "question", "answer")
+
+
+def test_agent_records_its_exchanges(make_agent):
+    agent = make_agent()
+    agent.stateless = False
+    answer = agent.complete_single("Hi")
+    agent.complete_concurrent(["A", "B"])
+    messages = agent.history.tolist()
+    assert messages[:2] == [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": answer},
+    ]
+    assert len(messages) == 6
+    assert [m["role"] for m in messages] == ["user", "assistant"] * 3
+
+
+def test_stateless_agent_never_records(make_agent):
+    agent = make_agent()
+    assert agent.stateless
+    agent.complete_single("Hi")
+    agent.complete_single("Hi", stream=True)
+    agent.complete_concurrent(["A", "B"])
+    assert len(agent.history) == 0
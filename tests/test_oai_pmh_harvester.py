@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from arxiver.plugins.oai_pmh_harvester import OAIPMHHarvester
+from mock_oai_pmh_server import MockOAISettings, create_server
+
+
+@pytest.fixture
+def oai_server():
+    server = create_server(MockOAISettings(), port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def create_harvester(server, **kwargs) -> OAIPMHHarvester:
+    host, port = server.server_address
+    return OAIPMHHarvester(
+        base_url=f"http://{host}:{port}/oai", date_from="2024-10-14",
+        date_until="2024-10-15", checkpoint_file="checkpoint.json",
+        interval=0, **kwargs)
+
+
+def short_ids(results) -> list[str]:
+    return [r.get_short_id() for r in results]
+
+
+def test_harvest_all_pages(oai_server):
+    harvester = create_harvester(oai_server)
+    results = harvester.process([], None)
+    # The deleted record is skipped.
+    assert short_ids(results) == ["2410.00001", "2410.00002", "2410.00003",
+                                  "2410.00005"]
+    assert results[0].categories == ["cs.CV"]
+    assert results[0].authors[0].name == "Jane Doe"
+    assert results[0].summary == (
+        "The abstract of Detecting Objects. It spans two lines.")
+    harvester.commit()
+    assert harvester.load_checkpoint() == ""
+
+
+def test_harvest_filters_categories(oai_server):
+    harvester = create_harvester(oai_server, categories="(cat:cs.AI)")
+    results = harvester.process([], None)
+    assert short_ids(results) == ["2410.00003", "2410.00005"]
+
+
+def test_checkpoint_waits_for_commit(oai_server):
+    harvester = create_harvester(oai_server, max_pages=1)
+    assert short_ids(harvester.process([], None)) == [
+        "2410.00001", "2410.00002"
+    ]
+    # The run failed before the records are saved, the next run harvests
+    # them again.
+    harvester = create_harvester(oai_server, max_pages=1)
+    assert harvester.load_checkpoint() == ""
+    harvester.process([], None)
+    harvester.commit()
+    assert harvester.load_checkpoint() == "page2"
+
+
+def test_harvest_resumes_from_checkpoint(oai_server):
+    harvester = create_harvester(oai_server, max_pages=2)
+    pages = list(harvester.stream([], None))
+    assert [short_ids(page) for page in pages] == [
+        ["2410.00001", "2410.00002"], ["2410.00003"]
+    ]
+    harvester.commit()
+    harvester = create_harvester(oai_server)
+    assert short_ids(harvester.process([], None)) == ["2410.00005"]
+    harvester.commit()
+    assert harvester.load_checkpoint() == ""
+    assert oai_server.RequestHandlerClass.stats == {
+        "page1": 1, "page2": 1, "page3": 1
+    }
+
+
+def test_checkpoint_of_another_harvest_is_ignored(oai_server):
+    harvester = create_harvester(oai_server, max_pages=1)
+    harvester.process([], None)
+    harvester.commit()
+    harvester = create_harvester(oai_server, set_spec="math")
+    assert harvester.load_checkpoint() == ""
+
+
+def test_busy_server_is_retried(oai_server):
+    oai_server.RequestHandlerClass.settings.busy_rate = 0.5
+    harvester = create_harvester(oai_server, max_retries=20)
+    assert len(harvester.process([], None)) == 4
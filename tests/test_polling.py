@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from arxiver.base.constants import ANNOUNCEMENT_TIMEZONE
+from arxiver.core.polling import FeedProbe
+
+
+def midnight(year: int, month: int, day: int) -> datetime:
+    return datetime(year, month, day, tzinfo=ANNOUNCEMENT_TIMEZONE)
+
+
+def test_feed_probe_waits_for_next_announcement(feed_server):
+    # The papers of the feed are dated at the midnight of October 15, i.e.,
+    # announced in the evening of October 14.
+    probe = FeedProbe("(cat:cs.CV)", midnight(2024, 10, 15),
+                      feed_url=feed_server.feed_url)
+    assert not probe()
+    probe = FeedProbe("(cat:cs.CV)", midnight(2024, 10, 14),
+                      feed_url=feed_server.feed_url)
+    assert probe()
+
+
+def test_feed_probe_sends_conditional_requests(feed_server):
+    probe = FeedProbe("(cat:cs.CV)", midnight(2024, 10, 15),
+                      feed_url=feed_server.feed_url)
+    assert not probe()
+    assert not probe()
+    assert feed_server.RequestHandlerClass.requests == [200, 304]
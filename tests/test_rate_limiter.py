@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from arxiver.core import agent as agent_module
+from arxiver.core.agent import SlidingWindowLimiter, estimate_tokens
+
+
+class FakeClock:
+    """
+    A monotonic clock advanced by the sleeps of the limiter only.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(agent_module, "monotonic", clock)
+    monkeypatch.setattr(agent_module.asyncio, "sleep", clock.sleep)
+    return clock
+
+
+def test_requests_per_minute_window(clock):
+    limiter = SlidingWindowLimiter(requests_per_minute=2)
+
+    async def run():
+        await limiter.acquire()
+        clock.now += 30
+        await limiter.acquire()
+        assert not limiter.available()
+        # The first request leaves the window 60 seconds after it is sent.
+        await limiter.acquire()
+        return clock.now
+
+    assert asyncio.run(run()) == 1060
+    assert len(limiter.events) == 2
+
+
+def test_tokens_per_minute_window(clock):
+    limiter = SlidingWindowLimiter(tokens_per_minute=100)
+
+    async def run():
+        await limiter.acquire(60)
+        assert limiter.available(40)
+        assert not limiter.available(41)
+        await limiter.acquire(50)
+        return clock.now
+
+    assert asyncio.run(run()) == 1060
+
+
+def test_settled_usage_frees_the_window(clock):
+    limiter = SlidingWindowLimiter(tokens_per_minute=100)
+
+    async def run():
+        event = await limiter.acquire(90)
+        assert not limiter.available(50)
+        # The response used fewer tokens than reserved.
+        limiter.settle(event, 30)
+        assert limiter.available(50)
+        await limiter.acquire(50)
+        return clock.now
+
+    assert asyncio.run(run()) == 1000
+
+
+def test_unlimited_window(clock):
+    limiter = SlidingWindowLimiter()
+
+    async def run():
+        for _ in range(100):
+            await limiter.acquire(10 ** 6)
+
+    asyncio.run(run())
+    assert clock.sleeps == []
+
+
+def test_reservation_is_settled_with_usage(make_agent):
+    agent = make_agent(request_setting={"tokens_per_minute": 10 ** 6},
+                       model_kwargs={"temperature": 0, "max_tokens": 100})
+    messages = ["A short message.", "A longer message " * 20]
+    agent.complete_concurrent(messages)
+    assert agent.limiter is not None
+    # The mock reports the prompt tokens as estimated, and 4 completion
+    # tokens instead of the reserved `max_tokens`.
+    assert sorted(event[1] for event in agent.limiter.events) == sorted(
+        estimate_tokens(message) + 4 for message in messages)
+
+
+def test_concurrent_responses_keep_the_order(make_agent):
+    agent = make_agent()
+
+    async def request_completion_async(message, *args, **kwargs):
+        # The later messages are answered first.
+        await asyncio.sleep(0.01 * (10 - int(message)))
+        return f"answer {message}"
+
+    agent.request_completion_async = request_completion_async
+    messages = [str(i) for i in range(10)]
+    assert agent.complete_concurrent(messages) == [
+        f"answer {message}" for message in messages
+    ]
@@ -0,0 +1,95 @@
+import json
+from unittest import mock
+
+from arxiver.core import response_cache
+from arxiver.core.response_cache import ResponseCache, cache_key
+from conftest import server_stats
+
+
+def test_put_and_get():
+    cache = ResponseCache("cache.sqlite3")
+    assert cache.get("key") is None
+    cache.put("key", "content")
+    assert cache.get("key") == "content"
+    assert (cache.hits, cache.misses, cache.writes) == (1, 1, 1)
+
+
+def test_failed_responses_are_not_cached():
+    cache = ResponseCache("cache.sqlite3")
+    cache.put("key", "")
+    assert cache.get("key") is None
+    assert cache.writes == 0
+
+
+def test_expired_responses_are_missing():
+    cache = ResponseCache("cache.sqlite3", max_age_days=1)
+    with mock.patch.object(response_cache, "time", return_value=0):
+        cache.put("key", "content")
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_are_evicted():
+    cache = ResponseCache(
+        "cache.sqlite3", max_entries=2, max_age_days=0, evict_every=1)
+    with mock.patch.object(response_cache, "time", side_effect=range(10)):
+        cache.put("a", "1")
+        cache.put("b", "2")
+        cache.get("a")
+        cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_read_only_cache_is_never_written():
+    ResponseCache("cache.sqlite3").put("a", "1")
+    cache = ResponseCache("cache.sqlite3", read_only=True)
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+
+
+def test_cache_key_ignores_argument_order():
+    messages = [{"role": "user", "content": "Hi"}]
+    assert cache_key("m", "/v1", {"a": 1, "b": 2}, messages) == cache_key(
+        "m", "/v1", {"b": 2, "a": 1}, messages)
+    assert cache_key("m", "/v1", {"a": 1}, messages) != cache_key(
+        "m", "/v1", {"a": 2}, messages)
+
+
+def test_cache_is_disabled_by_default(tmp_path, monkeypatch):
+    path = tmp_path / "arxiver" / "core" / "response_cache.py"
+    monkeypatch.setattr(response_cache, "__file__", str(path))
+    assert ResponseCache.from_config() is None
+    configs = tmp_path / "configs" / "core"
+    configs.mkdir(parents=True)
+    with open(configs / "response_cache.json", "w") as fp:
+        json.dump({"enabled": True, "path": "cache.sqlite3"}, fp)
+    assert ResponseCache.from_config() is not None
+
+
+def test_shipped_config_is_disabled():
+    path = response_cache.__file__.replace("arxiver", "configs")
+    with open(path.replace(".py", ".json")) as fp:
+        assert not json.load(fp)["enabled"]
+
+
+def test_deterministic_requests_are_cached(make_agent, openai_server):
+    agent = make_agent(model_kwargs={"temperature": 0})
+    agent.cache = ResponseCache("cache.sqlite3")
+    first = agent.complete_single("Hi")
+    assert first and agent.complete_single("Hi") == first
+    assert server_stats(openai_server)["completions"] == 1
+
+
+def test_sampled_requests_are_not_cached(make_agent, openai_server):
+    agent = make_agent(model_kwargs={"temperature": 0.6})
+    agent.cache = ResponseCache("cache.sqlite3")
+    agent.complete_single("Hi")
+    agent.complete_single("Hi")
+    assert server_stats(openai_server)["completions"] == 2
+    assert agent.cache.writes == 0
+    agent.cache = ResponseCache("cache.sqlite3", cache_sampled=True)
+    agent.complete_single("Hi")
+    agent.complete_single("Hi")
+    assert server_stats(openai_server)["completions"] == 3
@@ -0,0 +1,110 @@
+import asyncio
+from time import monotonic
+
+import pytest
+from openai import RateLimitError
+
+from arxiver.core.agent import RoutedAgent
+from arxiver.core.concurrency import ConcurrencyStore
+from conftest import server_stats
+
+
+def make_routed(make_agent, servers: dict, **request_setting) -> RoutedAgent:
+    """
+    A pool of the mock providers, the first one is tried first.
+    """
+    routed = RoutedAgent("pool", {key: 1 for key in servers}, stateless=True)
+    routed.providers = {
+        key: make_agent(key, server=server, request_setting=request_setting)
+        for key, server in servers.items()
+    }
+    routed.config = next(iter(routed.providers.values())).config
+    routed.cache = None
+    return routed
+
+
+def test_fail_over_to_healthy_provider(make_agent, make_openai_server):
+    limited = make_openai_server(rate_limit_rate=1)
+    healthy = make_openai_server()
+    routed = make_routed(make_agent, {"limited": limited, "healthy": healthy})
+    assert routed.complete_single("Hi")
+    assert routed.stats["limited"].cooldown_until > monotonic()
+    # The failed provider is skipped while it cools down.
+    assert routed.complete_single("Hello")
+    assert server_stats(limited)["completions"] == 1
+    assert server_stats(healthy)["completions"] == 2
+
+
+def test_last_error_is_raised_when_all_fail(make_agent, make_openai_server):
+    routed = make_routed(make_agent, {
+        "a": make_openai_server(rate_limit_rate=1),
+        "b": make_openai_server(rate_limit_rate=1),
+    })
+    with pytest.raises(RateLimitError):
+        routed.request_completion([{"role": "user", "content": "Hi"}])
+
+
+def test_other_errors_do_not_fail_over(make_agent, make_openai_server):
+    healthy = make_openai_server()
+    routed = make_routed(make_agent, {
+        "a": make_openai_server(), "b": healthy,
+    })
+    with pytest.raises(TypeError):
+        routed.request_completion(
+            [{"role": "user", "content": "Hi"}], unknown_argument=1)
+    assert server_stats(healthy)["completions"] == 0
+
+
+def test_concurrent_overloads_cut_the_provider_concurrency(
+        make_agent, make_openai_server):
+    limited = make_openai_server(rate_limit_rate=1)
+    healthy = make_openai_server()
+    routed = make_routed(make_agent, {"limited": limited, "healthy": healthy})
+    messages = [f"Message {i}" for i in range(8)]
+    assert all(routed.complete_concurrent(messages))
+    store = ConcurrencyStore()
+    assert store.get("limited") < 4
+    assert (store.get("healthy") or 4) >= 4
+    # The pool itself was never overloaded.
+    assert (store.get("pool") or 4) >= 4
+
+
+def test_concurrent_overloads_of_all_providers_reach_the_pool(
+        make_agent, make_openai_server):
+    routed = make_routed(make_agent, {
+        "a": make_openai_server(rate_limit_rate=1),
+        "b": make_openai_server(rate_limit_rate=1),
+    })
+    assert routed.complete_concurrent(["Hi", "Hello"]) == ["", ""]
+    assert ConcurrencyStore().get("pool") < 4
+
+
+def test_requests_per_minute_is_kept_with_adaptive_concurrency(make_agent):
+    agent = make_agent(request_setting={
+        "adaptive_concurrency": True, "requests_per_minute": 2
+    })
+
+    async def run():
+        async with agent.async_session():
+            assert agent.limiter is not None
+            return agent.limiter.requests_per_minute
+
+    assert asyncio.run(run()) == 2
+
+
+def test_rank_prefers_providers_within_their_limits(make_agent,
+                                                    make_openai_server):
+    routed = make_routed(make_agent, {
+        "a": make_openai_server(), "b": make_openai_server(),
+    }, requests_per_minute=1)
+
+    async def run():
+        async with routed.async_session():
+            first = routed.rank()
+            limiter = routed.providers[first[0]].limiter
+            assert limiter is not None
+            await limiter.acquire()
+            return first, routed.rank()
+
+    first, second = asyncio.run(run())
+    assert second == first[::-1]
@@ -0,0 +1,47 @@
+import pytest
+
+from arxiver.base.plugin import BasePlugin
+from arxiver.core import run
+
+
+class Source(BasePlugin):
+    events: list[str] = []
+
+    def process(self, results, global_plugin_data):
+        return ["paper"]
+
+    def commit(self):
+        self.events.append("commit")
+
+
+class Saver(BasePlugin):
+    fail = False
+
+    def process(self, results, global_plugin_data):
+        if self.fail:
+            raise RuntimeError("disk full")
+        Source.events.append("save")
+        return results
+
+
+def patch_plugins(monkeypatch):
+    Source.events = []
+    monkeypatch.setattr(
+        run, "get_plugin_cls", {"Source": Source, "Saver": Saver}.get)
+    monkeypatch.setattr(
+        run, "prepare_plugins_args_from_configs", lambda *args: {})
+
+
+def test_plugins_are_committed_after_saving(monkeypatch):
+    patch_plugins(monkeypatch)
+    results = run.forward_plugins_once(None, ["Source", "Saver"])
+    assert results == ["paper"]
+    assert Source.events == ["save", "commit"]
+
+
+def test_failed_run_is_not_committed(monkeypatch):
+    patch_plugins(monkeypatch)
+    monkeypatch.setattr(Saver, "fail", True)
+    with pytest.raises(RuntimeError):
+        run.forward_plugins_once(None, ["Source", "Saver"])
+    assert Source.events == []
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from arxiver.core.agent import SingleFlight
+from conftest import server_stats
+
+
+def test_followers_share_the_call_of_the_leader():
+    flight = SingleFlight()
+    future, leader = flight.join("key")
+    shared, follower = flight.join("key")
+    assert leader and not follower
+    assert shared is future
+    flight.finish("key", "content")
+    assert shared.result() == "content"
+    assert flight.coalesced == 1
+
+
+def test_finished_call_is_not_shared():
+    flight = SingleFlight()
+    flight.join("key")
+    flight.finish("key", "content")
+    _, leader = flight.join("key")
+    assert leader
+
+
+def test_failed_call_is_shared_as_empty():
+    flight = SingleFlight()
+    flight.join("key")
+    future, _ = flight.join("key")
+    flight.finish("key", "")
+    assert future.result() == ""
+
+
+def test_threads_coalesce_identical_requests(make_agent, make_openai_server):
+    server = make_openai_server(latency=0.3)
+    agent = make_agent(server=server)
+    with ThreadPoolExecutor(4) as executor:
+        responses = list(executor.map(agent.complete_single, ["Hi"] * 4))
+    assert len(set(responses)) == 1 and responses[0]
+    assert server_stats(server)["completions"] == 1
+
+
+def test_concurrent_requests_coalesce(make_agent, make_openai_server):
+    server = make_openai_server(latency=0.2)
+    agent = make_agent(server=server)
+    responses = agent.complete_concurrent(["Hi", "Hello", "Hi", "Hi"])
+    assert responses[0] == responses[2] == responses[3]
+    assert all(responses)
+    assert server_stats(server)["completions"] == 2
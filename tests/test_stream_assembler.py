@@ -0,0 +1,90 @@
+import pytest
+from openai.types.chat import ChatCompletionChunk
+from openai.types.chat.chat_completion_chunk import Choice, ChoiceDelta
+
+from arxiver.core import agent as agent_module
+from arxiver.core.agent import StreamAssembler
+
+
+class FakeClock:
+    """
+    A monotonic clock advanced by the test only.
+    """
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(agent_module, "monotonic", clock)
+    return clock
+
+
+def chunk(content: str | None = None,
+          reasoning: str | None = None) -> ChatCompletionChunk:
+    # The reasoning models stream `reasoning_content` beside the content.
+    delta = ChoiceDelta(content=content, reasoning_content=reasoning)
+    return ChatCompletionChunk(
+        id="chunk", object="chat.completion.chunk", created=0, model="mock",
+        choices=[Choice(index=0, delta=delta)])
+
+
+def empty_chunk() -> ChatCompletionChunk:
+    return ChatCompletionChunk(
+        id="chunk", object="chat.completion.chunk", created=0, model="mock",
+        choices=[])
+
+
+def test_stop_marker_split_across_deltas(clock):
+    assembler = StreamAssembler(stop_markers=["</answer>"])
+    assert not assembler.feed(chunk("<answer>Yes"))
+    assert not assembler.feed(chunk("</ans"))
+    assert assembler.feed(chunk("wer> trailing"))
+    assert assembler.metrics.stopped_early
+    assert assembler.content == "<answer>Yes</answer> trailing"
+
+
+def test_stream_without_marker_is_not_stopped(clock):
+    assembler = StreamAssembler(stop_markers=["</answer>"])
+    for text in ["</an", "swe", "r"]:
+        assert not assembler.feed(chunk(text))
+    assert not assembler.metrics.stopped_early
+    assert StreamAssembler().feed(chunk("</answer>")) is False
+
+
+def test_time_to_first_token_and_tokens_per_second(clock):
+    assembler = StreamAssembler()
+    clock.now += 0.5
+    # The role and the usage chunks carry no token.
+    assembler.feed(chunk(""))
+    assembler.feed(empty_chunk())
+    assert assembler.metrics.num_tokens == 0
+    clock.now += 0.5
+    assembler.feed(chunk("Hello"))
+    for _ in range(4):
+        clock.now += 0.25
+        assembler.feed(chunk(" world"))
+    metrics = assembler.metrics
+    assert metrics.time_to_first_token == pytest.approx(1)
+    assert metrics.duration == pytest.approx(2)
+    assert metrics.num_tokens == 5
+    assert metrics.tokens_per_second == pytest.approx(5)
+    assert "5 tokens in 2.00s" in str(metrics)
+
+
+def test_reasoning_deltas_are_counted_but_not_assembled(clock):
+    assembler = StreamAssembler(stop_markers=["STOP"])
+    clock.now += 0.2
+    assert not assembler.feed(chunk(reasoning="Let me think, STOP"))
+    clock.now += 0.3
+    assembler.feed(chunk("Answer"))
+    assert assembler.content == "Answer"
+    assert assembler.metrics.num_tokens == 2
+    # The first reasoning delta is the first token.
+    assert assembler.metrics.time_to_first_token == pytest.approx(0.2)
+    assert not assembler.metrics.stopped_early
@@ -0,0 +1,88 @@
+import json
+import os
+
+import pytest
+
+from arxiver.core.agent import estimate_tokens
+from arxiver.core.telemetry import (
+    TELEMETRY,
+    CallRecord,
+    Telemetry,
+    plugin_scope,
+)
+
+
+@pytest.fixture
+def records(monkeypatch) -> list[CallRecord]:
+    """
+    Returns the records of the global telemetry added by the test.
+    """
+    monkeypatch.setattr(TELEMETRY, "records", [])
+    return TELEMETRY.records
+
+
+def test_calls_are_attributed_to_the_running_plugin(make_agent, records):
+    agent = make_agent()
+    with plugin_scope("translator"):
+        agent.complete_single("Hi")
+        # The context is copied into the event loop of the requests.
+        agent.complete_concurrent(["A", "B"])
+    agent.complete_single("Hello")
+    assert [(r.plugin, r.mode) for r in records] == [
+        ("translator", "single"),
+        ("translator", "concurrent"),
+        ("translator", "concurrent"),
+        ("", "single"),
+    ]
+    assert all(r.outcome == "success" for r in records)
+
+
+def test_streamed_usage_is_estimated(make_agent, records):
+    agent = make_agent()
+    agent.complete_single("Hello there", stream=True)
+    agent.complete_single("Hello again")
+    streamed, reported = records
+    assert streamed.estimated
+    # The mock streams one token per chunk.
+    assert streamed.prompt_tokens == estimate_tokens("Hello there")
+    assert streamed.completion_tokens == 4
+    assert not reported.estimated
+    # The usage reported by the mock.
+    assert reported.prompt_tokens == len("Hello again") // 4 + 1
+
+
+@pytest.mark.parametrize("request_setting, cost", [
+    ({}, 0),
+    ({"prompt_price": 2, "completion_price": 8}, 280e-6),
+    ({"prompt_price": 2, "completion_price": 8,
+      "cached_prompt_price": 0.5}, 220e-6),
+])
+def test_cost_with_prices(make_agent, request_setting, cost):
+    agent = make_agent(request_setting=request_setting)
+    record = CallRecord(model=agent.model)
+    agent.record_usage(record, 100, 10, cached_tokens=40)
+    assert record.cost == pytest.approx(cost)
+    assert (record.prompt_tokens, record.cached_tokens) == (100, 40)
+    assert record.provider == agent.model
+
+
+def test_records_are_appended_to_jsonl():
+    telemetry = Telemetry()
+    telemetry.add(CallRecord(model="a", plugin="translator", cost=0.5))
+    telemetry.add(CallRecord(model="b", outcome="cached"))
+    path = "telemetry/agent_telemetry.jsonl"
+    telemetry.save(path)
+    telemetry.save(path)
+    with open(path, encoding="utf-8") as fp:
+        lines = [json.loads(line) for line in fp]
+    assert len(lines) == 4
+    assert {line["run_id"] for line in lines} == {telemetry.run_id}
+    assert lines[0]["model"] == "a" and lines[0]["plugin"] == "translator"
+    assert lines[0]["cost"] == 0.5
+    assert lines[1]["outcome"] == "cached"
+    assert set(lines[0]) == {"run_id", *CallRecord.__dataclass_fields__}
+
+
+def test_empty_telemetry_is_not_reported():
+    Telemetry().report("output")
+    assert not os.path.exists("output")
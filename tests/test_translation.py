@@ -0,0 +1,67 @@
+import os.path as osp
+from types import SimpleNamespace
+
+import pytest
+
+from arxiver.base.plugin import GlobalPluginData
+from arxiver.core import run
+from arxiver.plugins.translation import (
+    Translator,
+    plugin_name,
+    translation_instruction,
+)
+from arxiver.utils.io import load_json
+
+
+INSTRUCTION = "Translate the text into French."
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+
+
+def test_instruction_leads_the_prompts():
+    translator = Translator("mock", prompt=INSTRUCTION)
+    prompts = [translator.build_prompt(t) for t in ["First", "Second"]]
+    assert all(p.startswith(INSTRUCTION) for p in prompts)
+    assert prompts[0].endswith("First")
+    # The prompts share the instruction as a prefix for the prompt cache.
+    assert osp.commonprefix(prompts).startswith(INSTRUCTION)
+
+
+def test_text_leads_the_prompt_without_prefix():
+    translator = Translator("mock", prompt=INSTRUCTION, prefix_prompt=False)
+    prompt = translator.build_prompt("First")
+    assert prompt.endswith(INSTRUCTION)
+    assert prompt.index("First") < prompt.index(INSTRUCTION)
+
+
+def test_default_instruction():
+    assert Translator("mock").prompt == translation_instruction()
+
+
+def test_configured_prompt_is_used():
+    config = load_json(run.get_class_config_file_path(Translator))
+    args = run.prepare_plugins_args_from_configs(
+        SimpleNamespace(), ["Translator"], Translator)
+    translator = Translator(**{**args, "model": "mock"})
+    assert translator.prompt == config["prompt"]
+    assert translator.prefix_prompt == config["prefix_prompt"]
+    assert translator.build_prompt("Text").startswith(config["prompt"])
+
+
+def test_sent_prompts_lead_with_the_instruction(
+        make_agent, make_openai_server, make_result):
+    translator = Translator(
+        "mock", batch_mode=False, concurrent_mode=True, prompt=INSTRUCTION,
+        translate_all_results=True)
+    # The mock answers with the prompt it is sent.
+    translator.agent = make_agent(server=make_openai_server(echo=True))
+    result = make_result("2410.00001")
+    result.summary = "We detect objects."
+    translator.process([result], GlobalPluginData())
+    data = result.local_plugin_data[plugin_name()]
+    assert data.translated_title == translator.build_prompt(result.title)
+    assert data.translated_summary == translator.build_prompt(result.summary)
+    assert data.translated_summary.startswith(INSTRUCTION)